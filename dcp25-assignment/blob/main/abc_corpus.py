@@ -0,0 +1,201 @@
+"""Generate large synthetic ABC corpora from the real tunes.
+
+The bundled ``abc_books`` hold only a few thousand tunes, too few to
+see how the loader and queries scale. :func:`generate_corpus` writes a
+tree of numbered book folders with any number of tunes, each one a
+real tune with a few mutations: a new reference number, often a
+varied title, sometimes another key and a handful of changed notes.
+Meters, rhythms, header fields and file layout stay realistic, so the
+parser and the database see the same kind of input as from the real
+books::
+
+    python abc_corpus.py --tunes 100000 --out /tmp/corpus_100k
+
+The output depends only on the seed and the source tunes, so two runs
+with the same arguments produce identical files.
+"""
+
+from __future__ import annotations
+
+from typing import Dict, List, Sequence
+import argparse
+import os
+import random
+import re
+import sys
+
+from abc_parser import iter_abc_files, parse_abc_file
+
+
+# Corpus sizes known by name, e.g. to benchmarks.py --size
+CORPUS_SIZES = {"10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+
+_HEADER_LINE = re.compile(r"^[A-Za-z]:")
+_NOTE = re.compile(r"(?<![A-Za-z!\"])[A-Ga-g](?![A-Za-z:])")
+_NOTE_NEIGHBOURS = {
+    letter: (letters[i - 1], letters[(i + 1) % 7])
+    for letters in ("CDEFGAB", "cdefgab")
+    for i, letter in enumerate(letters)
+}
+_TITLE_VARIANTS = ("No. {n}", "({n})", "Setting {n}", "Version {n}")
+
+
+def load_source_tunes(root_dir: str | None = None) -> List[Dict]:
+    """Parse the real tunes the synthetic ones are derived from.
+
+    Parameters
+    ----------
+    root_dir : str or None, optional
+        Book folder tree to read. If ``None``, :data:`config.ABC_ROOT`
+        is used.
+
+    Returns
+    -------
+    list of dict
+        Tunes as returned by :func:`abc_parser.parse_abc_file`, in a
+        fixed order; tunes without a title or music are left out.
+    """
+    tunes = []
+    for book_number, file_name, file_path in sorted(iter_abc_files(root_dir), key=lambda f: f[2]):
+        for tune in parse_abc_file(file_path, book_number, file_name):
+            if tune.get("title") and tune.get("raw_abc", "").count("\n") >= 3:
+                tunes.append(tune)
+    if not tunes:
+        raise ValueError(f"no ABC tunes found under {root_dir!r}")
+    return tunes
+
+
+def mutate_tune(tune: Dict, reference: int, rng: random.Random, titles: Sequence[str], keys: Sequence[str]) -> str:
+    """Return the ABC text of a new tune derived from ``tune``.
+
+    Parameters
+    ----------
+    tune : dict
+        Source tune with a ``raw_abc`` entry.
+    reference : int
+        Reference number for the ``X:`` line.
+    rng : random.Random
+        Source of randomness; the result depends only on its state.
+    titles : sequence of str
+        Titles of all source tunes, to borrow words from.
+    keys : sequence of str
+        Key signatures seen in the source tunes.
+
+    Returns
+    -------
+    str
+        The tune, one ABC line per line, without a trailing newline.
+    """
+    title = tune["title"]
+    roll = rng.random()
+    if roll < 0.5:
+        title = f"{title} {rng.choice(_TITLE_VARIANTS).format(n=rng.randint(2, 99))}"
+    elif roll < 0.8:
+        other = rng.choice(titles).split()
+        title = " ".join(title.split()[:1] + other[1:]) or title
+    new_key = rng.choice(keys) if rng.random() < 0.2 else None
+    note_changes = rng.randint(0, 6)
+
+    lines = []
+    title_done = False
+    for line in tune["raw_abc"].split("\n"):
+        if line.startswith("X:"):
+            line = f"X:{reference}"
+        elif line.startswith("T:") and not title_done:
+            line = f"T:{title}"
+            title_done = True
+        elif line.startswith("K:") and new_key is not None:
+            line = f"K:{new_key}"
+        elif note_changes and not _HEADER_LINE.match(line) and not line.startswith("%"):
+            notes = list(_NOTE.finditer(line))
+            if notes:
+                note = rng.choice(notes)
+                replacement = rng.choice(_NOTE_NEIGHBOURS[note.group()])
+                line = line[:note.start()] + replacement + line[note.end():]
+                note_changes -= 1
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def generate_corpus(
+    out_dir: str,
+    tunes: int,
+    seed: int = 0,
+    source_root: str | None = None,
+    tunes_per_file: int = 100,
+    files_per_book: int = 50,
+) -> Dict:
+    """Write a synthetic corpus of numbered book folders.
+
+    Parameters
+    ----------
+    out_dir : str
+        Folder to write into; books ``1``, ``2``, ... are created in
+        it and existing files with the same names are overwritten.
+    tunes : int
+        Number of tunes to generate.
+    seed : int, optional
+        Seed for the mutations; the same seed gives the same corpus.
+    source_root : str or None, optional
+        Real book folder tree to derive the tunes from. If ``None``,
+        :data:`config.ABC_ROOT` is used.
+    tunes_per_file : int, optional
+        Tunes written to each ``.abc`` file.
+    files_per_book : int, optional
+        Files written to each book folder.
+
+    Returns
+    -------
+    dict
+        ``tunes``, ``files``, ``books`` and ``bytes`` written.
+    """
+    sources = load_source_tunes(source_root)
+    titles = [tune["title"] for tune in sources]
+    keys = sorted({tune["key_signature"] for tune in sources if tune.get("key_signature")})
+    rng = random.Random(seed)
+
+    written = {"tunes": 0, "files": 0, "books": 0, "bytes": 0}
+    file_index = 0
+    while written["tunes"] < tunes:
+        book, number = divmod(file_index, files_per_book)
+        book_dir = os.path.join(out_dir, str(book + 1))
+        if number == 0:
+            os.makedirs(book_dir, exist_ok=True)
+            written["books"] += 1
+        count = min(tunes_per_file, tunes - written["tunes"])
+        # Real files start with a free-text header before the first tune
+        parts = [f"Synthetic tunes {written['tunes'] + 1}-{written['tunes'] + count}, seed {seed}.\n"]
+        for reference in range(1, count + 1):
+            parts.append(mutate_tune(rng.choice(sources), reference, rng, titles, keys) + "\n")
+        data = "\n".join(parts).encode("utf-8")
+        with open(os.path.join(book_dir, f"synth{number}.abc"), "wb") as f:
+            f.write(data)
+        written["tunes"] += count
+        written["files"] += 1
+        written["bytes"] += len(data)
+        file_index += 1
+    return written
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    """Generate a corpus from the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tunes", required=True, help=f"number of tunes, or one of {', '.join(CORPUS_SIZES)}")
+    parser.add_argument("--out", required=True, help="folder to write the book folders into")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--source", help="real book folder tree to derive tunes from")
+    parser.add_argument("--tunes-per-file", type=int, default=100)
+    parser.add_argument("--files-per-book", type=int, default=50)
+    args = parser.parse_args(argv)
+
+    tunes = CORPUS_SIZES.get(args.tunes.lower()) or int(args.tunes)
+    summary = generate_corpus(
+        args.out, tunes, args.seed, args.source, args.tunes_per_file, args.files_per_book
+    )
+    print(f"{summary['tunes']} tunes in {summary['files']} files and {summary['books']} books "
+          f"({summary['bytes'] / 1e6:.1f} MB) written to {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
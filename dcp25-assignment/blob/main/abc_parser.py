@@ -6,10 +6,214 @@ Python data structures suitable for loading into a database.
 
 from __future__ import annotations
 
-from typing import Dict, List, Tuple
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Iterator, List, Sequence, Tuple
+import hashlib
 import os
+import re
+import tarfile
+import time
+import zipfile
 
-from config import ABC_ROOT
+from config import ABC_BOOK_LEVEL, ABC_BOOK_PATTERN, ABC_ROOT, ABC_SCAN_WORKERS
+
+
+# Mode names accepted by ABC (only the first three letters are
+# significant, case-insensitively) mapped to their canonical suffix.
+_MODE_SUFFIXES = {
+    "": "",
+    "maj": "",
+    "ion": "",
+    "m": "m",
+    "min": "m",
+    "aeo": "m",
+    "mix": "mix",
+    "dor": "dor",
+    "phr": "phr",
+    "lyd": "lyd",
+    "loc": "loc",
+}
+
+_KEY_PATTERN = re.compile(r"^\s*([A-Ga-g])([#b]?)\s*([A-Za-z]*)")
+
+
+# Maps the directory components between the root and a file (e.g.
+# ("12", "vol2")) to the file's book number, or None to skip the file
+BookNumberFunc = Callable[[Sequence[str]], "int | None"]
+
+_BOOK_PATTERN = re.compile(ABC_BOOK_PATTERN)
+
+
+def book_number_from_dirs(parts: Sequence[str]) -> int | None:
+    """Return the book number encoded in a file's directory components.
+
+    The directory at depth :data:`config.ABC_BOOK_LEVEL` below the root
+    must fully match :data:`config.ABC_BOOK_PATTERN`; its first group
+    (or the whole name if there is none) is the book number. With the
+    defaults this is the numbered folder directly under the root, as in
+    ``abc_books/<book>/<volume>/...``.
+
+    Parameters
+    ----------
+    parts : sequence of str
+        Directory names from the root down to the file's folder.
+
+    Returns
+    -------
+    int or None
+        The book number, or ``None`` if the path holds no book.
+    """
+    if len(parts) <= ABC_BOOK_LEVEL:
+        return None
+    return _book_from_name(parts[ABC_BOOK_LEVEL])
+
+
+def _book_from_name(name: str) -> int | None:
+    """Return the book number if ``name`` matches the book pattern."""
+    match = _BOOK_PATTERN.fullmatch(name)
+    if match is None:
+        return None
+    return int(match.group(1) if match.groups() else match.group(0))
+
+
+def _list_abc_dir(
+    path: str,
+    parts: Tuple[str, ...],
+    book_number: BookNumberFunc,
+) -> Tuple[List[Tuple[int, os.DirEntry]], List[Tuple[str, Tuple[str, ...]]]]:
+    """List one directory: its ABC files and the subdirectories to visit.
+
+    Only ``DirEntry`` type information is used, which the operating
+    system returns with the listing, so no file is stat'ed.
+    """
+    files: List[Tuple[int, os.DirEntry]] = []
+    subdirs: List[Tuple[str, Tuple[str, ...]]] = []
+    book = book_number(parts)
+    depth = len(parts)
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                # Book folders may be symlinks, as os.path.isdir allowed;
+                # below them symlinked folders are not followed, so links
+                # cannot make the walk loop
+                if entry.is_dir(follow_symlinks=depth <= ABC_BOOK_LEVEL):
+                    child = parts + (entry.name,)
+                    if (
+                        book_number is book_number_from_dirs
+                        and depth == ABC_BOOK_LEVEL
+                        and book_number_from_dirs(child) is None
+                    ):
+                        # Not a book folder, so nothing below it can be
+                        continue
+                    subdirs.append((entry.path, child))
+                elif book is not None and entry.name.lower().endswith(".abc") and entry.is_file():
+                    files.append((book, entry))
+    except (FileNotFoundError, NotADirectoryError, PermissionError):
+        if not parts:
+            raise
+    return files, subdirs
+
+
+def iter_abc_entries(
+    root_dir: str | None = None,
+    book_number: BookNumberFunc | None = None,
+    workers: int | None = None,
+) -> Iterator[Tuple[int, os.DirEntry]]:
+    """Walk the ABC tree lazily, yielding each file's directory entry.
+
+    Parameters
+    ----------
+    root_dir : str or None, optional
+        Root of the tree. If ``None``, :data:`config.ABC_ROOT` is used.
+    book_number : callable or None, optional
+        Function mapping a folder's directory components (relative to
+        the root) to the book number of the files in it, or ``None`` to
+        skip them. Defaults to :func:`book_number_from_dirs`, which
+        also skips non-book folders without listing them.
+    workers : int or None, optional
+        Number of threads listing directories at once. More than one
+        helps on high-latency (network) filesystems. Defaults to
+        :data:`config.ABC_SCAN_WORKERS`.
+
+    Yields
+    ------
+    tuple of (int, os.DirEntry)
+        The book number and directory entry of each ``.abc`` file, as
+        soon as the folder holding it has been listed. The entry's
+        :meth:`~os.DirEntry.stat` result is cached.
+    """
+    if root_dir is None:
+        root_dir = ABC_ROOT
+    if book_number is None:
+        book_number = book_number_from_dirs
+    if workers is None:
+        workers = ABC_SCAN_WORKERS
+
+    if workers <= 1:
+        pending = deque([(root_dir, ())])
+        while pending:
+            files, subdirs = _list_abc_dir(*pending.popleft(), book_number)
+            yield from files
+            pending.extend(subdirs)
+        return
+
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="abc-scan")
+    futures = {executor.submit(_list_abc_dir, root_dir, (), book_number)}
+    try:
+        while futures:
+            done, futures = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                files, subdirs = future.result()
+                for path, parts in subdirs:
+                    futures.add(executor.submit(_list_abc_dir, path, parts, book_number))
+                yield from files
+    finally:
+        # Also reached when the caller stops iterating early
+        for future in futures:
+            future.cancel()
+        executor.shutdown(wait=False)
+
+
+def iter_abc_files(
+    root_dir: str | None = None,
+    book_number: BookNumberFunc | None = None,
+    workers: int | None = None,
+) -> Iterator[Tuple[int, str, str]]:
+    """Lazily yield ``(book_number, file_name, full_path)`` per ABC file.
+
+    Takes the same arguments as :func:`iter_abc_entries`; parsing can
+    start on the first files while the rest of the tree is still being
+    listed.
+    """
+    for book, entry in iter_abc_entries(root_dir, book_number, workers):
+        yield book, entry.name, entry.path
+
+
+def book_number_for_path(path: str, root_dir: str | None = None, book_number: BookNumberFunc | None = None) -> int | None:
+    """Return the book number :func:`iter_abc_files` reports for ``path``.
+
+    Parameters
+    ----------
+    path : str
+        Path of an ABC file under ``root_dir``.
+    root_dir : str or None, optional
+        Root of the tree. If ``None``, :data:`config.ABC_ROOT` is used.
+    book_number : callable or None, optional
+        As for :func:`iter_abc_entries`.
+
+    Returns
+    -------
+    int or None
+        The book number, or ``None`` if the file is outside any book.
+    """
+    if root_dir is None:
+        root_dir = ABC_ROOT
+    relative = os.path.relpath(os.path.dirname(path), root_dir)
+    if relative.startswith(os.pardir):
+        return None
+    parts = () if relative == os.curdir else tuple(relative.split(os.sep))
+    return (book_number or book_number_from_dirs)(parts)
 
 
 def find_abc_files(root_dir: str | None = None) -> List[Tuple[int, str, str]]:
@@ -19,27 +223,65 @@ def find_abc_files(root_dir: str | None = None) -> List[Tuple[int, str, str]]:
     ----------
     root_dir : str or None, optional
         Root directory that contains numbered subdirectories with
-        ``.abc`` files. If ``None``, :data:`config.ABC_ROOT` is used.
+        ``.abc`` files, possibly nested in further folders such as
+        volumes. If ``None``, :data:`config.ABC_ROOT` is used.
 
     Returns
     -------
     list of tuple of (int, str, str)
         A list of ``(book_number, file_name, full_path)`` triples for
-        every ``.abc`` file found.
+        every ``.abc`` file found. See :func:`iter_abc_files` for a
+        lazy version.
     """
-    if root_dir is None:
-        root_dir = ABC_ROOT
+    return list(iter_abc_files(root_dir))
+
 
-    abc_files: List[Tuple[int, str, str]] = []
-    for item in os.listdir(root_dir):
-        item_path = os.path.join(root_dir, item)
-        if os.path.isdir(item_path) and item.isdigit():
-            book_number = int(item)
-            for filename in os.listdir(item_path):
-                if filename.lower().endswith(".abc"):
-                    full_path = os.path.join(item_path, filename)
-                    abc_files.append((book_number, filename, full_path))
-    return abc_files
+def canonical_key(key_signature: str | None) -> str:
+    """Reduce an ABC ``K:`` field to a canonical key name.
+
+    Spelling variants of the same key collapse to one name: the mode
+    is abbreviated to its canonical suffix and explicit accidentals
+    or clef settings after it are dropped, so ``"G major"``,
+    ``"Gmaj"`` and ``" G"`` all become ``"G"``, ``"E minor"`` becomes
+    ``"Em"`` and ``"Ador ^d"`` becomes ``"Ador"``.
+
+    Parameters
+    ----------
+    key_signature : str or None
+        Raw key signature as stored in the ``tunes`` table.
+
+    Returns
+    -------
+    str
+        The canonical key, ``"HP"`` for Highland bagpipe keys, or an
+        empty string if no key can be recognised.
+    """
+    if not key_signature:
+        return ""
+    text = key_signature.strip()
+    if text[:2].upper() == "HP":
+        return "HP"
+    match = _KEY_PATTERN.match(text)
+    if match is None:
+        return ""
+    tonic, accidental, mode = match.groups()
+    suffix = _MODE_SUFFIXES.get(mode[:3].lower() if len(mode) > 1 else mode.lower())
+    if suffix is None:
+        # Not a mode, e.g. a clef or accidental following the tonic
+        suffix = ""
+    return f"{tonic.upper()}{accidental}{suffix}"
+
+
+def decode_abc_bytes(data: bytes) -> str:
+    """Decode the contents of an ABC file.
+
+    Files are read as UTF-8, falling back to Latin-1 for older files
+    that are not valid UTF-8.
+    """
+    try:
+        return data.decode("utf-8")
+    except UnicodeDecodeError:
+        return data.decode("latin-1")
 
 
 def parse_abc_file(file_path: str, book_number: int, file_name: str) -> List[Dict]:
@@ -59,19 +301,37 @@ def parse_abc_file(file_path: str, book_number: int, file_name: str) -> List[Dic
     list of dict
         A list of dictionaries, one per tune, each containing at
         least ``reference_number``, ``book_number``, ``file_name``,
-        ``title``, ``meter``, ``key_signature`` and ``raw_abc`` keys
-        where the information is available in the file.
+        ``title``, ``meter``, ``key_signature``, ``rhythm`` and
+        ``raw_abc`` keys where the information is available in the
+        file.
+    """
+    with open(file_path, "rb") as f:
+        return parse_abc_text(decode_abc_bytes(f.read()), book_number, file_name)
+
+
+def parse_abc_text(text: str, book_number: int, file_name: str) -> List[Dict]:
+    """Parse the text of an ABC file into tune dictionaries.
+
+    Parameters
+    ----------
+    text : str
+        Contents of the file, e.g. from :func:`decode_abc_bytes`.
+    book_number : int
+        Numeric identifier for the book the file belongs to.
+    file_name : str
+        Base file name recorded with each tune.
+
+    Returns
+    -------
+    list of dict
+        As for :func:`parse_abc_file`.
     """
     tunes: List[Dict] = []
     current_tune: Dict = {}
     tune_lines: List[str] = []
 
-    try:
-        with open(file_path, "r", encoding="utf-8") as f:
-            lines = [line.strip() for line in f.readlines()]
-    except UnicodeDecodeError:
-        with open(file_path, "r", encoding="latin-1") as f:
-            lines = [line.strip() for line in f.readlines()]
+    # Same line splitting as reading the file in text mode
+    lines = [line.strip() for line in text.replace("\r\n", "\n").replace("\r", "\n").split("\n")]
 
     for line in lines:
         if not line:
@@ -93,6 +353,9 @@ def parse_abc_file(file_path: str, book_number: int, file_name: str) -> List[Dic
             current_tune["meter"] = line[2:].strip()
         elif line.startswith("K:"):
             current_tune["key_signature"] = line[2:].strip()
+        elif line.startswith("R:") and current_tune and "rhythm" not in current_tune:
+            # Only inside a tune, so a stray R: line does not start one
+            current_tune["rhythm"] = line[2:].strip()
 
         tune_lines.append(line)
 
@@ -101,3 +364,127 @@ def parse_abc_file(file_path: str, book_number: int, file_name: str) -> List[Dic
         tunes.append(current_tune)
 
     return tunes
+
+
+# Archive formats that can be ingested without extracting them
+ARCHIVE_SUFFIXES = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.xz", ".txz", ".tar.bz2", ".tbz2")
+
+# Separates an archive path from a member name in source paths, as in
+# "books.zip!1/hnr0.abc"
+ARCHIVE_MEMBER_SEPARATOR = "!"
+
+
+def is_abc_archive(path: str) -> bool:
+    """Return ``True`` if ``path`` names a supported archive file."""
+    return path.lower().endswith(ARCHIVE_SUFFIXES) and os.path.isfile(path)
+
+
+def find_abc_archives(root_dir: str | None = None) -> List[str]:
+    """Return the archives to ingest for ``root_dir``.
+
+    Parameters
+    ----------
+    root_dir : str or None, optional
+        Either an archive itself or a folder whose top level may hold
+        archives next to the book folders. If ``None``,
+        :data:`config.ABC_ROOT` is used.
+
+    Returns
+    -------
+    list of str
+        Archive paths, sorted by name.
+    """
+    if root_dir is None:
+        root_dir = ABC_ROOT
+    if is_abc_archive(root_dir):
+        return [root_dir]
+    if not os.path.isdir(root_dir):
+        return []
+    with os.scandir(root_dir) as entries:
+        return sorted(
+            entry.path for entry in entries
+            if entry.name.lower().endswith(ARCHIVE_SUFFIXES) and entry.is_file()
+        )
+
+
+def _archive_book_number(member_name: str, archive_path: str) -> int | None:
+    """Return the book number for an archive member.
+
+    The first folder in the member path that matches
+    :data:`config.ABC_BOOK_PATTERN` gives the book, so both
+    ``1/hnr0.abc`` and ``abc_books/1/vol2/hnr0.abc`` work. Members
+    stored without a book folder take the book from the archive name,
+    e.g. ``12.tar.gz``.
+    """
+    for part in member_name.split("/")[:-1]:
+        book = _book_from_name(part)
+        if book is not None:
+            return book
+    stem = os.path.basename(archive_path)
+    for suffix in ARCHIVE_SUFFIXES:
+        if stem.lower().endswith(suffix):
+            stem = stem[:-len(suffix)]
+            break
+    return _book_from_name(stem)
+
+
+def iter_archive_members(archive_path: str) -> Iterator[Dict]:
+    """Stream the ABC files stored in a zip or tar archive.
+
+    Members are read one at a time straight from the archive (tar
+    files in streaming mode), so nothing is extracted to disk.
+
+    Parameters
+    ----------
+    archive_path : str
+        Path of a ``.zip`` or (compressed) ``.tar`` archive.
+
+    Yields
+    ------
+    dict
+        ``book_number``, ``file_name`` (base name), ``member`` (path
+        inside the archive), ``source_path`` (archive path and member
+        joined by :data:`ARCHIVE_MEMBER_SEPARATOR`), ``data`` (raw
+        bytes), ``sha256``, ``size`` and ``mtime_ns`` of every
+        ``.abc`` member that belongs to a book.
+    """
+    def member(name: str, data: bytes, mtime: float) -> Dict | None:
+        book_number = _archive_book_number(name, archive_path)
+        if book_number is None:
+            return None
+        return {
+            "book_number": book_number,
+            "file_name": name.rsplit("/", 1)[-1],
+            "member": name,
+            "source_path": f"{archive_path}{ARCHIVE_MEMBER_SEPARATOR}{name}",
+            "data": data,
+            "sha256": hashlib.sha256(data).hexdigest(),
+            "size": len(data),
+            "mtime_ns": int(mtime * 1_000_000_000),
+        }
+
+    if archive_path.lower().endswith(".zip"):
+        with zipfile.ZipFile(archive_path) as archive:
+            for info in archive.infolist():
+                if info.is_dir() or not info.filename.lower().endswith(".abc"):
+                    continue
+                try:
+                    mtime = time.mktime(info.date_time + (0, 0, -1))
+                except (OverflowError, ValueError):
+                    mtime = 0.0
+                found = member(info.filename, archive.read(info), mtime)
+                if found is not None:
+                    yield found
+        return
+
+    # "r|*" reads the (possibly compressed) tar sequentially, without seeking
+    with tarfile.open(archive_path, mode="r|*") as archive:
+        for info in archive:
+            if not info.isfile() or not info.name.lower().endswith(".abc"):
+                continue
+            stream = archive.extractfile(info)
+            if stream is None:
+                continue
+            found = member(info.name, stream.read(), info.mtime)
+            if found is not None:
+                yield found
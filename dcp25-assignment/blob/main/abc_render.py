@@ -0,0 +1,539 @@
+"""Tokenize ABC tunes and render them as normalized ABC or MIDI.
+
+:func:`tokenize_body` splits a line of tune body into tokens (notes,
+rests, chords, bar lines, decorations, ...). On top of it,
+
+* :func:`normalize_abc` rewrites a tune in a canonical layout: ``X:``
+  renumbered, title lines first and ``K:`` last in the header,
+  comments and blank lines dropped and runs of spaces collapsed. The
+  music itself is not changed.
+* :func:`abc_to_midi` plays the tune into a format 0 MIDI file. It
+  handles the key signature and bar accidentals, note lengths and
+  ``L:``, broken rhythms, triplets and other tuplets, ties, chords,
+  rests, ``|: ... :|`` repeats with first and second endings, and
+  ``K:``/``M:``/``L:``/``Q:`` changes mid-tune. Grace notes,
+  decorations and chord symbols are not played, and all voices are
+  played as one.
+
+Both only depend on the ``raw_abc`` text stored with each tune, so
+they can run in worker processes without a database connection.
+"""
+
+from __future__ import annotations
+
+from fractions import Fraction
+from functools import lru_cache
+from typing import Dict, Iterator, List, NamedTuple, Tuple
+import re
+import struct
+
+
+class Token(NamedTuple):
+    """One token of a tune body: its ``kind`` and source ``text``."""
+
+    kind: str
+    text: str
+
+
+_TOKEN = re.compile(
+    r"""
+    (?P<field>\[[A-Za-z]:[^\]]*\])
+    |(?P<chord_symbol>"[^"]*"?)
+    |(?P<decoration>![^!]*!|\+[^+\s]*\+|[~.HLMOPSTuv](?=[\^_=A-Ga-gzx\[{(]))
+    |(?P<grace>\{[^}]*\}?)
+    |(?P<ending>\[\d+(?:[,\-]\d+)*)
+    |(?P<bar>(?:\[\||:*\|[\]|]*:*|::+)(?:\d+(?:[,\-]\d+)*)?)
+    |(?P<chord>\[[^\]\[|]*\][\d/]*)
+    |(?P<note>[\^_=]*[A-Ga-g][,']*[\d/]*)
+    |(?P<rest>[zx][\d/]*)
+    |(?P<measure_rest>[ZX]\d*)
+    |(?P<tuplet>\(\d(?::\d*){0,2})
+    |(?P<slur>[()])
+    |(?P<tie>-)
+    |(?P<broken><+|>+)
+    |(?P<space>\s+)
+    |(?P<other>.)
+    """,
+    re.VERBOSE,
+)
+_FIELD_LINE = re.compile(r"^([A-Za-z]):(.*)$")
+_NOTE_PARTS = re.compile(r"([\^_=]*)([A-Ga-g])([,']*)([\d/]*)")
+_LENGTH = re.compile(r"(\d*)(/*)(\d*)")
+_TEMPO = re.compile(r"(\d+)/(\d+)\s*=\s*(\d+)")
+# Header fields kept before all others by normalize_abc(), in order
+_LEADING_FIELDS = ("X", "T")
+
+
+def tokenize_body(line: str) -> List[Token]:
+    """Split one line of tune body into tokens.
+
+    Parameters
+    ----------
+    line : str
+        Body line without its comment, e.g. ``"|:GABc dedB|dedB dedB:|"``.
+
+    Returns
+    -------
+    list of Token
+        Tokens covering the whole line, in order; characters that
+        start no known token become ``other`` tokens.
+    """
+    return [Token(match.lastgroup, match.group()) for match in _TOKEN.finditer(line)]
+
+
+def _strip_comment(line: str) -> str:
+    """Remove a ``%`` comment, keeping escaped ``\\%``."""
+    index = line.find("%")
+    while index > 0 and line[index - 1] == "\\":
+        index = line.find("%", index + 1)
+    return line if index < 0 else line[:index]
+
+
+def split_tune(raw_abc: str) -> Tuple[List[Tuple[str, str]], List[str]]:
+    """Split a tune into header fields and body lines.
+
+    The header ends with the first ``K:`` field. Free text before it,
+    such as a file preamble the parser kept with the first tune of a
+    book, is skipped.
+
+    Parameters
+    ----------
+    raw_abc : str
+        The tune's ABC text.
+
+    Returns
+    -------
+    tuple of (list of tuple of (str, str), list of str)
+        ``(field, value)`` pairs of the header, and the body lines
+        without comments or blank lines. Field lines inside the body
+        (``M:``, ``w:``, ...) are kept as they are.
+    """
+    header: List[Tuple[str, str]] = []
+    body: List[str] = []
+    in_body = False
+    lines = raw_abc.replace("\r\n", "\n").split("\n")
+    start = next((i for i, line in enumerate(lines) if line.startswith("X:")), 0)
+    for raw_line in lines[start:]:
+        line = _strip_comment(raw_line).strip()
+        if not line:
+            continue
+        field = _FIELD_LINE.match(line)
+        if in_body:
+            body.append(line)
+        elif field:
+            header.append((field.group(1), field.group(2).strip()))
+            in_body = field.group(1) == "K"
+    return header, body
+
+
+def normalize_abc(raw_abc: str, reference: int = 1) -> str:
+    """Rewrite a tune in a canonical layout.
+
+    Parameters
+    ----------
+    raw_abc : str
+        The tune's ABC text.
+    reference : int, optional
+        Number for the ``X:`` field.
+
+    Returns
+    -------
+    str
+        The tune with ``X:`` and ``T:`` first and ``K:`` last in the
+        header (``K:C`` if it had none), other header fields in their
+        original order, no comments or blank lines, single spaces and
+        a final newline.
+    """
+    header, body = split_tune(raw_abc)
+    titles = [value for field, value in header if field == "T"] or ["Untitled"]
+    keys = [value for field, value in header if field == "K"]
+    lines = [f"X:{reference}"] + [f"T:{title}" for title in titles]
+    lines += [f"{field}:{value}" for field, value in header if field not in ("X", "T", "K")]
+    lines.append(f"K:{keys[-1] if keys else 'C'}")
+    for line in body:
+        field = _FIELD_LINE.match(line)
+        if field:
+            lines.append(f"{field.group(1)}:{field.group(2).strip()}")
+        else:
+            lines.append("".join(" " if token.kind == "space" else token.text for token in tokenize_body(line)))
+    return "\n".join(lines) + "\n"
+
+
+# Key signatures: sharps (positive) or flats (negative) of major keys,
+# and the shift of each mode relative to its major key
+_MAJOR_SHARPS = {
+    "C": 0, "G": 1, "D": 2, "A": 3, "E": 4, "B": 5, "F#": 6, "C#": 7,
+    "F": -1, "Bb": -2, "Eb": -3, "Ab": -4, "Db": -5, "Gb": -6, "Cb": -7,
+}
+_MODE_SHIFT = {
+    "": 0, "maj": 0, "ion": 0, "m": -3, "min": -3, "aeo": -3,
+    "mix": -1, "dor": -2, "phr": -4, "lyd": 1, "loc": -5,
+}
+_KEY = re.compile(r"^\s*([A-Ga-g])([#b]?)\s*([A-Za-z]*)")
+_EXPLICIT_ACCIDENTAL = re.compile(r"(\^\^?|__?|=)([A-Ga-g])")
+_SEMITONES = {"C": 0, "D": 2, "E": 4, "F": 5, "G": 7, "A": 9, "B": 11}
+_ACCIDENTAL_SHIFT = {"^": 1, "^^": 2, "_": -1, "__": -2, "=": 0}
+
+_TICKS_PER_QUARTER = 480
+_TICKS_PER_WHOLE = 4 * _TICKS_PER_QUARTER
+_VELOCITY = 80
+
+
+def _key_signature(value: str) -> Tuple[Dict[str, int], int, bool]:
+    """Return the letter accidentals, MIDI sharps count and minor flag of a key."""
+    match = _KEY.match(value or "")
+    if match is None:
+        return {}, 0, False
+    tonic, accidental, mode = match.groups()
+    mode = mode.lower()
+    mode = mode if mode in ("m", "") else mode[:3]
+    sharps = _MAJOR_SHARPS.get(tonic.upper() + accidental, 0) + _MODE_SHIFT.get(mode, 0)
+    sharps = max(-7, min(7, sharps))
+    letters: Dict[str, int] = {}
+    if sharps > 0:
+        letters.update((letter, 1) for letter in "FCGDAEB"[:sharps])
+    else:
+        letters.update((letter, -1) for letter in "BEADGCF"[:-sharps])
+    # Explicit accidentals after the mode, e.g. "D mix ^g" or "Ador =c"
+    for sign, letter in _EXPLICIT_ACCIDENTAL.findall(value[match.end():]):
+        letters[letter.upper()] = _ACCIDENTAL_SHIFT[sign]
+    return letters, sharps, mode in ("m", "min", "aeo")
+
+
+@lru_cache(maxsize=256)
+def _parse_length(spec: str) -> Fraction:
+    """Return the multiplier written after a note, e.g. ``"3/2"`` -> 3/2."""
+    numerator, slashes, denominator = _LENGTH.fullmatch(spec).groups()
+    value = Fraction(int(numerator) if numerator else 1)
+    if slashes:
+        value /= int(denominator) * 2 ** (len(slashes) - 1) if denominator else 2 ** len(slashes)
+    return value
+
+
+def _parse_meter(value: str) -> Fraction | None:
+    """Return the bar length of an ``M:`` value in whole notes, or ``None``."""
+    value = value.strip()
+    if value == "C":
+        return Fraction(1)
+    if value == "C|":
+        return Fraction(1, 2)
+    match = re.match(r"^\(?([\d+]+)\)?\s*/\s*(\d+)", value)
+    if match is None:
+        return None
+    return Fraction(sum(int(part) for part in match.group(1).split("+") if part), int(match.group(2)))
+
+
+def _tempo(value: str) -> int:
+    """Return microseconds per quarter note for a ``Q:`` value."""
+    match = _TEMPO.search(value)
+    if match:
+        beat = Fraction(int(match.group(1)), int(match.group(2)))
+        per_minute = int(match.group(3)) * beat * 4
+    else:
+        digits = re.search(r"\d+", value)
+        per_minute = int(digits.group()) if digits else 120
+    return int(60_000_000 / max(per_minute, 1))
+
+
+class _Player:
+    """State of :func:`abc_to_midi` while it walks the tokens."""
+
+    def __init__(self, header: List[Tuple[str, str]]) -> None:
+        fields = dict(header)
+        self.meter = _parse_meter(fields.get("M", "")) or Fraction(1)
+        self.unit = self._default_unit(fields)
+        self.tempo = _tempo(fields["Q"]) if "Q" in fields else _tempo("1/4=120")
+        self.key, self.sharps, self.minor = _key_signature(fields.get("K", ""))
+        self.time = 0
+        self.notes: List[List[int]] = []  # [start, end, pitch]
+        self.meta: List[Tuple[int, bytes]] = []
+        self.bar_accidentals: Dict[int, int] = {}
+        self.last_chord: List[int] = []  # indices into self.notes
+        self.last_start = 0
+        self.tied: Dict[int, int] = {}  # pitch -> index into self.notes
+        self.next_factor: Fraction | None = None
+        self.tuplet: Tuple[int, int, int] | None = None  # q, p, notes left
+
+    def _default_unit(self, fields: Dict[str, str]) -> Fraction:
+        if "L" in fields:
+            try:
+                return Fraction(fields["L"].strip())
+            except (ValueError, ZeroDivisionError):
+                pass
+        return Fraction(1, 16) if self.meter < Fraction(3, 4) else Fraction(1, 8)
+
+    def set_field(self, field: str, value: str) -> None:
+        """Apply a header field met inside the body."""
+        if field == "K":
+            self.key, self.sharps, self.minor = _key_signature(value)
+            self.bar_accidentals.clear()
+            self.meta.append((self.time, _key_event(self.sharps, self.minor)))
+        elif field == "M":
+            meter = _parse_meter(value)
+            if meter is not None:
+                self.meter = meter
+                self.meta.append((self.time, _meter_event(value)))
+        elif field == "L":
+            try:
+                self.unit = Fraction(value.strip())
+            except (ValueError, ZeroDivisionError):
+                pass
+        elif field == "Q":
+            self.tempo = _tempo(value)
+            self.meta.append((self.time, _tempo_event(self.tempo)))
+
+    def pitch(self, accidental: str, letter: str, octave: str) -> int:
+        natural = 60 + _SEMITONES[letter.upper()] + (12 if letter.islower() else 0)
+        natural += 12 * octave.count("'") - 12 * octave.count(",")
+        if accidental:
+            shift = _ACCIDENTAL_SHIFT.get(accidental, 0)
+            self.bar_accidentals[natural] = shift
+        else:
+            shift = self.bar_accidentals.get(natural, self.key.get(letter.upper(), 0))
+        return natural + shift
+
+    def duration(self, length: Fraction) -> int:
+        # Integer arithmetic: this runs for every note
+        numerator = self.unit.numerator * length.numerator * _TICKS_PER_WHOLE
+        denominator = self.unit.denominator * length.denominator
+        if self.next_factor is not None:
+            numerator *= self.next_factor.numerator
+            denominator *= self.next_factor.denominator
+            self.next_factor = None
+        if self.tuplet is not None:
+            q, p, remaining = self.tuplet
+            numerator *= q
+            denominator *= p
+            self.tuplet = (q, p, remaining - 1) if remaining > 1 else None
+        return (2 * numerator + denominator) // (2 * denominator)
+
+    def play(self, pitches: List[int], length: Fraction, tie: bool) -> None:
+        ticks = self.duration(length)
+        start = self.time
+        self.last_chord = []
+        tied, self.tied = self.tied, {}
+        for pitch in pitches:
+            if pitch in tied and self.notes[tied[pitch]][1] == start:
+                index = tied[pitch]
+                self.notes[index][1] = start + ticks
+            else:
+                index = len(self.notes)
+                self.notes.append([start, start + ticks, pitch])
+            self.last_chord.append(index)
+            if tie:
+                self.tied[pitch] = index
+        self.last_start = start
+        self.time = start + ticks
+
+    def rest(self, length: Fraction) -> None:
+        self.time += self.duration(length)
+        self.last_chord = []
+        self.tied = {}
+
+    def broken(self, text: str) -> None:
+        """Lengthen or shorten the previous note and the next one."""
+        short = Fraction(1, 2 ** len(text))
+        first, second = (2 - short, short) if text[0] == ">" else (short, 2 - short)
+        if self.last_chord:
+            old = self.time - self.last_start
+            new = round(old * first)
+            for index in self.last_chord:
+                self.notes[index][1] += new - old
+            self.time = self.last_start + new
+        self.next_factor = second
+
+    def start_tuplet(self, text: str) -> None:
+        parts = text[1:].split(":")
+        p = int(parts[0])
+        compound = self.meter.numerator % 3 == 0 and self.meter.numerator > 3
+        q_default = {2: 3, 3: 2, 4: 3, 6: 2, 8: 3}.get(p, 3 if compound else 2)
+        q = int(parts[1]) if len(parts) > 1 and parts[1] else q_default
+        r = int(parts[2]) if len(parts) > 2 and parts[2] else p
+        self.tuplet = (q, p, r)
+
+
+def _body_tokens(body: List[str]) -> List[Token]:
+    """Tokenize the body, turning field lines into field tokens."""
+    tokens: List[Token] = []
+    for line in body:
+        field = _FIELD_LINE.match(line)
+        if field:
+            if field.group(1) in "KMLQ":
+                tokens.append(Token("field", f"[{field.group(1)}:{field.group(2).strip()}]"))
+            continue
+        tokens.extend(tokenize_body(line))
+    return tokens
+
+
+def _ending_number(token: Token) -> int | None:
+    if token.kind == "ending" or (token.kind == "bar" and token.text[-1:].isdigit()):
+        return int(re.search(r"\d+", token.text).group())
+    return None
+
+
+def _play_order(tokens: List[Token]) -> Iterator[Token]:
+    """Yield the tokens in playing order, expanding repeats once.
+
+    ``:|`` jumps back to the last ``|:`` (or the last double bar, or
+    the start); on the second time through a first ending is skipped
+    up to the next ending.
+    """
+    section_start = 0
+    second_time = False
+    index = 0
+    steps = 0
+    while index < len(tokens) and steps < 4 * len(tokens) + 4:
+        steps += 1
+        token = tokens[index]
+        if token.kind in ("bar", "ending"):
+            number = _ending_number(token)
+            core = token.text.rstrip("0123456789,-")
+            if token.kind == "bar" and core.startswith(":"):
+                if not second_time:
+                    second_time = True
+                    yield Token("bar", "|")
+                    index = section_start
+                    continue
+                # Repeat done: a later ":|" without "|:" repeats from here
+                second_time = False
+                section_start = index + 1
+            if second_time and number == 1:
+                # Skip the first ending: jump to the next numbered ending
+                later = [i for i in range(index + 1, len(tokens)) if (_ending_number(tokens[i]) or 1) != 1]
+                if later:
+                    index = later[0]
+                    continue
+            if token.kind == "bar" and (core.endswith(":") or core in ("||", "|]", "[|")):
+                section_start = index + 1
+                second_time = False
+        yield token
+        index += 1
+
+
+def abc_to_midi(raw_abc: str, title: str | None = None) -> bytes:
+    """Render a tune as a format 0 MIDI file.
+
+    Parameters
+    ----------
+    raw_abc : str
+        The tune's ABC text.
+    title : str or None, optional
+        Track name; the first ``T:`` field if ``None``.
+
+    Returns
+    -------
+    bytes
+        The contents of a ``.mid`` file with one track.
+    """
+    header, body = split_tune(raw_abc)
+    player = _Player(header)
+    fields = dict(header)
+    if title is None:
+        title = next((value for field, value in header if field == "T"), "")
+
+    tie_next = False
+    pending: Tuple[List[int], Fraction] | None = None
+
+    def flush(tie: bool = False) -> None:
+        nonlocal pending
+        if pending is not None:
+            player.play(pending[0], pending[1], tie)
+            pending = None
+
+    for token in _play_order(_body_tokens(body)):
+        kind = token.kind
+        if kind == "tie":
+            flush(tie=True)
+            continue
+        if kind in ("note", "chord", "rest", "measure_rest", "bar", "ending", "broken", "field", "tuplet"):
+            flush()
+        if kind == "note":
+            accidental, letter, octave, length = _NOTE_PARTS.fullmatch(token.text).groups()
+            pending = ([player.pitch(accidental, letter, octave)], _parse_length(length))
+        elif kind == "chord":
+            inner, _, multiplier = token.text[1:].partition("]")
+            parts = _NOTE_PARTS.findall(inner)
+            if parts:
+                pitches = [player.pitch(a, letter, octave) for a, letter, octave, _ in parts]
+                pending = (pitches, _parse_length(parts[0][3]) * _parse_length(multiplier))
+        elif kind == "rest":
+            player.rest(_parse_length(token.text[1:]))
+        elif kind == "measure_rest":
+            bars = int(token.text[1:] or 1)
+            player.rest(player.meter * bars / player.unit)
+        elif kind in ("bar", "ending"):
+            player.bar_accidentals.clear()
+        elif kind == "broken":
+            player.broken(token.text)
+        elif kind == "tuplet":
+            player.start_tuplet(token.text)
+        elif kind == "field":
+            player.set_field(token.text[1], token.text[3:-1])
+    flush()
+
+    events: List[Tuple[int, int, bytes]] = [
+        (0, 0, _text_event(0x03, title)),
+        (0, 0, _tempo_event(_tempo(fields["Q"]) if "Q" in fields else _tempo("1/4=120"))),
+        (0, 0, _meter_event(fields.get("M", "4/4"))),
+        (0, 0, _key_event(*_key_signature(fields.get("K", ""))[1:])),
+    ]
+    events += [(tick, 0, data) for tick, data in player.meta]
+    for start, end, pitch in player.notes:
+        if end > start and 0 <= pitch < 128:
+            events.append((start, 2, bytes((0x90, pitch, _VELOCITY))))
+            events.append((end, 1, bytes((0x80, pitch, 0))))
+    events.sort(key=lambda event: (event[0], event[1]))
+    end_tick = max(player.time, events[-1][0])
+
+    track = bytearray()
+    now = 0
+    for tick, _, data in events:
+        track += _variable_length(tick - now) + data
+        now = tick
+    track += _variable_length(end_tick - now) + b"\xff\x2f\x00"
+    return (
+        b"MThd" + struct.pack(">IHHH", 6, 0, 1, _TICKS_PER_QUARTER)
+        + b"MTrk" + struct.pack(">I", len(track)) + bytes(track)
+    )
+
+
+def _variable_length(value: int) -> bytes:
+    """Encode a MIDI variable-length quantity."""
+    data = [value & 0x7F]
+    value >>= 7
+    while value:
+        data.append(0x80 | (value & 0x7F))
+        value >>= 7
+    return bytes(reversed(data))
+
+
+def _meta_event(kind: int, data: bytes) -> bytes:
+    return bytes((0xFF, kind)) + _variable_length(len(data)) + data
+
+
+def _text_event(kind: int, text: str) -> bytes:
+    return _meta_event(kind, text.encode("latin-1", "replace"))
+
+
+def _tempo_event(microseconds_per_quarter: int) -> bytes:
+    return _meta_event(0x51, microseconds_per_quarter.to_bytes(3, "big"))
+
+
+def _meter_event(value: str) -> bytes:
+    meter = _parse_meter(value) or Fraction(1)
+    numerator, denominator = meter.numerator, meter.denominator
+    match = re.match(r"^\(?([\d+]+)\)?\s*/\s*(\d+)", value.strip())
+    if match:
+        # Keep the written form, e.g. 6/8 rather than 3/4
+        numerator = sum(int(part) for part in match.group(1).split("+") if part)
+        denominator = int(match.group(2))
+    elif value.strip() == "C":
+        numerator, denominator = 4, 4
+    elif value.strip() == "C|":
+        numerator, denominator = 2, 2
+    power = max(denominator.bit_length() - 1, 0)
+    return _meta_event(0x58, bytes((min(numerator, 255), power, 24, 8)))
+
+
+def _key_event(sharps: int, minor: bool) -> bytes:
+    return _meta_event(0x59, struct.pack(">bB", sharps, 1 if minor else 0))
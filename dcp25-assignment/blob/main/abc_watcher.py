@@ -0,0 +1,360 @@
+"""Watch the ABC books for changes and re-ingest them as they happen.
+
+:class:`AbcWatcher` runs on a background thread. It walks the tree
+the same way :func:`abc_parser.iter_abc_files` does (book folders of
+``.abc`` files under :data:`config.ABC_ROOT`) and compares it with the
+``source_files`` manifest in the database. Only the files that were
+added, changed or deleted are re-ingested, each in its own write
+transaction. The saved count cube and DataFrame snapshot are then
+dropped once, to be rebuilt by the next reader that needs them, and
+registered callbacks are told what changed.
+
+Changes are picked up with inotify on Linux (called through
+``ctypes``), and otherwise by rescanning the tree with
+:func:`os.scandir` every :data:`config.WATCH_POLL_SECONDS`. Either way,
+changes are only applied once the tree has been quiet for
+:data:`config.WATCH_DEBOUNCE_SECONDS`, so an editor saving a burst of
+files causes a single re-ingest::
+
+    python abc_watcher.py
+
+Running UIs notice the new ingest generation and reload their data.
+"""
+
+from __future__ import annotations
+
+from typing import Callable, Dict, List, Set, Tuple
+import argparse
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import threading
+import time
+
+from abc_parser import book_number_for_path, iter_abc_entries
+from config import ABC_ROOT, WATCH_DEBOUNCE_SECONDS, WATCH_POLL_SECONDS
+from db_connection import get_manager
+from db_utils import (
+    get_ingest_generation,
+    ingest_abc_file,
+    load_source_manifest,
+    invalidate_derived_data,
+    remove_abc_file,
+    setup_database,
+)
+
+
+# (book_number, file_name, mtime_ns, size) for each ABC file, by path
+TreeState = Dict[str, Tuple[int, str, int, int]]
+
+
+def scan_abc_tree(root_dir: str | None = None) -> TreeState:
+    """Stat every ABC file under ``root_dir``.
+
+    The walk is :func:`abc_parser.iter_abc_entries`, so only the
+    ``.abc`` files themselves are stat'ed.
+
+    Parameters
+    ----------
+    root_dir : str or None, optional
+        Root of the ABC tree. If ``None``, :data:`config.ABC_ROOT` is
+        used.
+
+    Returns
+    -------
+    dict
+        ``(book_number, file_name, mtime_ns, size)`` keyed by the
+        same paths :func:`abc_parser.find_abc_files` reports.
+    """
+    state: TreeState = {}
+    for book_number, entry in iter_abc_entries(root_dir):
+        try:
+            stat = entry.stat()
+        except FileNotFoundError:
+            # Removed while scanning
+            continue
+        state[entry.path] = (book_number, entry.name, stat.st_mtime_ns, stat.st_size)
+    return state
+
+
+def scan_dirs(root_dir: str) -> List[str]:
+    """Return ``root_dir`` and every folder below it."""
+    return [path for path, _, _ in os.walk(root_dir)]
+
+
+class _Inotify:
+    """Minimal inotify binding through ``ctypes`` (Linux only)."""
+
+    IN_MODIFY = 0x00000002
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_DELETE_SELF = 0x00000400
+    IN_MOVE_SELF = 0x00000800
+    IN_Q_OVERFLOW = 0x00004000
+    IN_ISDIR = 0x40000000
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+
+    FILE_EVENTS = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+    DIR_EVENTS = IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+
+    _EVENT = struct.Struct("iIII")
+
+    def __init__(self) -> None:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = (ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32)
+        self.fd = libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.watches: Dict[int, str] = {}
+        self.watched: Set[str] = set()
+
+    @classmethod
+    def available(cls) -> bool:
+        if not sys.platform.startswith("linux"):
+            return False
+        try:
+            cls().close()
+        except (OSError, AttributeError):
+            return False
+        return True
+
+    def add_watch(self, path: str, mask: int) -> None:
+        wd = self._add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {path}")
+        self.watches[wd] = path
+        self.watched.add(path)
+
+    def read(self, timeout: float) -> List[Tuple[str, str, int]]:
+        """Return ``(watched_dir, name, mask)`` events, waiting up to ``timeout``."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            buffer = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset < len(buffer):
+            wd, mask, _, length = self._EVENT.unpack_from(buffer, offset)
+            offset += self._EVENT.size
+            name = os.fsdecode(buffer[offset:offset + length].rstrip(b"\0"))
+            offset += length
+            events.append((self.watches.get(wd, ""), name, mask))
+        return events
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class AbcWatcher:
+    """Re-ingest changed ABC files on a background thread.
+
+    Parameters
+    ----------
+    root_dir : str or None, optional
+        Folder holding the numbered book folders. If ``None``,
+        :data:`config.ABC_ROOT` is used.
+    on_change : callable or None, optional
+        Called with a summary dictionary after each re-ingest; more
+        callbacks can be added with :meth:`add_callback`.
+    use_inotify : bool or None, optional
+        Force inotify on or off. By default it is used when available.
+    """
+
+    def __init__(
+        self,
+        root_dir: str | None = None,
+        on_change: Callable[[Dict], None] | None = None,
+        use_inotify: bool | None = None,
+    ) -> None:
+        self.root_dir = ABC_ROOT if root_dir is None else root_dir
+        self.use_inotify = _Inotify.available() if use_inotify is None else use_inotify
+        self._callbacks: List[Callable[[Dict], None]] = [on_change] if on_change else []
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def add_callback(self, callback: Callable[[Dict], None]) -> None:
+        """Register a function called with the summary of each re-ingest."""
+        self._callbacks.append(callback)
+
+    def start(self) -> "AbcWatcher":
+        """Bring the database up to date and start watching."""
+        setup_database()
+        self._thread = threading.Thread(target=self._run, name="abc-watcher", daemon=True)
+        self._thread.start()
+        return self
+
+    def is_alive(self) -> bool:
+        """Return ``True`` while the background thread is running."""
+        return self._thread is not None and self._thread.is_alive()
+
+    def stop(self, timeout: float | None = None) -> None:
+        """Stop watching and wait for the background thread to finish."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def sync(self, paths: Set[str] | None = None) -> Dict | None:
+        """Re-ingest the files that differ from the manifest.
+
+        Parameters
+        ----------
+        paths : set of str or None, optional
+            Only check these files. If ``None``, the whole tree is
+            compared with the manifest.
+
+        Returns
+        -------
+        dict or None
+            Summary of the changes, or ``None`` if nothing changed.
+        """
+        manifest = load_source_manifest()
+        if paths is None:
+            tree = scan_abc_tree(self.root_dir)
+            paths = set(tree) | {p for p in manifest if p.startswith(self.root_dir + os.sep)}
+        else:
+            tree = {}
+            for path in paths:
+                state = self._stat(path)
+                if state is not None:
+                    tree[path] = state
+
+        changed = [p for p in sorted(paths) if p in tree and tree[p][2:] != manifest.get(p)]
+        removed = [p for p in sorted(paths) if p not in tree and p in manifest]
+        if not changed and not removed:
+            return None
+
+        manager = get_manager()
+        summary = {"added": 0, "changed": 0, "removed": 0, "tunes_inserted": 0, "tunes_deleted": 0}
+        for path in changed:
+            book_number, file_name = tree[path][:2]
+            try:
+                with manager.write_transaction() as conn:
+                    summary["tunes_inserted"] += ingest_abc_file(book_number, file_name, path, conn, replace=True)
+            except FileNotFoundError:
+                # Deleted between the scan and the re-ingest; handled next time
+                continue
+            summary["changed" if path in manifest else "added"] += 1
+        for path in removed:
+            book_number, file_name = self._book_and_name(path)
+            with manager.write_transaction() as conn:
+                summary["tunes_deleted"] += remove_abc_file(book_number, file_name, path, conn)
+            summary["removed"] += 1
+
+        invalidate_derived_data()
+        summary["generation"] = get_ingest_generation()
+        for callback in self._callbacks:
+            callback(summary)
+        return summary
+
+    def _book_and_name(self, path: str) -> Tuple[int | None, str]:
+        return book_number_for_path(path, self.root_dir), os.path.basename(path)
+
+    def _stat(self, path: str) -> Tuple[int, str, int, int] | None:
+        """Return the tree state of one path, or ``None`` if it is gone."""
+        book_number, file_name = self._book_and_name(path)
+        if book_number is None or not file_name.lower().endswith(".abc"):
+            return None
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return book_number, file_name, stat.st_mtime_ns, stat.st_size
+
+    def _run(self) -> None:
+        try:
+            self.sync()
+            if self.use_inotify:
+                self._watch_inotify()
+            else:
+                self._watch_polling()
+        except Exception as error:
+            print(f"abc_watcher: stopped after error: {error!r}", file=sys.stderr)
+            raise
+
+    def _watch_inotify(self) -> None:
+        inotify = _Inotify()
+
+        def watch_new_dirs() -> None:
+            for path in scan_dirs(self.root_dir):
+                if path not in inotify.watched:
+                    inotify.add_watch(path, _Inotify.FILE_EVENTS | _Inotify.DIR_EVENTS)
+
+        try:
+            watch_new_dirs()
+            dirty: Set[str] = set()
+            rescan = False
+            last_event = 0.0
+            while not self._stop.is_set():
+                events = inotify.read(WATCH_DEBOUNCE_SECONDS / 2)
+                for directory, name, mask in events:
+                    last_event = time.monotonic()
+                    if mask & (_Inotify.IN_Q_OVERFLOW | _Inotify.IN_ISDIR):
+                        # Events were lost or a folder came or went:
+                        # compare the whole tree once things settle
+                        rescan = True
+                    elif directory and name:
+                        dirty.add(os.path.join(directory, name))
+                if (dirty or rescan) and time.monotonic() - last_event >= WATCH_DEBOUNCE_SECONDS:
+                    if rescan:
+                        watch_new_dirs()
+                    self.sync(None if rescan else dirty)
+                    dirty, rescan = set(), False
+        finally:
+            inotify.close()
+
+    def _watch_polling(self) -> None:
+        previous = scan_abc_tree(self.root_dir)
+        while not self._stop.wait(WATCH_POLL_SECONDS):
+            current = scan_abc_tree(self.root_dir)
+            if current == previous:
+                continue
+            # Keep rescanning until the tree stops changing, so a burst
+            # of saves is applied in one go
+            while not self._stop.wait(WATCH_DEBOUNCE_SECONDS):
+                settled = scan_abc_tree(self.root_dir)
+                if settled == current:
+                    break
+                current = settled
+            self.sync(set(current) | set(previous))
+            previous = current
+
+
+def main(argv=None) -> int:
+    """Watch the ABC books from the command line until interrupted."""
+    parser = argparse.ArgumentParser(description="Re-ingest ABC files as they change.")
+    parser.add_argument("--root", help="directory holding the numbered book folders")
+    parser.add_argument("--poll", action="store_true", help="rescan periodically instead of using inotify")
+    args = parser.parse_args(argv)
+
+    def report(summary: Dict) -> None:
+        print(
+            f"{summary['added']} added, {summary['changed']} changed, {summary['removed']} removed "
+            f"({summary['tunes_inserted']} tunes inserted, {summary['tunes_deleted']} deleted); "
+            f"generation {summary['generation']}",
+            flush=True,
+        )
+
+    watcher = AbcWatcher(args.root, report, use_inotify=False if args.poll else None)
+    print(f"Watching {watcher.root_dir} ({'inotify' if watcher.use_inotify else 'polling'}); Ctrl+C to stop", flush=True)
+    watcher.start()
+    try:
+        while watcher.is_alive():
+            time.sleep(1)
+    except KeyboardInterrupt:
+        watcher.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -6,24 +6,54 @@ interface while delegating detailed work to other modules.
 
 from __future__ import annotations
 
+from contextlib import nullcontext
+from typing import Sequence
+import argparse
 
-def main() -> None:
+
+def main(argv: Sequence[str] | None = None) -> None:
     """Run the main application menu.
 
     The menu offers options to (1) load ABC data into the database,
-    (2) start the interactive user interface and (3) exit.
+    (2) start the interactive user interface and (3) exit. The modules
+    behind each option are imported when it is chosen, so the menu
+    appears without waiting for them.
+
+    Parameters
+    ----------
+    argv : sequence of str or None, optional
+        Command-line arguments; ``sys.argv[1:]`` if ``None``. With
+        ``--profile`` every chosen option runs under cProfile and
+        tracemalloc, and the stats and memory report are written to
+        :data:`config.PROFILE_DIR` on exit (see :mod:`profiling`).
 
     Returns
     -------
     None
         The function runs until the user chooses to exit.
     """
-    from db_utils import load_all_abc_data
-    from ui_cli import run_user_interface
+    parser = argparse.ArgumentParser(description="ABC File Parser and Analysis System")
+    parser.add_argument("--profile", action="store_true", help="profile each chosen option")
+    args = parser.parse_args(argv)
+    session = None
+    if args.profile:
+        from profiling import ProfileSession
+
+        session = ProfileSession("app_main")
 
     print("ABC File Parser and Analysis System")
     print("=" * 40)
+    try:
+        _run_menu(session)
+    finally:
+        if session is not None:
+            paths = session.write()
+            if paths:
+                print(f"Profile written to {paths[0]} and {paths[1]}")
+
 
+def _run_menu(session) -> None:
+    """Show the main menu until the user exits, profiling if asked."""
     while True:
         print("\nMain Options:")
         print("1. Load ABC data into database (run this first)")
@@ -33,13 +63,19 @@ def main() -> None:
         choice = input("Choose option (1-3): ").strip()
 
         if choice == "1":
+            from db_utils import load_all_abc_data
+
             print("\nLoading ABC data into database...")
-            total_tunes = load_all_abc_data()
+            with session.stage("load") if session else nullcontext():
+                total_tunes = load_all_abc_data()
             print(f"Successfully loaded {total_tunes} tunes into database!")
 
         elif choice == "2":
+            from ui_cli import run_user_interface
+
             print("\nStarting user interface...")
-            run_user_interface()
+            with session.stage("user interface") if session else nullcontext():
+                run_user_interface()
 
         elif choice == "3":
             print("Goodbye!")
@@ -47,3 +83,7 @@ def main() -> None:
 
         else:
             print("Invalid choice! Please enter 1-3.")
+
+
+if __name__ == "__main__":
+    main()
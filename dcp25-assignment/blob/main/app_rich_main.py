@@ -6,26 +6,55 @@ terminal UI.
 
 from __future__ import annotations
 
+from contextlib import nullcontext
+from typing import Sequence
+import argparse
+
 from rich.console import Console
 from rich.panel import Panel
 from rich.prompt import Prompt
 
-from ui_rich import run_rich_loader, run_rich_ui
-
 
 console = Console()
 
 
-def main() -> None:
+def main(argv: Sequence[str] | None = None) -> None:
     """Run the Rich-styled main menu.
 
+    Parameters
+    ----------
+    argv : sequence of str or None, optional
+        Command-line arguments; ``sys.argv[1:]`` if ``None``. With
+        ``--profile`` every chosen option runs under cProfile and
+        tracemalloc, and the stats and memory report are written to
+        :data:`config.PROFILE_DIR` on exit (see :mod:`profiling`).
+
     Returns
     -------
     None
         The function runs until the user chooses to exit.
     """
+    parser = argparse.ArgumentParser(description="ABC File Parser and Analysis System (Rich UI)")
+    parser.add_argument("--profile", action="store_true", help="profile each chosen option")
+    args = parser.parse_args(argv)
+    session = None
+    if args.profile:
+        from profiling import ProfileSession
+
+        session = ProfileSession("app_rich_main")
+
     console.print(Panel.fit("[bold cyan]ABC File Parser and Analysis System[/bold cyan]"))
+    try:
+        _run_menu(session)
+    finally:
+        if session is not None:
+            paths = session.write()
+            if paths:
+                console.print(f"[dim]Profile written to {paths[0]} and {paths[1]}[/dim]")
+
 
+def _run_menu(session) -> None:
+    """Show the main menu until the user exits, profiling if asked."""
     while True:
         console.print(
             Panel(
@@ -39,10 +68,18 @@ def main() -> None:
 
         choice = Prompt.ask("[bold]Choose option (1-3)[/bold]")
 
+        # ui_rich pulls in pandas, so it is imported on first use
+        # rather than before the menu is shown
         if choice == "1":
-            run_rich_loader()
+            from ui_rich import run_rich_loader
+
+            with session.stage("load") if session else nullcontext():
+                run_rich_loader()
         elif choice == "2":
-            run_rich_ui()
+            from ui_rich import run_rich_ui
+
+            with session.stage("user interface") if session else nullcontext():
+                run_rich_ui()
         elif choice == "3":
             console.print("[bold magenta]Goodbye![/bold magenta]")
             break
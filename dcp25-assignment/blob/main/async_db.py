@@ -0,0 +1,260 @@
+"""asyncio front end for the blocking database helpers.
+
+The functions in :mod:`db_utils` (and the aggregate readers in
+:mod:`tune_analysis`) block the calling thread for as long as SQLite
+and pandas take. :class:`AsyncTunesDB` runs them on a bounded pool of
+worker threads instead; each worker uses its own read-only connection
+from :class:`db_connection.ConnectionManager`, so the pool size is
+also the number of connections. Every call accepts a ``timeout``, and
+cancelling or timing out a call interrupts the statement it is running
+with :meth:`sqlite3.Connection.interrupt`, freeing the worker for the
+next query::
+
+    db = AsyncTunesDB()
+    df = await db.load_tunes()
+    async for tune in db.iter_query(meter="6/8", timeout=5):
+        ...
+    counts = await db.aggregate_counts("rhythm", timeout=1)
+"""
+
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import TYPE_CHECKING, Any, AsyncIterator, Callable, Dict, List, Tuple
+import asyncio
+import sqlite3
+import threading
+import time
+
+from config import ASYNC_DB_QUEUE_BATCHES, ASYNC_DB_WORKERS
+import db_utils
+from db_connection import get_manager
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+class _Call:
+    """One blocking call on a worker thread, interruptible from outside.
+
+    The worker registers the connection it reads from for the duration
+    of the call; :meth:`cancel` interrupts that connection only while
+    the call is still running, so a late cancel can never abort the
+    next query the worker has moved on to.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._conn: sqlite3.Connection | None = None
+        self.cancelled = False
+
+    def run(self, func: Callable[[], Any]) -> Any:
+        with self._lock:
+            if self.cancelled:
+                raise asyncio.CancelledError()
+            self._conn = get_manager().reader()
+        try:
+            return func()
+        finally:
+            with self._lock:
+                self._conn = None
+
+    def cancel(self) -> None:
+        with self._lock:
+            self.cancelled = True
+            if self._conn is not None:
+                self._conn.interrupt()
+
+
+class AsyncTunesDB:
+    """Awaitable versions of the database and aggregate queries.
+
+    Parameters
+    ----------
+    max_workers : int, optional
+        Number of worker threads, and so of SQLite connections, used
+        for queries. Calls beyond that wait for a free worker.
+    """
+
+    def __init__(self, max_workers: int = ASYNC_DB_WORKERS) -> None:
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="async-db")
+
+    async def run(self, func: Callable, *args, timeout: float | None = None, **kwargs) -> Any:
+        """Run ``func(*args, **kwargs)`` on a worker thread.
+
+        Parameters
+        ----------
+        func : callable
+            Blocking function that reads through this thread's
+            connection from :func:`db_connection.get_manager`, such as
+            any ``db_utils`` loader.
+        timeout : float or None, optional
+            Seconds to wait before interrupting the query and raising
+            :class:`TimeoutError`.
+
+        Returns
+        -------
+        object
+            Whatever ``func`` returns.
+
+        Raises
+        ------
+        TimeoutError
+            If ``timeout`` elapsed first.
+        asyncio.CancelledError
+            If the awaiting task was cancelled; the query is
+            interrupted as well.
+        """
+        call = _Call()
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self._executor, call.run, partial(func, *args, **kwargs))
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except (asyncio.CancelledError, TimeoutError):
+            call.cancel()
+            raise
+
+    async def iterate(
+        self,
+        func: Callable[..., Any],
+        *args,
+        batch_size: int = 500,
+        timeout: float | None = None,
+        **kwargs,
+    ) -> AsyncIterator[Any]:
+        """Iterate asynchronously over a blocking generator.
+
+        The generator runs on one worker thread (holding its
+        connection) and hands rows over in batches through a bounded
+        queue, so a slow consumer pauses the query instead of letting
+        rows pile up in memory.
+
+        Parameters
+        ----------
+        func : callable
+            Function returning an iterator, e.g. :func:`db_utils.query_tunes`.
+        batch_size : int, optional
+            Rows handed to the event loop at a time.
+        timeout : float or None, optional
+            Seconds the whole iteration may take, including time spent
+            by the consumer between rows.
+
+        Yields
+        ------
+        object
+            The items produced by ``func``.
+
+        Raises
+        ------
+        TimeoutError
+            If ``timeout`` elapsed before the iteration finished.
+        """
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=ASYNC_DB_QUEUE_BATCHES)
+        call = _Call()
+        done = object()
+
+        def put(item: Any) -> None:
+            # Block this worker until the consumer makes room, giving up
+            # if the iteration was abandoned in the meantime
+            future = asyncio.run_coroutine_threadsafe(queue.put(item), loop)
+            while True:
+                try:
+                    future.result(timeout=0.1)
+                    return
+                except TimeoutError:
+                    if call.cancelled:
+                        future.cancel()
+                        raise asyncio.CancelledError() from None
+
+        def produce() -> None:
+            try:
+                batch: List[Any] = []
+                for item in func(*args, **kwargs):
+                    batch.append(item)
+                    if len(batch) >= batch_size:
+                        put(batch)
+                        batch = []
+                if batch:
+                    put(batch)
+                put(done)
+            except asyncio.CancelledError:
+                pass
+            except BaseException as error:
+                if not call.cancelled:
+                    put(error)
+
+        producer = loop.run_in_executor(self._executor, call.run, produce)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        try:
+            while True:
+                remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+                item = await asyncio.wait_for(queue.get(), remaining)
+                if item is done:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                for row in item:
+                    yield row
+        finally:
+            # Also reached when the consumer stops early (break, aclose)
+            call.cancel()
+            await asyncio.wait([producer])
+
+    # -- db_utils ---------------------------------------------------------
+
+    async def load_tunes(self, use_snapshot: bool = True, timeout: float | None = None) -> pd.DataFrame:
+        """Awaitable :func:`db_utils.load_tunes_from_database`."""
+        return await self.run(db_utils.load_tunes_from_database, use_snapshot, timeout=timeout)
+
+    async def list_tunes(self, *args, timeout: float | None = None, **kwargs) -> Tuple[List[Dict], Any]:
+        """Awaitable :func:`db_utils.list_tunes`."""
+        return await self.run(db_utils.list_tunes, *args, timeout=timeout, **kwargs)
+
+    async def query_tunes(self, timeout: float | None = None, **filters) -> List[Dict]:
+        """Return every row of :func:`db_utils.query_tunes` as a list."""
+        return await self.run(lambda: list(db_utils.query_tunes(**filters)), timeout=timeout)
+
+    def iter_query(self, timeout: float | None = None, **filters) -> AsyncIterator[Dict]:
+        """Asynchronously iterate over :func:`db_utils.query_tunes` rows."""
+        return self.iterate(db_utils.query_tunes, timeout=timeout, **filters)
+
+    def iter_tunes(self, order_by: str = "title", timeout: float | None = None) -> AsyncIterator[Dict]:
+        """Asynchronously iterate over :func:`db_utils.iter_tunes` rows."""
+        return self.iterate(db_utils.iter_tunes, order_by, timeout=timeout)
+
+    async def aggregate_counts(self, dimension: str, timeout: float | None = None) -> List[Tuple]:
+        """Awaitable :func:`db_utils.load_aggregate_counts`."""
+        return await self.run(db_utils.load_aggregate_counts, dimension, timeout=timeout)
+
+    async def aggregate_crosstab(self, *dimensions: str, timeout: float | None = None) -> List[Tuple]:
+        """Awaitable :func:`db_utils.load_aggregate_crosstab`."""
+        return await self.run(db_utils.load_aggregate_crosstab, *dimensions, timeout=timeout)
+
+    async def aggregate_total(self, timeout: float | None = None) -> int:
+        """Awaitable :func:`db_utils.load_aggregate_total`."""
+        return await self.run(db_utils.load_aggregate_total, timeout=timeout)
+
+    async def ingest_generation(self, timeout: float | None = None) -> int:
+        """Awaitable :func:`db_utils.get_ingest_generation`."""
+        return await self.run(db_utils.get_ingest_generation, timeout=timeout)
+
+    # -- tune_analysis ----------------------------------------------------
+
+    async def collection_statistics(self, timeout: float | None = None) -> Dict:
+        """Awaitable :func:`tune_analysis.get_collection_statistics`."""
+        from tune_analysis import get_collection_statistics
+
+        return await self.run(get_collection_statistics, timeout=timeout)
+
+    async def value_counts(self, column: str, timeout: float | None = None) -> pd.Series:
+        """Awaitable :func:`tune_analysis.get_value_counts`."""
+        from tune_analysis import get_value_counts
+
+        return await self.run(get_value_counts, column, timeout=timeout)
+
+    def close(self) -> None:
+        """Stop the worker threads once their current calls finish."""
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,310 @@
+"""Non-interactive command-line interface for scripts and pipelines.
+
+Each subcommand queries the SQLite database directly, streams its
+results to standard output as JSON Lines or CSV and exits::
+
+    python batch_cli.py ingest
+    python batch_cli.py search reel --limit 10
+    python batch_cli.py filter --book 1 --key G --format csv
+    python batch_cli.py stats --by meter
+    python batch_cli.py export --book 2 --columns id,title,raw_abc
+    python batch_cli.py batch queries.txt
+    python batch_cli.py --trace-queries filter --key G --limit 5
+
+``--format`` may be given before the subcommand or after it. ``batch``
+reads one query per line (in the same syntax as the command line, e.g.
+``search reel --limit 5 --format csv``) and runs them all in one
+process, so batch jobs pay the start-up cost once; a line without its
+own ``--format`` uses the one given for the batch.
+"""
+
+from __future__ import annotations
+
+from contextlib import redirect_stdout
+from typing import Dict, Iterable, Iterator, List, Sequence, TextIO
+import argparse
+import csv
+import json
+import shlex
+import sqlite3
+import sys
+
+from db_utils import (
+    AGGREGATE_DIMENSIONS,
+    LISTING_COLUMNS,
+    ORDER_KEYS,
+    TUNE_COLUMNS,
+    load_aggregate_counts,
+    load_aggregate_total,
+    load_all_abc_data,
+    query_tunes,
+)
+import metrics
+import query_trace
+
+
+# Output formats accepted by ``--format``
+OUTPUT_FORMATS = ["jsonl", "csv"]
+
+# Short names accepted by ``stats --by``
+STATS_DIMENSIONS = {
+    "book": "book_number",
+    "key": "key_signature",
+    "meter": "meter",
+    "rhythm": "rhythm",
+}
+
+
+class RecordWriter:
+    """Write dictionaries to a stream as JSON Lines or CSV.
+
+    Parameters
+    ----------
+    stream : TextIO
+        Destination, normally :data:`sys.stdout`.
+    fmt : str
+        ``"jsonl"`` or ``"csv"``. For CSV a header row is written
+        before the first record and again whenever the set of columns
+        changes (e.g. between queries of a batch).
+    """
+
+    def __init__(self, stream: TextIO, fmt: str) -> None:
+        self.stream = stream
+        self.fmt = fmt
+        self._csv = csv.writer(stream, lineterminator="\n") if fmt == "csv" else None
+        self._columns: Sequence[str] | None = None
+
+    def write(self, records: Iterable[Dict], extra: Dict | None = None) -> int:
+        """Write records, each prefixed with the fields in ``extra``.
+
+        Returns
+        -------
+        int
+            Number of records written.
+        """
+        count = 0
+        for record in records:
+            if extra:
+                record = {**extra, **record}
+            if self._csv is None:
+                self.stream.write(json.dumps(record, ensure_ascii=False) + "\n")
+            else:
+                columns = list(record)
+                if columns != self._columns:
+                    self._csv.writerow(columns)
+                    self._columns = columns
+                self._csv.writerow(record.values())
+            count += 1
+        return count
+
+
+def _columns(value: str) -> List[str]:
+    """Parse a comma-separated ``--columns`` value."""
+    columns = [column.strip() for column in value.split(",") if column.strip()]
+    unknown = [column for column in columns if column not in TUNE_COLUMNS]
+    if unknown:
+        raise argparse.ArgumentTypeError(
+            f"unknown column(s) {', '.join(unknown)}; choose from {', '.join(TUNE_COLUMNS)}"
+        )
+    return columns
+
+
+def _add_filter_arguments(parser: argparse.ArgumentParser) -> None:
+    """Add the options shared by the filtering subcommands."""
+    parser.add_argument("--book", type=int, help="book number to match")
+    parser.add_argument("--meter", help="meter to match, e.g. 6/8")
+    parser.add_argument("--key", help="key signature to match, e.g. G or Ador")
+    parser.add_argument("--rhythm", help="rhythm to match, e.g. reel")
+    parser.add_argument("--title", help="substring the title must contain")
+    parser.add_argument("--order-by", choices=list(ORDER_KEYS), help="sort order")
+    parser.add_argument("--limit", type=int, help="maximum number of tunes")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """Create the argument parser for all subcommands.
+
+    Returns
+    -------
+    argparse.ArgumentParser
+        Parser whose result has a ``func`` attribute to run.
+    """
+    parser = argparse.ArgumentParser(
+        prog="batch_cli.py",
+        description="Query the ABC tunes database without the interactive menus.",
+    )
+    parser.add_argument(
+        "--format",
+        choices=OUTPUT_FORMATS,
+        default="jsonl",
+        help="output format (default: jsonl)",
+    )
+    # Lets every subcommand take --format too; SUPPRESS keeps the value
+    # given before the subcommand unless it is repeated after it
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument(
+        "--format",
+        choices=OUTPUT_FORMATS,
+        default=argparse.SUPPRESS,
+        help="output format (default: the one before the subcommand, else jsonl)",
+    )
+    parser.add_argument(
+        "--trace-queries",
+        action="store_true",
+        help="time every SQL statement, log slow ones and print latencies to stderr at the end",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    ingest = commands.add_parser("ingest", parents=[common], help="load ABC files into the database")
+    ingest.add_argument(
+        "--root", help="directory holding the numbered book folders, or a zip/tar archive of them"
+    )
+    ingest.add_argument(
+        "--restart", action="store_true", help="ignore the checkpoint of an unfinished earlier ingest"
+    )
+    ingest.add_argument("--metrics", metavar="PATH", help="time each ingest stage and write the report as JSON")
+    ingest.set_defaults(func=run_ingest)
+
+    search = commands.add_parser("search", parents=[common], help="find tunes whose title contains a term")
+    search.add_argument("term", help="substring to search titles for")
+    _add_filter_arguments(search)
+    search.add_argument("--columns", type=_columns, default=list(LISTING_COLUMNS))
+    search.set_defaults(func=run_filter)
+
+    filter_ = commands.add_parser("filter", parents=[common], help="list tunes matching exact values")
+    _add_filter_arguments(filter_)
+    filter_.add_argument("--columns", type=_columns, default=list(LISTING_COLUMNS))
+    filter_.set_defaults(func=run_filter, term=None)
+
+    stats = commands.add_parser("stats", parents=[common], help="count tunes per book, key, meter or rhythm")
+    stats.add_argument(
+        "--by",
+        choices=list(STATS_DIMENSIONS),
+        action="append",
+        help="dimension to count by (repeatable; default: all)",
+    )
+    stats.set_defaults(func=run_stats)
+
+    export = commands.add_parser("export", parents=[common], help="dump full tune records, including the ABC")
+    _add_filter_arguments(export)
+    export.add_argument("--columns", type=_columns, default=list(TUNE_COLUMNS))
+    export.set_defaults(func=run_filter, term=None)
+
+    batch = commands.add_parser("batch", parents=[common], help="run one query per line of a file ('-' for stdin)")
+    batch.add_argument("file", help="file of queries, e.g. 'search reel --limit 5'")
+    batch.set_defaults(func=run_batch)
+
+    return parser
+
+
+def run_ingest(args: argparse.Namespace, writer: RecordWriter) -> int:
+    """Load all ABC files; progress goes to stderr, a summary to stdout."""
+    if args.metrics:
+        metrics.enable()
+    with redirect_stdout(sys.stderr):
+        total = load_all_abc_data(args.root, resume=not args.restart)
+    if args.metrics:
+        metrics.dump_json(args.metrics)
+    writer.write([{"command": "ingest", "tunes_loaded": total}])
+    return 0
+
+
+def _filter_records(args: argparse.Namespace) -> Iterator[Dict]:
+    """Run the query described by search/filter/export arguments."""
+    return query_tunes(
+        title=args.term if args.term is not None else args.title,
+        book_number=args.book,
+        meter=args.meter,
+        key_signature=args.key,
+        rhythm=args.rhythm,
+        columns=args.columns,
+        order_by=args.order_by,
+        limit=args.limit,
+    )
+
+
+def run_filter(args: argparse.Namespace, writer: RecordWriter, extra: Dict | None = None) -> int:
+    """Stream the tunes matching a search, filter or export query."""
+    writer.write(_filter_records(args), extra)
+    return 0
+
+
+def run_stats(args: argparse.Namespace, writer: RecordWriter, extra: Dict | None = None) -> int:
+    """Write the total and per-dimension tune counts."""
+    dimensions = [STATS_DIMENSIONS[name] for name in args.by] if args.by else list(AGGREGATE_DIMENSIONS)
+    records: List[Dict] = [{"dimension": "total", "value": None, "count": load_aggregate_total()}]
+    for dimension in dimensions:
+        records.extend(
+            {"dimension": dimension, "value": value, "count": count}
+            for value, count in load_aggregate_counts(dimension)
+        )
+    writer.write(records, extra)
+    return 0
+
+
+def run_batch(args: argparse.Namespace, writer: RecordWriter) -> int:
+    """Run every query in a file, tagging each record with its line."""
+    parser = build_parser()
+    stream = sys.stdin if args.file == "-" else open(args.file, encoding="utf-8")
+    failures = 0
+    try:
+        for line_number, line in enumerate(stream, start=1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            try:
+                query = parser.parse_args(["--format", args.format, *shlex.split(line)])
+            except SystemExit:
+                # argparse has already printed the problem to stderr
+                print(f"batch: skipping invalid query on line {line_number}", file=sys.stderr)
+                failures += 1
+                continue
+            if query.func in (run_ingest, run_batch):
+                print(f"batch: line {line_number}: {query.command} is not allowed in a batch", file=sys.stderr)
+                failures += 1
+                continue
+            if query.format == writer.fmt:
+                query.func(query, writer, {"query": line_number})
+            else:
+                query.func(query, RecordWriter(writer.stream, query.format), {"query": line_number})
+                # The next CSV record of the batch needs its header again
+                writer._columns = None
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+    return 1 if failures else 0
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    """Parse the command line, run the subcommand and return its status.
+
+    Parameters
+    ----------
+    argv : sequence of str or None, optional
+        Arguments without the program name. If ``None``,
+        :data:`sys.argv` is used.
+
+    Returns
+    -------
+    int
+        Process exit status.
+    """
+    args = build_parser().parse_args(argv)
+    writer = RecordWriter(sys.stdout, args.format)
+    if args.trace_queries:
+        query_trace.enable()
+    try:
+        return args.func(args, writer)
+    except sqlite3.OperationalError as error:
+        print(f"error: {error} (has the database been loaded with 'ingest'?)", file=sys.stderr)
+        return 1
+    except BrokenPipeError:
+        # Output was piped into a command that stopped reading, e.g. head
+        sys.stderr.close()
+        return 0
+    finally:
+        if args.trace_queries and not sys.stderr.closed:
+            print(query_trace.format_report(), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
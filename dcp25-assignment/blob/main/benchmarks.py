@@ -0,0 +1,345 @@
+"""Benchmark the loader and the analysis functions.
+
+For each corpus size the suite times directory discovery, parsing,
+the full load into SQLite, loading the DataFrame (from SQL and from
+the snapshot) and every function in :mod:`tune_analysis`. Sizes are
+``real`` (the bundled ``abc_books``) or a synthetic corpus of ``10k``,
+``100k`` or ``1m`` tunes made by :mod:`abc_corpus`; synthetic corpora
+are generated once and cached in :data:`config.BENCH_CORPUS_DIR`::
+
+    python benchmarks.py --size real --size 10k --save-baseline
+    python benchmarks.py --size real --size 10k --baseline --json
+
+Every benchmark runs against a scratch database in a temporary
+folder, never against :data:`config.DB_PATH`. Results can be printed
+or written as JSON, stored as a baseline and compared with one; the
+exit status is non-zero when a benchmark got slower than the baseline
+by more than :data:`config.BENCH_REGRESSION_TOLERANCE`.
+"""
+
+from __future__ import annotations
+
+from contextlib import contextmanager, redirect_stdout
+from typing import Callable, Dict, Iterator, List, Sequence
+import argparse
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+from config import (
+    ABC_ROOT,
+    BENCH_BASELINE_PATH,
+    BENCH_CORPUS_DIR,
+    BENCH_REGRESSION_TOLERANCE,
+)
+
+
+# Bumped when the layout of the results file changes
+RESULTS_FORMAT = 1
+
+# Slowdowns smaller than this (in seconds) are timer noise, never regressions
+NOISE_FLOOR_S = 0.001
+
+
+def corpus_for_size(size: str, seed: int = 0) -> str:
+    """Return the book folder tree for a benchmark size.
+
+    Parameters
+    ----------
+    size : str
+        ``"real"`` or a key of :data:`abc_corpus.CORPUS_SIZES`.
+    seed : int, optional
+        Seed of the synthetic corpus.
+
+    Returns
+    -------
+    str
+        :data:`config.ABC_ROOT` for ``"real"``; otherwise a folder in
+        :data:`config.BENCH_CORPUS_DIR`, generated on first use.
+    """
+    if size == "real":
+        return ABC_ROOT
+    from abc_corpus import CORPUS_SIZES, generate_corpus
+
+    if size not in CORPUS_SIZES:
+        raise ValueError(f"Unknown benchmark size: {size!r}")
+    root = os.path.join(BENCH_CORPUS_DIR, f"{size}-seed{seed}")
+    marker = os.path.join(root, "corpus.json")
+    if not os.path.exists(marker):
+        summary = generate_corpus(root, CORPUS_SIZES[size], seed)
+        # Written last, so an interrupted generation is redone
+        with open(marker, "w", encoding="utf-8") as f:
+            json.dump(summary, f)
+    return root
+
+
+@contextmanager
+def scratch_database(directory: str) -> Iterator[str]:
+    """Point the database, cube and snapshot paths into ``directory``.
+
+    The module-level paths of :mod:`db_connection`, :mod:`db_utils` and
+    :mod:`tune_analysis` are restored when the block exits.
+
+    Yields
+    ------
+    str
+        Path of the scratch database file.
+    """
+    import db_connection
+    import db_utils
+    import tune_analysis
+
+    saved = (db_connection.DB_PATH, db_utils.CUBE_PATH, db_utils.SNAPSHOT_PATH, tune_analysis.CUBE_PATH)
+    db_path = os.path.join(directory, "tunes.db")
+    db_connection.DB_PATH = db_path
+    db_utils.CUBE_PATH = tune_analysis.CUBE_PATH = os.path.join(directory, "tunes_cube.npz")
+    db_utils.SNAPSHOT_PATH = os.path.join(directory, "tunes_snapshot.pkl")
+    try:
+        yield db_path
+    finally:
+        db_connection.get_manager(db_path).close_all()
+        (db_connection.DB_PATH, db_utils.CUBE_PATH, db_utils.SNAPSHOT_PATH, tune_analysis.CUBE_PATH) = saved
+
+
+def time_call(func: Callable[[], object], repeat: int, setup: Callable[[], None] | None = None) -> Dict:
+    """Time ``func`` over ``repeat`` runs.
+
+    Parameters
+    ----------
+    func : callable
+        Code to time, called without arguments.
+    repeat : int
+        Number of timed runs.
+    setup : callable or None, optional
+        Called before each run, outside the timing (e.g. to clear a
+        cache).
+
+    Returns
+    -------
+    dict
+        ``runs``, ``min_s``, ``median_s`` and ``mean_s``.
+    """
+    times: List[float] = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return {
+        "runs": repeat,
+        "min_s": min(times),
+        "median_s": statistics.median(times),
+        "mean_s": statistics.fmean(times),
+    }
+
+
+def _quietly(func: Callable[[], object]) -> Callable[[], object]:
+    """Wrap ``func`` so that what it prints is discarded."""
+    def call() -> object:
+        with redirect_stdout(io.StringIO()):
+            return func()
+    return call
+
+
+def _analysis_benchmarks(df) -> Dict[str, Callable[[], object]]:
+    """Calls covering every function in :mod:`tune_analysis`."""
+    import tune_analysis as ta
+
+    def common(column: str):
+        counts = df[column].value_counts()
+        return counts.index[0] if len(counts) else None
+
+    book, meter, key = common("book_number"), common("meter"), common("key_signature")
+    index = ta.get_title_search_index(df)
+    return {
+        "get_tunes_by_book": lambda: ta.get_tunes_by_book(df, book),
+        "get_tunes_by_meter": lambda: ta.get_tunes_by_meter(df, meter),
+        "get_tunes_by_key": lambda: ta.get_tunes_by_key(df, key),
+        "search_tunes": lambda: ta.search_tunes(df, "reel"),
+        "get_title_search_index": lambda: ta.get_title_search_index(df),
+        "TitleSearchIndex.search": lambda: index.search("the"),
+        "top_tunes": lambda: ta.top_tunes(df, "title", 20, 100),
+        "count_tunes_by_book": lambda: ta.count_tunes_by_book(df),
+        "count_tunes_by_column": lambda: ta.count_tunes_by_column(df, "rhythm"),
+        "get_tune_statistics": lambda: ta.get_tune_statistics(df),
+        "show_tune_statistics": _quietly(lambda: ta.show_tune_statistics(df)),
+        "get_query_cache_stats": ta.get_query_cache_stats,
+        "show_query_cache_stats": _quietly(ta.show_query_cache_stats),
+        "get_value_counts": lambda: ta.get_value_counts("meter"),
+        "get_book_counts": ta.get_book_counts,
+        "get_crosstab": lambda: ta.get_crosstab("book_number", "rhythm"),
+        "get_collection_statistics": ta.get_collection_statistics,
+        "show_collection_statistics": _quietly(ta.show_collection_statistics),
+        "load_tune_cube": ta.load_tune_cube,
+        "cube_rollup": lambda: ta.cube_rollup(("meter", "rhythm"), key="G"),
+        "cube_top": lambda: ta.cube_top("key", 5, rhythm="reel"),
+        "cube_total": lambda: ta.cube_total(meter="6/8"),
+    }
+
+
+def run_size(size: str, repeat: int = 3, seed: int = 0, progress: Callable[[str], None] | None = None) -> List[Dict]:
+    """Run every benchmark on one corpus size.
+
+    Parameters
+    ----------
+    size : str
+        As for :func:`corpus_for_size`.
+    repeat : int, optional
+        Timed runs per benchmark; the full load runs this many times
+        too, each into a fresh database.
+    seed : int, optional
+        Seed of the synthetic corpus.
+    progress : callable or None, optional
+        Called with the name of each benchmark before it runs.
+
+    Returns
+    -------
+    list of dict
+        One result per benchmark, as from :func:`time_call` plus
+        ``size``, ``tunes``, ``group`` and ``name``.
+    """
+    from abc_parser import find_abc_files, parse_abc_file
+    import db_utils
+    from query_cache import query_cache
+
+    root = corpus_for_size(size, seed)
+    results: List[Dict] = []
+
+    def record(group: str, name: str, func: Callable[[], object], setup: Callable[[], None] | None = None) -> None:
+        if progress is not None:
+            progress(f"{size}: {name}")
+        results.append({"size": size, "group": group, "name": name, **time_call(func, repeat, setup)})
+
+    files = find_abc_files(root)
+    record("ingest", "find_abc_files", lambda: find_abc_files(root))
+    record("ingest", "parse_abc_file", lambda: [parse_abc_file(p, b, n) for b, n, p in files])
+
+    with tempfile.TemporaryDirectory(prefix="abc-bench-") as scratch, scratch_database(scratch):
+        import db_connection
+
+        loads = iter(range(repeat))
+
+        def fresh_database() -> None:
+            # Each timed load goes into an empty database of its own
+            db_connection.get_manager().close_all()
+            folder = os.path.join(scratch, f"load{next(loads)}")
+            os.makedirs(folder)
+            db_connection.DB_PATH = os.path.join(folder, "tunes.db")
+
+        record("ingest", "load_all_abc_data", _quietly(lambda: db_utils.load_all_abc_data(root)), fresh_database)
+        record("load", "load_tunes_from_database[sql]",
+               lambda: db_utils.load_tunes_from_database(use_snapshot=False))
+        record("load", "load_tunes_from_database[snapshot]", db_utils.load_tunes_from_database)
+        record("load", "rebuild_tune_cube", db_utils.rebuild_tune_cube)
+
+        df = db_utils.load_tunes_from_database()
+        for name, func in _analysis_benchmarks(df).items():
+            record("analysis", name, func, query_cache.clear)
+        db_connection.get_manager().close_all()
+
+    for result in results:
+        result["tunes"] = len(df)
+    return results
+
+
+def compare_with_baseline(results: Sequence[Dict], baseline: Dict, tolerance: float = BENCH_REGRESSION_TOLERANCE) -> List[Dict]:
+    """Compare results with a stored baseline.
+
+    Parameters
+    ----------
+    results : sequence of dict
+        Results from :func:`run_size`.
+    baseline : dict
+        A results document as written by :func:`main`.
+    tolerance : float, optional
+        Allowed relative growth of the median time.
+
+    Returns
+    -------
+    list of dict
+        One entry per benchmark present in both, with ``size``,
+        ``name``, ``baseline_s``, ``median_s``, ``ratio`` and
+        ``regressed``. A benchmark only counts as regressed if it also
+        got slower by more than :data:`NOISE_FLOOR_S`.
+    """
+    previous = {(r["size"], r["name"]): r for r in baseline.get("results", [])}
+    comparison = []
+    for result in results:
+        old = previous.get((result["size"], result["name"]))
+        if old is None:
+            continue
+        ratio = result["median_s"] / old["median_s"] if old["median_s"] else 1.0
+        comparison.append({
+            "size": result["size"],
+            "name": result["name"],
+            "baseline_s": old["median_s"],
+            "median_s": result["median_s"],
+            "ratio": round(ratio, 3),
+            "regressed": ratio > 1 + tolerance and result["median_s"] - old["median_s"] > NOISE_FLOOR_S,
+        })
+    return comparison
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    """Run the benchmark suite from the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", action="append", dest="sizes",
+                        help="real, 10k, 100k or 1m (repeatable; default: real and 10k)")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per benchmark")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the synthetic corpora")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    parser.add_argument("--output", help="also write the results as JSON to this file")
+    parser.add_argument("--baseline", nargs="?", const=BENCH_BASELINE_PATH,
+                        help="compare with a baseline file (default: config.BENCH_BASELINE_PATH)")
+    parser.add_argument("--save-baseline", nargs="?", const=BENCH_BASELINE_PATH,
+                        help="store the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=BENCH_REGRESSION_TOLERANCE)
+    args = parser.parse_args(argv)
+
+    def report(message: str) -> None:
+        print(message, file=sys.stderr)
+
+    results: List[Dict] = []
+    for size in args.sizes or ["real", "10k"]:
+        results.extend(run_size(size, args.repeat, args.seed, report))
+    document = {
+        "format": RESULTS_FORMAT,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeat": args.repeat,
+        "seed": args.seed,
+        "results": results,
+    }
+
+    regressions = 0
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            document["comparison"] = compare_with_baseline(results, json.load(f), args.tolerance)
+        regressions = sum(entry["regressed"] for entry in document["comparison"])
+    ratios = {(c["size"], c["name"]): c for c in document.get("comparison", [])}
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(document, f, indent=2)
+    if args.json:
+        print(json.dumps(document, indent=2))
+    else:
+        print(f"{'size':<6} {'tunes':>8}  {'benchmark':<36} {'median ms':>10} {'min ms':>10}  baseline")
+        for result in results:
+            entry = ratios.get((result["size"], result["name"]))
+            versus = "" if entry is None else f"x{entry['ratio']:.2f}" + ("  REGRESSION" if entry["regressed"] else "")
+            print(f"{result['size']:<6} {result['tunes']:>8}  {result['name']:<36} "
+                  f"{result['median_s'] * 1000:>10.2f} {result['min_s'] * 1000:>10.2f}  {versus}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,215 @@
+"""Fast, paged text output for the plain command-line interface.
+
+Result listings are formatted from plain row tuples (never one pandas
+Series per row), written in large buffered chunks rather than one
+flushed ``print`` per line, and piped through a pager such as
+``less`` when standard output is a terminal.
+"""
+
+from __future__ import annotations
+
+from contextlib import contextmanager
+from string import Formatter
+from typing import TYPE_CHECKING, Iterable, Iterator, List, Sequence, TextIO, Tuple
+import io
+import os
+import shlex
+import shutil
+import subprocess
+import sys
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+# Number of formatted lines joined into one write() call
+CHUNK_LINES = 4096
+
+
+def _compile_template(template: str) -> Tuple[str, List[str]]:
+    """Turn ``"{title} ({book_number})"`` into a positional template.
+
+    Returns the template with each field replaced by its position and
+    the list of field names in that order, so each row can be
+    formatted with ``str.format(*row)``.
+    """
+    fields: List[str] = []
+    parts: List[str] = []
+    for literal, field, spec, conversion in Formatter().parse(template):
+        parts.append(literal.replace("{", "{{").replace("}", "}}"))
+        if field is not None:
+            if field not in fields:
+                fields.append(field)
+            parts.append(
+                "{" + str(fields.index(field))
+                + (f"!{conversion}" if conversion else "")
+                + (f":{spec}" if spec else "") + "}"
+            )
+    return "".join(parts), fields
+
+
+def format_frame(df: pd.DataFrame, template: str) -> Iterator[str]:
+    """Format each row of a DataFrame with a ``str.format`` template.
+
+    Only the columns named in the template are read, each converted
+    to a Python list once, so no per-row Series is created.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        DataFrame with tune data.
+    template : str
+        Template such as ``"  - '{title}' (Book {book_number})"``.
+
+    Yields
+    ------
+    str
+        One formatted line per row.
+    """
+    positional, fields = _compile_template(template)
+    columns = [df[field].tolist() for field in fields]
+    for row in zip(*columns):
+        yield positional.format(*row)
+
+
+def format_records(records: Iterable[dict], template: str) -> Iterator[str]:
+    """Format dictionaries (e.g. from :func:`db_utils.iter_tunes`).
+
+    Parameters
+    ----------
+    records : iterable of dict
+        Rows keyed by column name.
+    template : str
+        Template whose fields are keys of each record.
+
+    Yields
+    ------
+    str
+        One formatted line per record.
+    """
+    positional, fields = _compile_template(template)
+    for record in records:
+        yield positional.format(*(record[field] for field in fields))
+
+
+def _pager_command() -> Sequence[str] | None:
+    """Return the pager to use, or ``None`` if none is available."""
+    pager = os.environ.get("PAGER")
+    if pager:
+        command = shlex.split(pager)
+    elif os.name == "nt":
+        command = ["more"]
+    else:
+        # -F quits if everything fits on one screen, -R keeps colours,
+        # -X leaves the output on screen afterwards
+        command = ["less", "-FRX"]
+    return command if command and shutil.which(command[0]) else None
+
+
+@contextmanager
+def output_stream() -> Iterator[TextIO]:
+    """Open a buffered text stream for a listing.
+
+    When standard output is a terminal and a pager is available the
+    stream feeds the pager; otherwise it writes to standard output.
+    Quitting the pager early is not an error.
+
+    Yields
+    ------
+    TextIO
+        Stream to write the listing to.
+    """
+    command = _pager_command() if sys.stdout.isatty() else None
+    if command is None:
+        try:
+            yield sys.stdout
+            sys.stdout.flush()
+        except BrokenPipeError:
+            pass
+        return
+
+    sys.stdout.flush()
+    pager = subprocess.Popen(command, stdin=subprocess.PIPE)
+    stream = io.TextIOWrapper(pager.stdin, encoding=sys.stdout.encoding or "utf-8", errors="replace")
+    try:
+        yield stream
+    except BrokenPipeError:
+        # The user quit the pager before reading everything
+        pass
+    finally:
+        try:
+            stream.close()
+        except BrokenPipeError:
+            pass
+        pager.wait()
+
+
+def write_lines(lines: Iterable[str], stream: TextIO | None = None) -> int:
+    """Write lines in large chunks.
+
+    Parameters
+    ----------
+    lines : iterable of str
+        Lines without trailing newlines.
+    stream : TextIO or None, optional
+        Destination. If ``None``, a stream is opened with
+        :func:`output_stream` for the duration of the call.
+
+    Returns
+    -------
+    int
+        Number of lines written.
+    """
+    if stream is None:
+        with output_stream() as opened:
+            return write_lines(lines, opened)
+
+    count = 0
+    chunk: List[str] = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) >= CHUNK_LINES:
+            stream.write("\n".join(chunk) + "\n")
+            count += len(chunk)
+            chunk = []
+    if chunk:
+        stream.write("\n".join(chunk) + "\n")
+        count += len(chunk)
+    return count
+
+
+def print_tunes(df: pd.DataFrame, template: str, header: str | None = None) -> None:
+    """Print a DataFrame of tunes one line per tune, paged if possible.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        DataFrame with tune data.
+    template : str
+        Line template, see :func:`format_frame`.
+    header : str or None, optional
+        Line(s) written before the tunes.
+    """
+    with output_stream() as stream:
+        if header is not None:
+            stream.write(header + "\n")
+        write_lines(format_frame(df, template), stream)
+
+
+def print_records(records: Iterable[dict], template: str, header: str | None = None) -> None:
+    """Print tune records one line per tune, paged if possible.
+
+    Parameters
+    ----------
+    records : iterable of dict
+        Rows keyed by column name, e.g. from
+        :func:`db_utils.query_tunes`.
+    template : str
+        Line template, see :func:`format_records`.
+    header : str or None, optional
+        Line(s) written before the tunes.
+    """
+    with output_stream() as stream:
+        if header is not None:
+            stream.write(header + "\n")
+        write_lines(format_records(records, template), stream)
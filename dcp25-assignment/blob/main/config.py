@@ -8,5 +8,140 @@ PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(BASE_DIR)))
 # ABC_ROOT points to the top-level abc_books folder at the project root
 ABC_ROOT = os.path.join(PROJECT_ROOT, "abc_books")
 
+# Book folders: the directory ABC_BOOK_LEVEL levels below ABC_ROOT whose
+# name fully matches ABC_BOOK_PATTERN (the first group, if any, is the
+# book number); files may be nested further, e.g. abc_books/<book>/<volume>/
+ABC_BOOK_PATTERN = r"\d+"
+ABC_BOOK_LEVEL = 0
+
+# Threads listing directories at once while discovering ABC files; raise
+# it on high-latency network filesystems
+ABC_SCAN_WORKERS = 1
+
 # DB_PATH still points to tunes.db next to this module under blob/main
 DB_PATH = os.path.join(BASE_DIR, "tunes.db")
+
+# How long (in milliseconds) a connection waits for another connection's
+# lock before failing with "database is locked"
+BUSY_TIMEOUT_MS = 30000
+
+# Number of write-ahead-log pages after which SQLite checkpoints the log
+# back into the main database file (SQLite's own default is 1000)
+WAL_AUTOCHECKPOINT_PAGES = 1000
+
+# Keep the database in memory instead of in DB_PATH, e.g. for CI runs and
+# throwaway analysis. DB_PATH is copied into memory at start-up when
+# DB_MEMORY_WARM_LOAD is set and the file exists, and the memory database
+# is written back to DB_PATH at exit when DB_MEMORY_PERSIST is set
+DB_IN_MEMORY = False
+DB_MEMORY_WARM_LOAD = True
+DB_MEMORY_PERSIST = False
+
+# Number of ABC files load_all_abc_data commits per transaction, together
+# with the checkpoint an interrupted load resumes from
+INGEST_BATCH_FILES = 25
+
+# Upper bound (in bytes) for the memory held by cached query results
+QUERY_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+# Precomputed book x key x meter x rhythm count cube, rebuilt after ingest.
+# At most CUBE_MAX_CELLS cells (8 bytes each) are kept as a dense array;
+# combinations with rarer keys, meters and rhythms are stored sparsely
+CUBE_PATH = os.path.join(BASE_DIR, "tunes_cube.npz")
+CUBE_MAX_CELLS = 2_000_000
+
+# Pickled tunes DataFrame, written after ingest so the UIs can skip read_sql
+SNAPSHOT_PATH = os.path.join(BASE_DIR, "tunes_snapshot.pkl")
+
+# Sharded layout (tune_shards.py): one database per book in this folder,
+# and the number of processes ingesting books in parallel
+SHARD_DIR = os.path.join(BASE_DIR, "tune_shards")
+SHARD_WORKERS = 4
+
+# Number of tunes shown per page by the "View all tunes" listings
+PAGE_SIZE = 20
+
+# Pause in typing (in milliseconds) before the Rich UI's live search runs
+LIVE_SEARCH_DEBOUNCE_MS = 40
+
+# Import-time budgets (in milliseconds) checked by import_budget.py, and
+# modules each entry point must not import before the user needs them
+IMPORT_TIME_BUDGET_MS = {
+    "app_main": 50,
+    "app_rich_main": 250,
+    "my_dcp_assignment": 50,
+    "ui_cli": 150,
+    "batch_cli": 150,
+}
+IMPORT_FORBIDDEN_MODULES = ("pandas", "numpy")
+
+# abc_watcher.py: quiet period (in seconds) after the last change before
+# re-ingesting, so a burst of saves triggers one re-ingest, and how often
+# the tree is rescanned when inotify is not available
+WATCH_DEBOUNCE_SECONDS = 0.5
+WATCH_POLL_SECONDS = 2.0
+
+# Worker threads (and so read-only SQLite connections) used by async_db
+ASYNC_DB_WORKERS = 4
+# Batches of rows async_db buffers ahead of a slow async consumer
+ASYNC_DB_QUEUE_BATCHES = 4
+
+# Local HTTP/JSON query service (query_service.py)
+SERVICE_HOST = "127.0.0.1"
+SERVICE_PORT = 8765
+# Worker threads running the heavier queries off the event loop
+SERVICE_WORKERS = 4
+# How often (in seconds) the service checks for newly ingested tunes
+SERVICE_REFRESH_SECONDS = 5
+# Idle keep-alive connections are closed after this many seconds
+SERVICE_IDLE_TIMEOUT_SECONDS = 30
+# Seconds a single service query may run before it is interrupted
+SERVICE_QUERY_TIMEOUT_SECONDS = 10
+
+# benchmarks.py: generated corpora are cached in BENCH_CORPUS_DIR, results
+# are compared with the baseline in BENCH_BASELINE_PATH, and a benchmark
+# counts as a regression when its median time grows by more than
+# BENCH_REGRESSION_TOLERANCE (0.25 = 25 %)
+BENCH_CORPUS_DIR = os.path.join(BASE_DIR, "bench_corpus")
+BENCH_BASELINE_PATH = os.path.join(BASE_DIR, "bench_baseline.json")
+BENCH_REGRESSION_TOLERANCE = 0.25
+
+# Collect per-stage timings and counters (metrics.py) from the start; the
+# timers cost next to nothing while this is off. Each stage keeps a sample
+# of at most METRICS_MAX_SAMPLES durations for its percentiles
+METRICS_ENABLED = False
+METRICS_MAX_SAMPLES = 10000
+
+# --profile (profiling.py): where the cProfile stats and memory reports are
+# written, and how many allocation sites and functions each report lists
+PROFILE_DIR = os.path.join(BASE_DIR, "profiles")
+PROFILE_TOP_ALLOCATIONS = 15
+
+# query_trace.py: time every SQL statement (opt-in, see also batch_cli.py
+# --trace-queries). Statements slower than SLOW_QUERY_MS milliseconds are
+# appended to SLOW_QUERY_LOG_PATH with their parameters and query plan, and
+# each statement keeps a latency histogram with these upper bounds (in ms)
+QUERY_TRACE_ENABLED = False
+SLOW_QUERY_MS = 50
+SLOW_QUERY_LOG_PATH = os.path.join(BASE_DIR, "slow_queries.log")
+QUERY_TRACE_BUCKETS_MS = (0.1, 0.5, 1, 5, 10, 50, 100, 500, 1000)
+
+# tune_clusters.py: tune bodies are compared through MinHash signatures of
+# CLUSTER_MINHASH_PERMUTATIONS hashes over shingles of CLUSTER_SHINGLE_SIZE
+# notes, bucketed into CLUSTER_LSH_BANDS bands. Two tunes are variants when
+# their estimated similarity is at least CLUSTER_SIMILARITY, or at least
+# CLUSTER_TITLE_SIMILARITY when their normalised titles are the same
+CLUSTER_MINHASH_PERMUTATIONS = 32
+CLUSTER_LSH_BANDS = 8
+CLUSTER_SHINGLE_SIZE = 4
+CLUSTER_SIMILARITY = 0.8
+CLUSTER_TITLE_SIMILARITY = 0.5
+
+# tune_export.py: exported .abc and .mid files go to EXPORT_DIR. Tunes are
+# read in batches of EXPORT_BATCH_TUNES and rendered by EXPORT_WORKERS
+# processes; at most EXPORT_QUEUE_BATCHES batches wait between the reader
+# and the workers, so a slow disk pauses the query instead of filling memory
+EXPORT_DIR = os.path.join(BASE_DIR, "exports")
+EXPORT_WORKERS = 4
+EXPORT_BATCH_TUNES = 50
+EXPORT_QUEUE_BATCHES = 8
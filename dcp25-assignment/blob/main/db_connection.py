@@ -0,0 +1,425 @@
+"""SQLite connection management for the ABC tunes project.
+
+This module keeps long-lived connections per thread instead of
+opening and closing a connection around every statement. The
+database is switched to write-ahead logging (WAL) so that one writer
+(the loader) can stream inserts while any number of readers (the UI
+sessions) query a consistent snapshot of the committed data.
+
+With :data:`config.DB_IN_MEMORY` set, the default database lives in
+memory instead (see :class:`MemoryConnectionManager`).
+"""
+
+from __future__ import annotations
+
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Tuple
+from urllib.parse import quote
+import atexit
+import itertools
+import os
+import sqlite3
+import threading
+
+from config import (
+    BUSY_TIMEOUT_MS,
+    DB_IN_MEMORY,
+    DB_MEMORY_PERSIST,
+    DB_MEMORY_WARM_LOAD,
+    DB_PATH,
+    WAL_AUTOCHECKPOINT_PAGES,
+)
+import metrics
+import query_trace
+
+
+class ConnectionManager:
+    """Hand out per-thread SQLite connections for one database file.
+
+    Each thread gets at most one read-write and one read-only
+    connection, created on first use and kept open until
+    :meth:`close_thread` or :meth:`close_all` is called. Writes made
+    through :meth:`write_transaction` are serialised inside the
+    process by a lock and across processes by SQLite's own write lock,
+    waiting up to ``busy_timeout_ms`` instead of failing immediately
+    with "database is locked".
+
+    Parameters
+    ----------
+    db_path : str
+        Path to the SQLite database file.
+    busy_timeout_ms : int, optional
+        How long a connection waits for a lock held by another
+        connection before giving up.
+    autocheckpoint_pages : int, optional
+        Number of WAL pages after which SQLite automatically copies
+        the log back into the main database file.
+    """
+
+    # True for managers whose database only exists in memory
+    in_memory = False
+
+    def __init__(
+        self,
+        db_path: str,
+        busy_timeout_ms: int = BUSY_TIMEOUT_MS,
+        autocheckpoint_pages: int = WAL_AUTOCHECKPOINT_PAGES,
+    ) -> None:
+        self.db_path = db_path
+        self.busy_timeout_ms = busy_timeout_ms
+        self.autocheckpoint_pages = autocheckpoint_pages
+        self._local = threading.local()
+        self._write_lock = threading.RLock()
+        self._registry_lock = threading.Lock()
+        self._connections: List[Tuple[int, sqlite3.Connection]] = []
+
+    def _connect(self, read_only: bool) -> sqlite3.Connection:
+        """Open and configure a new connection.
+
+        Connections are opened in autocommit mode
+        (``isolation_level=None``) so that transactions are only ever
+        started explicitly by :meth:`write_transaction` and
+        :meth:`read_snapshot`. While :mod:`query_trace` is enabled they
+        time every statement.
+        """
+        if read_only:
+            uri = f"file:{quote(os.path.abspath(self.db_path))}?mode=ro"
+            conn = sqlite3.connect(
+                uri,
+                uri=True,
+                timeout=self.busy_timeout_ms / 1000,
+                isolation_level=None,
+                check_same_thread=False,
+                factory=query_trace.connection_factory(),
+            )
+            conn.execute("PRAGMA query_only = ON")
+        else:
+            conn = sqlite3.connect(
+                self.db_path,
+                timeout=self.busy_timeout_ms / 1000,
+                isolation_level=None,
+                check_same_thread=False,
+                factory=query_trace.connection_factory(),
+            )
+            conn.execute("PRAGMA journal_mode = WAL")
+            # NORMAL is durable across application crashes in WAL mode
+            # and avoids an fsync on every commit.
+            conn.execute("PRAGMA synchronous = NORMAL")
+            conn.execute(f"PRAGMA wal_autocheckpoint = {int(self.autocheckpoint_pages)}")
+        conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout_ms)}")
+
+        with self._registry_lock:
+            self._connections.append((threading.get_ident(), conn))
+        return conn
+
+    def writer(self) -> sqlite3.Connection:
+        """Return this thread's read-write connection.
+
+        Returns
+        -------
+        sqlite3.Connection
+            A connection that is reused for every call made from the
+            current thread.
+        """
+        conn = getattr(self._local, "writer", None)
+        if conn is None:
+            conn = self._connect(read_only=False)
+            self._local.writer = conn
+        return conn
+
+    def reader(self) -> sqlite3.Connection:
+        """Return this thread's read-only connection.
+
+        The database file must already exist, which is the case once
+        :func:`db_utils.setup_database` has run.
+
+        Returns
+        -------
+        sqlite3.Connection
+            A connection opened with ``mode=ro`` that cannot modify
+            the database.
+        """
+        conn = getattr(self._local, "reader", None)
+        if conn is None:
+            conn = self._connect(read_only=True)
+            self._local.reader = conn
+        return conn
+
+    @contextmanager
+    def write_transaction(self) -> Iterator[sqlite3.Connection]:
+        """Run a block of statements as a single write transaction.
+
+        The transaction is started with ``BEGIN IMMEDIATE`` so the
+        write lock is taken up front; it is committed when the block
+        exits normally and rolled back if it raises.
+
+        Yields
+        ------
+        sqlite3.Connection
+            This thread's read-write connection.
+        """
+        with self._write_lock:
+            conn = self.writer()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            with metrics.timer("commit"):
+                conn.execute("COMMIT")
+
+    @contextmanager
+    def read_snapshot(self) -> Iterator[sqlite3.Connection]:
+        """Run several queries against one consistent snapshot.
+
+        Inside the block every query sees the database as it was at
+        the first read, even if a writer commits in the meantime.
+
+        Yields
+        ------
+        sqlite3.Connection
+            This thread's read-only connection.
+        """
+        conn = self.reader()
+        conn.execute("BEGIN")
+        try:
+            yield conn
+        finally:
+            conn.execute("COMMIT")
+
+    def checkpoint(self, mode: str = "PASSIVE") -> Tuple[int, int, int]:
+        """Copy the write-ahead log back into the main database file.
+
+        Parameters
+        ----------
+        mode : str, optional
+            One of ``"PASSIVE"``, ``"FULL"``, ``"RESTART"`` or
+            ``"TRUNCATE"``. ``PASSIVE`` never waits for readers;
+            ``TRUNCATE`` also resets the log file to zero bytes when
+            no reader is using it.
+
+        Returns
+        -------
+        tuple of (int, int, int)
+            SQLite's ``(busy, log_pages, checkpointed_pages)`` result.
+        """
+        if mode.upper() not in {"PASSIVE", "FULL", "RESTART", "TRUNCATE"}:
+            raise ValueError(f"Unknown checkpoint mode: {mode!r}")
+        with self._write_lock:
+            row = self.writer().execute(f"PRAGMA wal_checkpoint({mode.upper()})").fetchone()
+        return tuple(row)
+
+    def close_thread(self) -> None:
+        """Close the connections owned by the calling thread."""
+        ident = threading.get_ident()
+        for name in ("writer", "reader"):
+            if getattr(self._local, name, None) is not None:
+                setattr(self._local, name, None)
+        with self._registry_lock:
+            mine = [conn for owner, conn in self._connections if owner == ident]
+            self._connections = [(o, c) for o, c in self._connections if o != ident]
+        for conn in mine:
+            conn.close()
+
+    def close_all(self) -> None:
+        """Close every connection handed out by this manager."""
+        with self._registry_lock:
+            connections = [conn for _, conn in self._connections]
+            self._connections = []
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
+
+
+_memory_names = itertools.count(1)
+
+
+class MemoryConnectionManager(ConnectionManager):
+    """Hand out per-thread connections to a shared in-memory database.
+
+    All connections of the manager open the same named ``:memory:``
+    database in shared-cache mode, so the threads of one process see
+    the same tunes and no query or insert touches the disk. The
+    database is kept alive by an extra connection until
+    :meth:`close_all`.
+
+    :meth:`warm_load` copies a database file into memory and
+    :meth:`persist` writes the memory database back to a file, both
+    with the SQLite backup API.
+
+    Parameters
+    ----------
+    db_path : str
+        File the database is warm-loaded from and persisted to by
+        default; it is not opened otherwise.
+    busy_timeout_ms : int, optional
+        As for :class:`ConnectionManager`.
+
+    Notes
+    -----
+    Shared-cache connections lock whole tables instead of using a
+    write-ahead log, so readers are opened with ``read_uncommitted``
+    to avoid failing while a write transaction is open; unlike in the
+    file-backed mode they may see rows of a transaction that has not
+    committed yet.
+    """
+
+    in_memory = True
+
+    def __init__(self, db_path: str, busy_timeout_ms: int = BUSY_TIMEOUT_MS) -> None:
+        super().__init__(db_path, busy_timeout_ms)
+        self.uri = f"file:tunes-memory-{os.getpid()}-{next(_memory_names)}?mode=memory&cache=shared"
+        self._anchor = sqlite3.connect(self.uri, uri=True, isolation_level=None, check_same_thread=False)
+        self.loaded_generation = self.generation()
+
+    def generation(self) -> int | None:
+        """Return the ingest generation of the memory database.
+
+        Returns
+        -------
+        int or None
+            ``None`` until the schema has been created.
+        """
+        try:
+            row = self._anchor.execute("SELECT generation FROM ingest_state WHERE id = 1").fetchone()
+        except sqlite3.OperationalError:
+            return None
+        return row[0] if row else None
+
+    def _connect(self, read_only: bool) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.uri,
+            uri=True,
+            timeout=self.busy_timeout_ms / 1000,
+            isolation_level=None,
+            check_same_thread=False,
+            factory=query_trace.connection_factory(),
+        )
+        if read_only:
+            conn.execute("PRAGMA query_only = ON")
+            conn.execute("PRAGMA read_uncommitted = ON")
+        conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout_ms)}")
+        with self._registry_lock:
+            self._connections.append((threading.get_ident(), conn))
+        return conn
+
+    def checkpoint(self, mode: str = "PASSIVE") -> Tuple[int, int, int]:
+        """Do nothing: an in-memory database has no write-ahead log."""
+        if mode.upper() not in {"PASSIVE", "FULL", "RESTART", "TRUNCATE"}:
+            raise ValueError(f"Unknown checkpoint mode: {mode!r}")
+        return (0, 0, 0)
+
+    def warm_load(self, path: str | None = None) -> bool:
+        """Replace the memory database with a copy of a database file.
+
+        Parameters
+        ----------
+        path : str or None, optional
+            File to load. If ``None``, :attr:`db_path` is used.
+
+        Returns
+        -------
+        bool
+            ``False`` if the file does not exist and nothing was loaded.
+        """
+        path = self.db_path if path is None else path
+        if not os.path.exists(path):
+            return False
+        source = sqlite3.connect(f"file:{quote(os.path.abspath(path))}?mode=ro", uri=True)
+        try:
+            with self._write_lock:
+                source.backup(self.writer())
+        finally:
+            source.close()
+        self.loaded_generation = self.generation()
+        return True
+
+    def persist(self, path: str | None = None) -> None:
+        """Write the memory database to a file, replacing it atomically.
+
+        The copy is made in a temporary file next to ``path`` and then
+        renamed over it, so the file is never seen half written. The
+        target must not be open elsewhere at the time.
+
+        Parameters
+        ----------
+        path : str or None, optional
+            Destination file. If ``None``, :attr:`db_path` is used.
+        """
+        path = self.db_path if path is None else path
+        tmp_path = f"{path}.tmp"
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        target = sqlite3.connect(tmp_path)
+        try:
+            with self._write_lock:
+                self.writer().backup(target)
+        finally:
+            target.close()
+        # A log left by an earlier file-backed session would be replayed
+        # into the new file
+        for suffix in ("-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+        os.replace(tmp_path, path)
+        if path == self.db_path:
+            self.loaded_generation = self.generation()
+
+    def close_all(self) -> None:
+        """Close every connection; the memory database is discarded."""
+        super().close_all()
+        self._anchor.close()
+
+
+def _persist_at_exit(manager: MemoryConnectionManager) -> None:
+    """Persist the memory database if anything was ingested into it."""
+    try:
+        generation = manager.generation()
+        if generation is not None and generation != manager.loaded_generation:
+            manager.persist()
+    except sqlite3.ProgrammingError:
+        # close_all() already discarded the database
+        pass
+
+
+_managers: Dict[str, ConnectionManager] = {}
+_managers_lock = threading.Lock()
+
+
+def get_manager(db_path: str | None = None) -> ConnectionManager:
+    """Return the shared :class:`ConnectionManager` for a database.
+
+    When :data:`config.DB_IN_MEMORY` is set, the manager for
+    :data:`config.DB_PATH` is a :class:`MemoryConnectionManager`,
+    warm-loaded from the file and persisted back to it at exit as
+    :data:`config.DB_MEMORY_WARM_LOAD` and
+    :data:`config.DB_MEMORY_PERSIST` say.
+
+    Parameters
+    ----------
+    db_path : str or None, optional
+        Path to the database file. If ``None``, :data:`config.DB_PATH`
+        is used.
+
+    Returns
+    -------
+    ConnectionManager
+        The same manager instance for every call with the same path.
+    """
+    if db_path is None:
+        db_path = DB_PATH
+    key = os.path.abspath(db_path)
+    with _managers_lock:
+        manager = _managers.get(key)
+        if manager is None:
+            if DB_IN_MEMORY and key == os.path.abspath(DB_PATH):
+                manager = MemoryConnectionManager(db_path)
+                if DB_MEMORY_WARM_LOAD:
+                    manager.warm_load()
+                if DB_MEMORY_PERSIST:
+                    atexit.register(_persist_at_exit, manager)
+            else:
+                manager = ConnectionManager(db_path)
+            _managers[key] = manager
+    return manager
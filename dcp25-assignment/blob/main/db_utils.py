@@ -2,26 +2,236 @@
 
 This module contains functions responsible for creating the SQLite
 schema, inserting tunes and loading them back into pandas
-DataFrames.
+DataFrames. All connections come from the shared
+:class:`db_connection.ConnectionManager`, so queries run on
+read-only connections and inserts run inside write transactions.
+
+pandas and NumPy are only imported by the functions that return
+DataFrames or cubes, so callers that stick to the plain ``sqlite3``
+helpers (listings, lookups and aggregate counts) start without them.
 """
 
 from __future__ import annotations
 
-from typing import Dict, List
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+import bisect
+import os
 import sqlite3
+import time
+
+from abc_parser import (
+    ARCHIVE_MEMBER_SEPARATOR,
+    decode_abc_bytes,
+    find_abc_archives,
+    is_abc_archive,
+    iter_abc_files,
+    iter_archive_members,
+    parse_abc_text,
+)
+from config import ABC_ROOT, CUBE_PATH, INGEST_BATCH_FILES, PAGE_SIZE, SNAPSHOT_PATH
+from db_connection import get_manager
+from frame_snapshot import load_frame_snapshot, remove_frame_snapshot, save_frame_snapshot, snapshot_key
+import metrics
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+    from tune_cube import TuneCube
+
+
+_INSERT_TUNE_SQL = """
+    INSERT INTO tunes (
+        book_number,
+        file_name,
+        reference_number,
+        title,
+        meter,
+        key_signature,
+        rhythm,
+        raw_abc,
+        source_path
+    )
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+# Columns added after the original schema, created on existing
+# databases by setup_database() with ALTER TABLE.
+_ADDED_TUNE_COLUMNS = {
+    "rhythm": "TEXT",
+    "source_path": "TEXT",
+    "cluster_id": "INTEGER",
+}
+
+# Dimensions kept in the tune_aggregates table. NULLs are stored as
+# -1 (book_number) or '' (text columns) so that every combination has
+# exactly one row under the primary key.
+AGGREGATE_DIMENSIONS = ("book_number", "key_signature", "meter", "rhythm")
 
-import pandas as pd
+_AGGREGATE_KEY = {
+    "NEW": "IFNULL(NEW.book_number, -1), IFNULL(NEW.key_signature, ''), "
+    "IFNULL(NEW.meter, ''), IFNULL(NEW.rhythm, '')",
+    "OLD": "IFNULL(OLD.book_number, -1), IFNULL(OLD.key_signature, ''), "
+    "IFNULL(OLD.meter, ''), IFNULL(OLD.rhythm, '')",
+}
 
-from config import DB_PATH
-from abc_parser import find_abc_files, parse_abc_file
+
+# Sort expressions for list_tunes(), each backed by an index on
+# (expression, id) created in setup_database(). NULLs are folded into
+# a value so that keyset comparisons never see them.
+ORDER_KEYS = {
+    "title": "IFNULL(title, '') COLLATE NOCASE",
+    "book": "IFNULL(book_number, -1)",
+    "key": "IFNULL(key_signature, '')",
+}
+
+# Columns returned by list_tunes()
+LISTING_COLUMNS = ("id", "title", "book_number", "key_signature", "meter")
+
+# Every column of the tunes table, in table order
+TUNE_COLUMNS = (
+    "id",
+    "book_number",
+    "file_name",
+    "reference_number",
+    "title",
+    "meter",
+    "key_signature",
+    "raw_abc",
+    "rhythm",
+    "source_path",
+    "cluster_id",
+)
+
+
+def _aggregate_match(row: str) -> str:
+    """Return the ``WHERE`` clause matching the aggregate row of NEW/OLD."""
+    return (
+        f"book_number = IFNULL({row}.book_number, -1) "
+        f"AND key_signature = IFNULL({row}.key_signature, '') "
+        f"AND meter = IFNULL({row}.meter, '') "
+        f"AND rhythm = IFNULL({row}.rhythm, '')"
+    )
+
+
+def _aggregate_add(row: str) -> str:
+    """Return trigger statements counting the NEW/OLD row in."""
+    return f"""
+        INSERT OR IGNORE INTO tune_aggregates
+            (book_number, key_signature, meter, rhythm, tune_count)
+            VALUES ({_AGGREGATE_KEY[row]}, 0);
+        UPDATE tune_aggregates SET tune_count = tune_count + 1
+            WHERE {_aggregate_match(row)};
+    """
 
 
-def setup_database() -> None:
+def _aggregate_remove(row: str) -> str:
+    """Return trigger statements counting the NEW/OLD row out."""
+    return f"""
+        UPDATE tune_aggregates SET tune_count = tune_count - 1
+            WHERE {_aggregate_match(row)};
+        DELETE FROM tune_aggregates
+            WHERE {_aggregate_match(row)} AND tune_count <= 0;
+    """
+
+
+def _tune_row(tune_data: Dict) -> Tuple:
+    """Convert a tune dictionary into an ``INSERT`` parameter tuple."""
+    return (
+        tune_data.get("book_number"),
+        tune_data.get("file_name", ""),
+        tune_data.get("reference_number", ""),
+        tune_data.get("title", "Unknown Title"),
+        tune_data.get("meter", ""),
+        tune_data.get("key_signature", ""),
+        tune_data.get("rhythm", ""),
+        tune_data.get("raw_abc", ""),
+        tune_data.get("source_path"),
+    )
+
+
+def _setup_aggregates(conn: sqlite3.Connection) -> None:
+    """Create the ``tune_aggregates`` table and its maintenance triggers.
+
+    The table holds one row per (book, key, meter, rhythm) combination
+    with the number of tunes in it. Triggers on ``tunes`` keep it
+    correct for every insert, update and delete, so per-dimension
+    counts and cross-tabs are a ``GROUP BY`` over the (small) set of
+    combinations instead of a scan of every tune. A database created
+    before the table existed is backfilled once.
+    """
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'tune_aggregates'"
+    ).fetchone()
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS tune_aggregates (
+            book_number INTEGER NOT NULL,
+            key_signature TEXT NOT NULL,
+            meter TEXT NOT NULL,
+            rhythm TEXT NOT NULL,
+            tune_count INTEGER NOT NULL,
+            PRIMARY KEY (book_number, key_signature, meter, rhythm)
+        ) WITHOUT ROWID
+        """
+    )
+    if not exists:
+        conn.execute(
+            """
+            INSERT INTO tune_aggregates
+                (book_number, key_signature, meter, rhythm, tune_count)
+            SELECT IFNULL(book_number, -1), IFNULL(key_signature, ''),
+                   IFNULL(meter, ''), IFNULL(rhythm, ''), COUNT(*)
+            FROM tunes
+            GROUP BY 1, 2, 3, 4
+            """
+        )
+
+    conn.execute(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS tunes_aggregates_insert
+        AFTER INSERT ON tunes
+        BEGIN
+            {_aggregate_add("NEW")}
+        END
+        """
+    )
+    conn.execute(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS tunes_aggregates_delete
+        AFTER DELETE ON tunes
+        BEGIN
+            {_aggregate_remove("OLD")}
+        END
+        """
+    )
+    conn.execute(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS tunes_aggregates_update
+        AFTER UPDATE OF {", ".join(AGGREGATE_DIMENSIONS)} ON tunes
+        BEGIN
+            {_aggregate_remove("OLD")}
+            {_aggregate_add("NEW")}
+        END
+        """
+    )
+
+
+def setup_database(db_path: str | None = None) -> None:
     """Create the ``tunes`` table if it does not already exist.
 
-    This function connects to the SQLite database pointed to by
-    :data:`config.DB_PATH` and issues a ``CREATE TABLE IF NOT EXISTS``
-    statement for the ``tunes`` table.
+    This function uses the writer connection for the database pointed
+    to by :data:`config.DB_PATH`, which also switches the file to WAL
+    mode, and issues a ``CREATE TABLE IF NOT EXISTS`` statement for
+    the ``tunes`` table. Columns added since the table was first
+    created are added to existing databases, and the aggregate tables
+    used by the statistics screens and the ``source_files`` manifest
+    of ingested files are created alongside it.
+
+    Parameters
+    ----------
+    db_path : str or None, optional
+        Database to set up instead of :data:`config.DB_PATH`, e.g. a
+        shard from :mod:`tune_shards`.
 
     Returns
     -------
@@ -29,29 +239,117 @@ def setup_database() -> None:
         The function is executed for its side effect of ensuring the
         table exists; it does not return a value.
     """
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-
-    cursor.execute(
-        """
-        CREATE TABLE IF NOT EXISTS tunes (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            book_number INTEGER,
-            file_name TEXT,
-            reference_number TEXT,
-            title TEXT,
-            meter TEXT,
-            key_signature TEXT,
-            raw_abc TEXT
+    with get_manager(db_path).write_transaction() as conn:
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS tunes (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                book_number INTEGER,
+                file_name TEXT,
+                reference_number TEXT,
+                title TEXT,
+                meter TEXT,
+                key_signature TEXT,
+                rhythm TEXT,
+                raw_abc TEXT,
+                source_path TEXT
+            )
+            """
         )
-        """
-    )
+        existing = {row[1] for row in conn.execute("PRAGMA table_info(tunes)")}
+        for column, declaration in _ADDED_TUNE_COLUMNS.items():
+            if column not in existing:
+                conn.execute(f"ALTER TABLE tunes ADD COLUMN {column} {declaration}")
+        _setup_aggregates(conn)
+        for order_key, expression in ORDER_KEYS.items():
+            conn.execute(
+                f"CREATE INDEX IF NOT EXISTS idx_tunes_order_{order_key} "
+                f"ON tunes ({expression}, id)"
+            )
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS ingest_state (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                generation INTEGER NOT NULL
+            )
+            """
+        )
+        conn.execute("INSERT OR IGNORE INTO ingest_state (id, generation) VALUES (1, 0)")
+        # One row per ingested ABC file, used to find changed files
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS source_files (
+                path TEXT PRIMARY KEY,
+                book_number INTEGER,
+                file_name TEXT,
+                mtime_ns INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                tune_count INTEGER NOT NULL,
+                content_hash TEXT
+            )
+            """
+        )
+        manifest_columns = {row[1] for row in conn.execute("PRAGMA table_info(source_files)")}
+        if "content_hash" not in manifest_columns:
+            conn.execute("ALTER TABLE source_files ADD COLUMN content_hash TEXT")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_tunes_source ON tunes (source_path)")
+        # Duplicate clusters found by tune_clusters.py
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_tunes_cluster ON tunes (cluster_id)")
+        # Progress of the last full load of each root, for resuming
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS ingest_checkpoints (
+                root TEXT PRIMARY KEY,
+                last_path TEXT,
+                files_done INTEGER NOT NULL,
+                tunes_done INTEGER NOT NULL,
+                completed INTEGER NOT NULL,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+
+
+def bump_ingest_generation(conn: sqlite3.Connection) -> None:
+    """Advance the ingest generation inside an open write transaction.
+
+    Every transaction that changes the ``tunes`` table calls this, so
+    the generation changes exactly when readers could see new data.
+
+    Parameters
+    ----------
+    conn : sqlite3.Connection
+        Connection with an open write transaction.
+    """
+    conn.execute("UPDATE ingest_state SET generation = generation + 1 WHERE id = 1")
+
 
-    conn.commit()
-    conn.close()
+def get_ingest_generation(conn: sqlite3.Connection | None = None) -> int:
+    """Return the current ingest generation of the database.
+
+    Parameters
+    ----------
+    conn : sqlite3.Connection or None, optional
+        Connection to read from. If ``None``, this thread's read-only
+        connection is used.
+
+    Returns
+    -------
+    int
+        A counter that increases with every committed ingest
+        transaction, or ``0`` for a freshly created database.
+    """
+    if conn is None:
+        conn = get_manager().reader()
+    try:
+        row = conn.execute("SELECT generation FROM ingest_state WHERE id = 1").fetchone()
+    except sqlite3.OperationalError:
+        # Database created before generations were tracked
+        return 0
+    return row[0] if row else 0
 
 
-def save_tune_to_database(tune_data: Dict) -> None:
+def save_tune_to_database(tune_data: Dict, conn: sqlite3.Connection | None = None) -> None:
     """Insert a single tune into the ``tunes`` table.
 
     Parameters
@@ -59,8 +357,13 @@ def save_tune_to_database(tune_data: Dict) -> None:
     tune_data : dict
         Dictionary describing the tune. Expected keys include
         ``book_number``, ``file_name``, ``reference_number``,
-        ``title``, ``meter``, ``key_signature`` and ``raw_abc``. Any
+        ``title``, ``meter``, ``key_signature``, ``rhythm`` and
+        ``raw_abc``. Any
         missing keys will be replaced with sensible defaults.
+    conn : sqlite3.Connection or None, optional
+        Connection with an open write transaction, as yielded by
+        :meth:`db_connection.ConnectionManager.write_transaction`. If
+        ``None``, the insert runs in a transaction of its own.
 
     Returns
     -------
@@ -68,78 +371,960 @@ def save_tune_to_database(tune_data: Dict) -> None:
         The function is executed for its side effect of inserting a
         row; it does not return a value.
     """
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+    save_tunes_to_database([tune_data], conn)
 
-    cursor.execute(
-        """
-        INSERT INTO tunes (
-            book_number,
-            file_name,
-            reference_number,
-            title,
-            meter,
-            key_signature,
-            raw_abc
+
+def save_tunes_to_database(tunes: Iterable[Dict], conn: sqlite3.Connection | None = None) -> int:
+    """Insert several tunes into the ``tunes`` table in one go.
+
+    Parameters
+    ----------
+    tunes : iterable of dict
+        Tune dictionaries as produced by
+        :func:`abc_parser.parse_abc_file`.
+    conn : sqlite3.Connection or None, optional
+        Connection with an open write transaction. If ``None``, all
+        tunes are inserted in a single transaction of their own, so
+        readers see either none or all of them.
+
+    Returns
+    -------
+    int
+        Number of tunes inserted.
+    """
+    rows = [_tune_row(tune) for tune in tunes]
+    if conn is None:
+        with get_manager().write_transaction() as conn:
+            conn.executemany(_INSERT_TUNE_SQL, rows)
+            bump_ingest_generation(conn)
+    else:
+        conn.executemany(_INSERT_TUNE_SQL, rows)
+        bump_ingest_generation(conn)
+    return len(rows)
+
+
+def _delete_file_tunes(conn: sqlite3.Connection, path: str, book_number: int, file_name: str) -> int:
+    """Delete the tunes that came from one file; return how many."""
+    removed = conn.execute("DELETE FROM tunes WHERE source_path = ?", (path,)).rowcount
+    if ARCHIVE_MEMBER_SEPARATOR in path:
+        return removed
+    # Tunes loaded from disk before source paths were recorded
+    removed += conn.execute(
+        "DELETE FROM tunes WHERE source_path IS NULL AND book_number = ? AND file_name = ?",
+        (book_number, file_name),
+    ).rowcount
+    return removed
+
+
+def ingest_abc_text(
+    text: str,
+    book_number: int,
+    file_name: str,
+    source_path: str,
+    conn: sqlite3.Connection,
+    replace: bool = False,
+    mtime_ns: int = 0,
+    size: int = 0,
+    content_hash: str | None = None,
+) -> int:
+    """Parse ABC text, insert its tunes and record it in the manifest.
+
+    Parameters
+    ----------
+    text : str
+        Contents of one ABC file or archive member.
+    book_number : int
+        Book the file belongs to.
+    file_name : str
+        Base name of the file.
+    source_path : str
+        Path of the file, or ``archive!member`` for an archive member;
+        stored with each tune and used as the manifest key.
+    conn : sqlite3.Connection
+        Connection with an open write transaction.
+    replace : bool, optional
+        If ``True``, the tunes previously loaded from this source are
+        deleted first, so re-ingesting a changed file does not
+        duplicate them.
+    mtime_ns, size : int, optional
+        Modification time and size recorded in the manifest.
+    content_hash : str or None, optional
+        Hash of the contents recorded in the manifest.
+
+    Returns
+    -------
+    int
+        Number of tunes inserted.
+    """
+    with metrics.timer("parse") as timing:
+        tunes = parse_abc_text(text, book_number, file_name)
+        if timing is not None:
+            timing.items = len(tunes)
+    for tune in tunes:
+        tune["source_path"] = source_path
+    with metrics.timer("sql", items=len(tunes)):
+        if replace:
+            _delete_file_tunes(conn, source_path, book_number, file_name)
+        save_tunes_to_database(tunes, conn)
+        conn.execute(
+            "INSERT OR REPLACE INTO source_files "
+            "(path, book_number, file_name, mtime_ns, size, tune_count, content_hash) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (source_path, book_number, file_name, mtime_ns, size, len(tunes), content_hash),
         )
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-        """,
-        (
-            tune_data.get("book_number"),
-            tune_data.get("file_name", ""),
-            tune_data.get("reference_number", ""),
-            tune_data.get("title", "Unknown Title"),
-            tune_data.get("meter", ""),
-            tune_data.get("key_signature", ""),
-            tune_data.get("raw_abc", ""),
-        ),
+    metrics.count("files")
+    metrics.count("tunes", len(tunes))
+    return len(tunes)
+
+
+def ingest_abc_file(
+    book_number: int,
+    file_name: str,
+    file_path: str,
+    conn: sqlite3.Connection,
+    replace: bool = False,
+) -> int:
+    """Parse one ABC file, insert its tunes and record it in the manifest.
+
+    Parameters
+    ----------
+    book_number : int
+        Book the file belongs to.
+    file_name : str
+        Base name of the file.
+    file_path : str
+        Full path of the file; stored with each tune as
+        ``source_path``.
+    conn : sqlite3.Connection
+        Connection with an open write transaction.
+    replace : bool, optional
+        As for :func:`ingest_abc_text`.
+
+    Returns
+    -------
+    int
+        Number of tunes inserted.
+    """
+    # Stat before reading, so a save made meanwhile is seen as a
+    # further change next time
+    stat = os.stat(file_path)
+    with metrics.timer("read", nbytes=stat.st_size):
+        with open(file_path, "rb") as f:
+            data = f.read()
+    with metrics.timer("decode", nbytes=len(data)):
+        text = decode_abc_bytes(data)
+    metrics.count("bytes", len(data))
+    return ingest_abc_text(
+        text, book_number, file_name, file_path, conn, replace, stat.st_mtime_ns, stat.st_size
     )
 
-    conn.commit()
-    conn.close()
 
+def ingest_abc_archive(archive_path: str) -> Dict[str, int]:
+    """Load the ABC members of a zip or tar archive, incrementally.
+
+    Members are streamed out of the archive, never extracted to disk.
+    Each is compared by SHA-256 with the hash recorded in the
+    manifest: unchanged members are skipped, new and changed ones are
+    (re-)ingested in a transaction of their own, and members that have
+    disappeared from the archive have their tunes deleted.
+
+    Parameters
+    ----------
+    archive_path : str
+        Path of the archive.
+
+    Returns
+    -------
+    dict
+        Counts of ``added``, ``changed``, ``unchanged`` and
+        ``removed`` members and of ``tunes_inserted``.
+    """
+    prefix = f"{archive_path}{ARCHIVE_MEMBER_SEPARATOR}"
+    known = {
+        path: (book_number, file_name, content_hash)
+        for path, book_number, file_name, content_hash in get_manager().reader().execute(
+            "SELECT path, book_number, file_name, content_hash FROM source_files "
+            "WHERE substr(path, 1, ?) = ?",
+            (len(prefix), prefix),
+        )
+    }
+    summary = {"added": 0, "changed": 0, "unchanged": 0, "removed": 0, "tunes_inserted": 0}
+    manager = get_manager()
+    seen = set()
+    for member in iter_archive_members(archive_path):
+        path = member["source_path"]
+        seen.add(path)
+        previous = known.get(path)
+        if previous is not None and previous[2] == member["sha256"]:
+            summary["unchanged"] += 1
+            continue
+        metrics.count("bytes", member["size"])
+        with metrics.timer("decode", nbytes=member["size"]):
+            text = decode_abc_bytes(member["data"])
+        with manager.write_transaction() as conn:
+            summary["tunes_inserted"] += ingest_abc_text(
+                text,
+                member["book_number"],
+                member["file_name"],
+                path,
+                conn,
+                replace=previous is not None,
+                mtime_ns=member["mtime_ns"],
+                size=member["size"],
+                content_hash=member["sha256"],
+            )
+        summary["changed" if previous is not None else "added"] += 1
+    for path, (book_number, file_name, _) in known.items():
+        if path not in seen:
+            with manager.write_transaction() as conn:
+                remove_abc_file(book_number, file_name, path, conn)
+            summary["removed"] += 1
+    return summary
+
+
+def remove_abc_file(book_number: int, file_name: str, file_path: str, conn: sqlite3.Connection) -> int:
+    """Delete the tunes of a file that no longer exists.
 
-def load_all_abc_data() -> int:
+    Parameters
+    ----------
+    book_number, file_name, file_path
+        As for :func:`ingest_abc_file`.
+    conn : sqlite3.Connection
+        Connection with an open write transaction.
+
+    Returns
+    -------
+    int
+        Number of tunes deleted.
+    """
+    removed = _delete_file_tunes(conn, file_path, book_number, file_name)
+    conn.execute("DELETE FROM source_files WHERE path = ?", (file_path,))
+    bump_ingest_generation(conn)
+    return removed
+
+
+def save_cluster_ids(assignments: Iterable[Tuple[int, int]], db_path: str | None = None) -> int:
+    """Store the duplicate cluster of each tune.
+
+    Parameters
+    ----------
+    assignments : iterable of tuple of (int, int)
+        ``(tune_id, cluster_id)`` pairs, see :mod:`tune_clusters`.
+        Tunes not listed keep their current cluster.
+    db_path : str or None, optional
+        Database to write instead of :data:`config.DB_PATH`.
+
+    Returns
+    -------
+    int
+        Number of tunes updated.
+    """
+    rows = [(cluster_id, tune_id) for tune_id, cluster_id in assignments]
+    if not rows:
+        return 0
+    with get_manager(db_path).write_transaction() as conn:
+        conn.executemany("UPDATE tunes SET cluster_id = ? WHERE id = ?", rows)
+        bump_ingest_generation(conn)
+    return len(rows)
+
+
+def load_source_manifest(db_path: str | None = None) -> Dict[str, Tuple[int, int]]:
+    """Return the recorded ``(mtime_ns, size)`` of every ingested file.
+
+    Archive members are left out; :func:`ingest_abc_archive` tracks
+    them by content hash instead.
+
+    Parameters
+    ----------
+    db_path : str or None, optional
+        Database to read instead of :data:`config.DB_PATH`.
+
+    Returns
+    -------
+    dict of str to tuple of (int, int)
+        Keyed by file path; empty if nothing has been ingested yet.
+    """
+    try:
+        rows = get_manager(db_path).reader().execute(
+            "SELECT path, mtime_ns, size FROM source_files WHERE content_hash IS NULL"
+        ).fetchall()
+    except sqlite3.OperationalError:
+        return {}
+    return {path: (mtime_ns, size) for path, mtime_ns, size in rows}
+
+
+def invalidate_derived_data() -> None:
+    """Drop the data derived from the ``tunes`` table after changes.
+
+    Checkpoints the write-ahead log and deletes the saved count cube
+    and DataFrame snapshot. Both are keyed on the ingest generation, so
+    the next reader that needs one rebuilds it (see
+    :func:`tune_analysis.load_tune_cube` and
+    :func:`load_tunes_from_database`), and saving one file does not
+    pay for a pass over the whole corpus. The aggregate tables are
+    kept up to date by triggers.
+    """
+    manager = get_manager()
+    manager.checkpoint("PASSIVE")
+    if not manager.in_memory:
+        remove_frame_snapshot(CUBE_PATH)
+        remove_frame_snapshot(SNAPSHOT_PATH)
+
+
+def load_ingest_checkpoint(root_dir: str | None = None) -> Dict | None:
+    """Return the checkpoint of the last full load of ``root_dir``.
+
+    Parameters
+    ----------
+    root_dir : str or None, optional
+        Root passed to :func:`ingest_abc_tree`. If ``None``,
+        :data:`config.ABC_ROOT` is used.
+
+    Returns
+    -------
+    dict or None
+        Keys ``root``, ``last_path`` (last file committed),
+        ``files_done``, ``tunes_done``, ``completed`` and
+        ``updated_at``, or ``None`` if the root was never loaded.
+    """
+    root = os.path.abspath(root_dir if root_dir is not None else ABC_ROOT)
+    try:
+        row = get_manager().reader().execute(
+            "SELECT root, last_path, files_done, tunes_done, completed, updated_at "
+            "FROM ingest_checkpoints WHERE root = ?",
+            (root,),
+        ).fetchone()
+    except sqlite3.OperationalError:
+        return None
+    if row is None:
+        return None
+    keys = ("root", "last_path", "files_done", "tunes_done", "completed", "updated_at")
+    checkpoint = dict(zip(keys, row))
+    checkpoint["completed"] = bool(checkpoint["completed"])
+    return checkpoint
+
+
+def _save_ingest_checkpoint(
+    conn: sqlite3.Connection,
+    root: str,
+    last_path: str | None,
+    files_done: int,
+    tunes_done: int,
+    completed: bool = False,
+) -> None:
+    conn.execute(
+        "INSERT OR REPLACE INTO ingest_checkpoints "
+        "(root, last_path, files_done, tunes_done, completed, updated_at) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        (root, last_path, files_done, tunes_done, int(completed), time.time()),
+    )
+
+
+def ingest_abc_tree(
+    root_dir: str | None = None,
+    resume: bool = True,
+    batch_files: int = INGEST_BATCH_FILES,
+    progress: Callable[[int, int, str], None] | None = None,
+) -> Dict[str, int]:
+    """Load every ABC file and archive under a root, resumably.
+
+    Files are ingested in path order, ``batch_files`` per transaction.
+    Each transaction also records the last file it contains in the
+    ``ingest_checkpoints`` table, so a load that dies part way through
+    (killed, out of memory, a file that fails to parse) leaves whole
+    batches behind and a checkpoint that matches them. The next call
+    skips the files up to that checkpoint and carries on from there.
+
+    Files whose modification time and size match the ``source_files``
+    manifest are skipped, so loading a root that was already loaded
+    keeps the tunes (and their ids and clusters) of unchanged files and
+    only bumps the ingest generation if something did change. Every
+    other file replaces the tunes previously loaded from it, so the
+    batch that was in flight when a load died does not duplicate
+    tunes. Archives are ingested afterwards by
+    :func:`ingest_abc_archive`, which commits per member and skips
+    unchanged members, so they resume as well.
+
+    Parameters
+    ----------
+    root_dir : str or None, optional
+        As for :func:`load_all_abc_data`.
+    resume : bool, optional
+        If ``False``, ignore an unfinished checkpoint and check every
+        file of the root against the manifest again.
+    batch_files : int, optional
+        Number of files committed per transaction.
+    progress : callable or None, optional
+        Called as ``progress(done, total, description)`` after each
+        file or archive.
+
+    Returns
+    -------
+    dict
+        ``files`` and ``archives`` processed by this call,
+        ``files_skipped`` (already committed by an earlier, interrupted
+        call, or unchanged since they were loaded), ``tunes_inserted``
+        by this call and ``tunes_total`` including the tunes from the
+        skipped files.
+    """
+    if root_dir is None:
+        root_dir = ABC_ROOT
+    with metrics.timer("ingest"):
+        return _ingest_abc_tree(root_dir, resume, batch_files, progress)
+
+
+def _ingest_abc_tree(
+    root_dir: str,
+    resume: bool,
+    batch_files: int,
+    progress: Callable[[int, int, str], None] | None,
+) -> Dict[str, int]:
+    """Body of :func:`ingest_abc_tree`, timed as the ``ingest`` stage."""
+    root = os.path.abspath(root_dir)
+    with metrics.timer("walk") as timing:
+        files = [] if is_abc_archive(root_dir) else sorted(iter_abc_files(root_dir), key=lambda f: f[2])
+        archives = find_abc_archives(root_dir)
+        if timing is not None:
+            timing.items = len(files) + len(archives)
+    total = len(files) + len(archives)
+
+    checkpoint = load_ingest_checkpoint(root_dir)
+    last_path, files_done, tunes_done = None, 0, 0
+    if resume and checkpoint is not None and not checkpoint["completed"]:
+        last_path = checkpoint["last_path"]
+        files_done, tunes_done = checkpoint["files_done"], checkpoint["tunes_done"]
+    skipped = 0
+    if last_path is not None:
+        skipped = bisect.bisect_right([f[2] for f in files], last_path)
+        files = files[skipped:]
+
+    manager = get_manager()
+    # Files unchanged since they were loaded keep their tunes; they
+    # count as done, with the tunes recorded for them
+    recorded = {
+        path: (mtime_ns, size, tune_count)
+        for path, mtime_ns, size, tune_count in manager.reader().execute(
+            "SELECT path, mtime_ns, size, tune_count FROM source_files WHERE content_hash IS NULL"
+        )
+    }
+    changed = []
+    for entry in files:
+        stat = os.stat(entry[2])
+        previous = recorded.get(entry[2])
+        if previous is not None and previous[:2] == (stat.st_mtime_ns, stat.st_size):
+            skipped += 1
+            files_done += 1
+            tunes_done += previous[2]
+        else:
+            changed.append(entry)
+    if progress is not None and len(changed) < len(files):
+        progress(skipped, total, f"{len(files) - len(changed)} unchanged files skipped")
+    files = changed
+
+    summary = {"files": 0, "archives": 0, "files_skipped": skipped, "tunes_inserted": 0}
+    with manager.write_transaction() as conn:
+        _save_ingest_checkpoint(conn, root, last_path, files_done, tunes_done)
+    for start in range(0, len(files), batch_files):
+        batch = files[start:start + batch_files]
+        inserted = 0
+        with manager.write_transaction() as conn:
+            for book_number, file_name, file_path in batch:
+                inserted += ingest_abc_file(book_number, file_name, file_path, conn, replace=True)
+                if progress is not None:
+                    progress(skipped + summary["files"] + 1, total, f"Book {book_number}: {file_name}")
+                summary["files"] += 1
+            files_done += len(batch)
+            tunes_done += inserted
+            _save_ingest_checkpoint(conn, root, batch[-1][2], files_done, tunes_done)
+        summary["tunes_inserted"] += inserted
+
+    for archive_path in archives:
+        inserted = ingest_abc_archive(archive_path)["tunes_inserted"]
+        summary["archives"] += 1
+        summary["tunes_inserted"] += inserted
+        tunes_done += inserted
+        if progress is not None:
+            progress(skipped + summary["files"] + summary["archives"], total,
+                     f"Archive {os.path.basename(archive_path)}")
+
+    with manager.write_transaction() as conn:
+        _save_ingest_checkpoint(conn, root, last_path if not files else files[-1][2],
+                                files_done, tunes_done, completed=True)
+    summary["tunes_total"] = tunes_done
+    return summary
+
+
+def load_all_abc_data(root_dir: str | None = None, resume: bool = True) -> int:
     """Parse all ABC files and load them into the database.
 
-    The function ensures the database schema exists, walks the
-    ``abc_books`` tree, parses each ABC file into tune dictionaries
-    and inserts them into the ``tunes`` table.
+    The function ensures the database schema exists and loads every
+    ABC file and archive under the root with :func:`ingest_abc_tree`:
+    files are committed in batches together with a checkpoint, so UI
+    sessions reading at the same time see whole files, and a load that
+    was interrupted picks up where it stopped when run again. The
+    write-ahead log is checkpointed, and the count cube and DataFrame
+    snapshot rebuilt, once the load has finished.
+
+    Parameters
+    ----------
+    root_dir : str or None, optional
+        Directory holding the numbered book folders, and possibly zip
+        or tar archives of books, or the path of one such archive. If
+        ``None``, :data:`config.ABC_ROOT` is used.
+    resume : bool, optional
+        If ``False``, start from the first file even when an earlier
+        load of the same root did not finish.
 
     Returns
     -------
     int
-        Total number of tunes successfully inserted into the
-        database.
+        Total number of tunes loaded from the root, including those
+        committed by an interrupted earlier load that was resumed.
     """
     setup_database()
 
-    total_tunes = 0
     print("Starting ABC file processing...")
+    checkpoint = load_ingest_checkpoint(root_dir)
+    if resume and checkpoint is not None and not checkpoint["completed"]:
+        print(f"Resuming after {checkpoint['files_done']} files ({checkpoint['last_path']})")
+
+    def report(done: int, total: int, description: str) -> None:
+        print(f"[{done}/{total}] {description}")
 
-    for book_number, file_name, file_path in find_abc_files():
-        print(f"Processing book {book_number}: {file_name}...")
-        tunes = parse_abc_file(file_path, book_number, file_name)
-        for tune in tunes:
-            save_tune_to_database(tune)
-        total_tunes += len(tunes)
-        print(f"  Inserted {len(tunes)} tunes")
+    summary = ingest_abc_tree(root_dir, resume, progress=report)
 
+    manager = get_manager()
+    with metrics.timer("wal_checkpoint"):
+        manager.checkpoint("TRUNCATE")
+    with metrics.timer("cube"):
+        rebuild_tune_cube()
+    if not manager.in_memory:
+        with metrics.timer("snapshot"):
+            load_tunes_from_database(use_snapshot=False)
+    total_tunes = summary["tunes_total"]
     print(f"\nCompleted! Processed {total_tunes} total tunes.")
+    if metrics.enabled():
+        print(metrics.format_report())
     return total_tunes
 
 
-def load_tunes_from_database() -> pd.DataFrame:
+@metrics.timed("db.load_tunes_from_database")
+def load_tunes_from_database(use_snapshot: bool = True) -> pd.DataFrame:
     """Load all tunes from the SQLite database into a DataFrame.
 
+    The query runs on this thread's read-only connection, so it never
+    blocks (and is never blocked by) a loader writing at the same
+    time; it sees every file committed before the query started.
+
+    When the snapshot at :data:`config.SNAPSHOT_PATH` was written for
+    the same database file, modification time and ingest generation it
+    is loaded instead of querying the ``tunes`` table. Otherwise the
+    frame is read from SQLite and the snapshot rewritten, so only the
+    first session after a change pays for ``read_sql``. An in-memory
+    database (:data:`config.DB_IN_MEMORY`) is always read directly and
+    leaves the snapshot alone.
+
+    Parameters
+    ----------
+    use_snapshot : bool, optional
+        If ``False``, always read from SQLite; the snapshot is still
+        rewritten.
+
     Returns
     -------
     pandas.DataFrame
         A DataFrame containing one row per tune with the columns
-        defined by the ``tunes`` table.
+        defined by the ``tunes`` table. The ingest generation the rows
+        belong to is stored in ``df.attrs["ingest_generation"]`` and
+        is used by :mod:`query_cache` to key cached results.
     """
-    conn = sqlite3.connect(DB_PATH)
+    import pandas as pd
+
+    manager = get_manager()
     query = "SELECT * FROM tunes"
-    df = pd.read_sql(query, conn)
-    conn.close()
+    with manager.read_snapshot() as conn:
+        generation = get_ingest_generation(conn)
+        if manager.in_memory:
+            df = pd.read_sql(query, conn)
+            df.attrs["ingest_generation"] = generation
+            return df
+        key = snapshot_key(manager.db_path, generation)
+        if use_snapshot:
+            df = load_frame_snapshot(key, SNAPSHOT_PATH)
+            if df is not None:
+                return df
+        df = pd.read_sql(query, conn)
+    df.attrs["ingest_generation"] = generation
+    try:
+        save_frame_snapshot(df, key, SNAPSHOT_PATH)
+    except OSError:
+        # A read-only checkout still works, just without the snapshot
+        pass
     return df
+
+
+def load_aggregate_counts(dimension: str, db_path: str | None = None) -> List[Tuple]:
+    """Return the number of tunes per value of one dimension.
+
+    The counts are read from the ``tune_aggregates`` table, so the
+    cost depends on the number of distinct combinations, not on the
+    number of tunes.
+
+    Parameters
+    ----------
+    dimension : str
+        One of :data:`AGGREGATE_DIMENSIONS`.
+    db_path : str or None, optional
+        Database to read instead of :data:`config.DB_PATH`.
+
+    Returns
+    -------
+    list of tuple of (object, int)
+        ``(value, count)`` pairs, most common first. Tunes without a
+        value are reported under ``None``.
+    """
+    return load_aggregate_crosstab(dimension, db_path=db_path)
+
+
+def load_aggregate_crosstab(*dimensions: str, db_path: str | None = None) -> List[Tuple]:
+    """Return the number of tunes per combination of dimensions.
+
+    Parameters
+    ----------
+    *dimensions : str
+        One or more of :data:`AGGREGATE_DIMENSIONS`, e.g.
+        ``("book_number", "meter")``.
+    db_path : str or None, optional
+        Database to read instead of :data:`config.DB_PATH`.
+
+    Returns
+    -------
+    list of tuple
+        One ``(value_1, ..., value_n, count)`` tuple per combination
+        present in the database, most common first.
+    """
+    if not dimensions:
+        raise ValueError("At least one dimension is required")
+    for dimension in dimensions:
+        if dimension not in AGGREGATE_DIMENSIONS:
+            raise ValueError(f"Unknown aggregate dimension: {dimension!r}")
+    columns = ", ".join(
+        f"NULLIF({d}, {-1 if d == 'book_number' else repr('')})" for d in dimensions
+    )
+    query = (
+        f"SELECT {columns}, SUM(tune_count) AS n FROM tune_aggregates "
+        f"GROUP BY {', '.join(str(i + 1) for i in range(len(dimensions)))} "
+        f"ORDER BY n DESC"
+    )
+    return get_manager(db_path).reader().execute(query).fetchall()
+
+
+def load_aggregate_total(db_path: str | None = None) -> int:
+    """Return the total number of tunes from the aggregate table.
+
+    Parameters
+    ----------
+    db_path : str or None, optional
+        Database to read instead of :data:`config.DB_PATH`.
+
+    Returns
+    -------
+    int
+        Number of rows in the ``tunes`` table.
+    """
+    row = get_manager(db_path).reader().execute("SELECT SUM(tune_count) FROM tune_aggregates").fetchone()
+    return row[0] or 0
+
+
+def load_cluster_counts(dimension: str, db_path: str | None = None) -> List[Tuple]:
+    """Return the number of distinct tunes per value of one dimension.
+
+    Like :func:`load_aggregate_counts`, but every duplicate cluster
+    counts once per value; tunes without a cluster count as their own.
+    This scans the ``tunes`` table instead of reading the aggregates.
+
+    Parameters
+    ----------
+    dimension : str
+        One of :data:`AGGREGATE_DIMENSIONS`.
+    db_path : str or None, optional
+        Database to read instead of :data:`config.DB_PATH`.
+
+    Returns
+    -------
+    list of tuple of (object, int)
+        ``(value, count)`` pairs, most common first. Tunes without a
+        value are reported under ``None``.
+    """
+    if dimension not in AGGREGATE_DIMENSIONS:
+        raise ValueError(f"Unknown aggregate dimension: {dimension!r}")
+    missing = -1 if dimension == "book_number" else "''"
+    query = (
+        f"SELECT NULLIF(IFNULL({dimension}, {missing}), {missing}), "
+        f"COUNT(DISTINCT IFNULL(cluster_id, id)) AS n FROM tunes GROUP BY 1 ORDER BY n DESC"
+    )
+    return get_manager(db_path).reader().execute(query).fetchall()
+
+
+def load_cluster_total(db_path: str | None = None) -> int:
+    """Return the number of distinct tunes, counting each cluster once.
+
+    Parameters
+    ----------
+    db_path : str or None, optional
+        Database to read instead of :data:`config.DB_PATH`.
+
+    Returns
+    -------
+    int
+        Number of duplicate clusters plus unclustered tunes.
+    """
+    row = get_manager(db_path).reader().execute(
+        "SELECT COUNT(DISTINCT IFNULL(cluster_id, id)) FROM tunes"
+    ).fetchone()
+    return row[0] or 0
+
+
+def rebuild_tune_cube(path: str | None = None) -> TuneCube:
+    """Build the tune count cube from the aggregates and save it.
+
+    Parameters
+    ----------
+    path : str or None, optional
+        Where to write the cube. If ``None``,
+        :data:`config.CUBE_PATH` is used, except for an in-memory
+        database, whose cube is not written anywhere.
+
+    Returns
+    -------
+    TuneCube
+        The freshly built cube.
+    """
+    from tune_cube import TuneCube
+
+    manager = get_manager()
+    with manager.read_snapshot() as conn:
+        generation = get_ingest_generation(conn)
+        rows = conn.execute(
+            f"SELECT {', '.join(AGGREGATE_DIMENSIONS)}, tune_count FROM tune_aggregates"
+        ).fetchall()
+    # tune_aggregates stores missing values as -1 / '', as the cube does
+    cube = TuneCube.from_aggregates(rows, generation)
+    if path is not None or not manager.in_memory:
+        cube.save(CUBE_PATH if path is None else path)
+    return cube
+
+
+def list_tunes(
+    order_by: str = "title",
+    limit: int = PAGE_SIZE,
+    offset: int = 0,
+    after: Optional[Tuple] = None,
+    descending: bool = False,
+) -> Tuple[List[Dict], Optional[Tuple]]:
+    """Return one page of tunes in a stable sort order.
+
+    Pages can be addressed either by ``offset`` or, more efficiently,
+    by the keyset cursor returned with the previous page. Both are
+    served by the ``(sort key, id)`` index, so fetching a page reads
+    about ``limit`` index entries (plus ``offset`` when using offsets)
+    regardless of the size of the table.
+
+    Parameters
+    ----------
+    order_by : str, optional
+        One of ``"title"`` (case-insensitive), ``"book"`` or ``"key"``.
+        Ties are broken by tune id.
+    limit : int, optional
+        Maximum number of tunes to return.
+    offset : int, optional
+        Number of tunes to skip. Ignored when ``after`` is given.
+    after : tuple or None, optional
+        Cursor returned by a previous call; the page starts with the
+        first tune after it.
+    descending : bool, optional
+        Sort in descending instead of ascending order.
+
+    Returns
+    -------
+    tuple of (list of dict, tuple or None)
+        The tunes on the page, as dictionaries with the keys in
+        :data:`LISTING_COLUMNS`, and the cursor for the next page
+        (``None`` when there are no more tunes).
+    """
+    if order_by not in ORDER_KEYS:
+        raise ValueError(f"Unknown order key: {order_by!r}")
+    expression = ORDER_KEYS[order_by]
+    direction, compare = ("DESC", "<") if descending else ("ASC", ">")
+
+    # One extra row tells us whether there is a next page
+    params: Dict = {"limit": limit + 1}
+    where = ""
+    if after is not None:
+        # Spelled out rather than as a row-value comparison so that
+        # SQLite seeks into the index instead of scanning from the start.
+        where = (
+            f"WHERE {expression} {compare}= :value "
+            f"AND ({expression} {compare} :value OR id {compare} :id)"
+        )
+        params["value"], params["id"] = after
+    else:
+        params["offset"] = offset
+
+    query = (
+        f"SELECT {', '.join(LISTING_COLUMNS)}, {expression} AS sort_value FROM tunes "
+        f"{where} ORDER BY {expression} {direction}, id {direction} LIMIT :limit"
+        + ("" if after is not None else " OFFSET :offset")
+    )
+    rows = get_manager().reader().execute(query, params).fetchall()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    tunes = [dict(zip(LISTING_COLUMNS, row[:-1])) for row in rows]
+    next_cursor = (rows[-1][-1], rows[-1][0]) if has_more else None
+    return tunes, next_cursor
+
+
+def iter_tunes(order_by: str = "title", batch_size: int = 1000) -> Iterator[Dict]:
+    """Yield every tune in sorted order, reading one page at a time.
+
+    Parameters
+    ----------
+    order_by : str, optional
+        Sort order, as for :func:`list_tunes`.
+    batch_size : int, optional
+        Number of tunes fetched per query.
+
+    Yields
+    ------
+    dict
+        One dictionary per tune with the keys in
+        :data:`LISTING_COLUMNS`.
+    """
+    cursor = None
+    while True:
+        tunes, cursor = list_tunes(order_by, batch_size, after=cursor)
+        yield from tunes
+        if cursor is None:
+            return
+
+
+def _tune_filter(
+    title: str | None,
+    book_number: int | None,
+    meter: str | None,
+    key_signature: str | None,
+    rhythm: str | None,
+) -> Tuple[str, List]:
+    """Return the ``WHERE`` clause and parameters of the tune filters."""
+    conditions: List[str] = []
+    params: List = []
+    if title:
+        escaped = title.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        conditions.append("title LIKE ? ESCAPE '\\'")
+        params.append(f"%{escaped}%")
+    for column, value in (
+        ("book_number", book_number),
+        ("meter", meter),
+        ("key_signature", key_signature),
+        ("rhythm", rhythm),
+    ):
+        if value is not None:
+            conditions.append(f"{column} = ?")
+            params.append(value)
+    return (" WHERE " + " AND ".join(conditions) if conditions else ""), params
+
+
+def count_tunes(
+    title: str | None = None,
+    book_number: int | None = None,
+    meter: str | None = None,
+    key_signature: str | None = None,
+    rhythm: str | None = None,
+    db_path: str | None = None,
+) -> int:
+    """Return the number of tunes :func:`query_tunes` would yield.
+
+    Parameters
+    ----------
+    title, book_number, meter, key_signature, rhythm : optional
+        Filters as for :func:`query_tunes`.
+    db_path : str or None, optional
+        Database to read instead of :data:`config.DB_PATH`.
+
+    Returns
+    -------
+    int
+        Number of matching tunes.
+    """
+    where, params = _tune_filter(title, book_number, meter, key_signature, rhythm)
+    return get_manager(db_path).reader().execute(f"SELECT COUNT(*) FROM tunes{where}", params).fetchone()[0]
+
+
+def query_tunes(
+    title: str | None = None,
+    book_number: int | None = None,
+    meter: str | None = None,
+    key_signature: str | None = None,
+    rhythm: str | None = None,
+    columns: Iterable[str] = LISTING_COLUMNS,
+    order_by: str | None = None,
+    limit: int | None = None,
+    batch_size: int = 1000,
+    db_path: str | None = None,
+) -> Iterator[Dict]:
+    """Stream tunes matching some filters straight from the database.
+
+    Unlike the DataFrame helpers in :mod:`tune_analysis`, this runs the
+    filter in SQLite and yields rows as they are read, so no table is
+    loaded into memory.
+
+    Parameters
+    ----------
+    title : str or None, optional
+        Substring the title must contain (case-insensitive for ASCII
+        letters).
+    book_number, meter, key_signature, rhythm : optional
+        Exact values to match; ``None`` means any value.
+    columns : iterable of str, optional
+        Columns to return, from :data:`TUNE_COLUMNS`.
+    order_by : str or None, optional
+        Sort order as for :func:`list_tunes`; ``None`` returns rows in
+        table order.
+    limit : int or None, optional
+        Maximum number of rows to return.
+    batch_size : int, optional
+        Number of rows fetched from SQLite at a time.
+    db_path : str or None, optional
+        Database to read instead of :data:`config.DB_PATH`.
+
+    Yields
+    ------
+    dict
+        One dictionary per tune, keyed by column name.
+    """
+    columns = tuple(columns)
+    for column in columns:
+        if column not in TUNE_COLUMNS:
+            raise ValueError(f"Unknown column: {column!r}")
+
+    where, params = _tune_filter(title, book_number, meter, key_signature, rhythm)
+    query = f"SELECT {', '.join(columns)} FROM tunes{where}"
+    if order_by is not None:
+        if order_by not in ORDER_KEYS:
+            raise ValueError(f"Unknown order key: {order_by!r}")
+        query += f" ORDER BY {ORDER_KEYS[order_by]}, id"
+    if limit is not None:
+        query += " LIMIT ?"
+        params.append(limit)
+
+    cursor = get_manager(db_path).reader().execute(query, params)
+    try:
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            for row in rows:
+                yield dict(zip(columns, row))
+    finally:
+        cursor.close()
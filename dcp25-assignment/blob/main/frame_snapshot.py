@@ -0,0 +1,102 @@
+"""On-disk snapshot of the tunes DataFrame.
+
+Rebuilding the DataFrame with ``pandas.read_sql`` converts every row
+into Python objects again each time the user interface opens. The
+snapshot stores the finished frame in one pickle file next to the
+database so later sessions can load it directly.
+
+The file starts with a small key (database path, modification time of
+the database file and ingest generation) pickled separately from the
+frame, so a stale snapshot is rejected after reading only a few bytes.
+"""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Dict
+import os
+import pickle
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+# Bumped when the layout of the snapshot file changes
+SNAPSHOT_FORMAT = 1
+
+
+def snapshot_key(db_path: str, generation: int) -> Dict:
+    """Describe the database state a snapshot belongs to.
+
+    Parameters
+    ----------
+    db_path : str
+        Path to the SQLite database file.
+    generation : int
+        Current ingest generation of the database.
+
+    Returns
+    -------
+    dict
+        Keys ``format``, ``db_path`` (absolute), ``db_mtime_ns`` and
+        ``generation``. Two keys compare equal only if the snapshot
+        can be used in place of the database.
+    """
+    db_path = os.path.abspath(db_path)
+    return {
+        "format": SNAPSHOT_FORMAT,
+        "db_path": db_path,
+        "db_mtime_ns": os.stat(db_path).st_mtime_ns,
+        "generation": generation,
+    }
+
+
+def save_frame_snapshot(df: pd.DataFrame, key: Dict, path: str) -> None:
+    """Write ``df`` and its key to ``path``, replacing it atomically.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        Frame as returned by :func:`db_utils.load_tunes_from_database`.
+    key : dict
+        Result of :func:`snapshot_key` for the state ``df`` was read at.
+    path : str
+        Destination file.
+    """
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(key, f, protocol=pickle.HIGHEST_PROTOCOL)
+        pickle.dump(df, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+
+def load_frame_snapshot(key: Dict, path: str) -> pd.DataFrame | None:
+    """Return the stored frame if it was saved under ``key``.
+
+    Parameters
+    ----------
+    key : dict
+        Result of :func:`snapshot_key` for the current database state.
+    path : str
+        Snapshot file.
+
+    Returns
+    -------
+    pandas.DataFrame or None
+        The frame, or ``None`` when the file is missing, unreadable or
+        belongs to another database state.
+    """
+    try:
+        with open(path, "rb") as f:
+            if pickle.load(f) != key:
+                return None
+            return pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+        return None
+
+
+def remove_frame_snapshot(path: str) -> None:
+    """Delete the snapshot file if it exists."""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,124 @@
+"""Check how long each entry point takes to import.
+
+Every module in :data:`config.IMPORT_TIME_BUDGET_MS` is imported in a
+fresh interpreter with ``python -X importtime``, several times, and the
+median cumulative import time is compared with its budget. The check
+also fails if a budgeted entry point imports one of
+:data:`config.IMPORT_FORBIDDEN_MODULES` (pandas, NumPy) before any menu
+option has been chosen::
+
+    python import_budget.py
+    python import_budget.py --runs 9 ui_cli batch_cli
+
+The exit status is non-zero when any module is over budget.
+"""
+
+from __future__ import annotations
+
+from typing import Dict, List, Sequence
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+from config import BASE_DIR, IMPORT_FORBIDDEN_MODULES, IMPORT_TIME_BUDGET_MS
+
+
+_PROBE = (
+    "import sys\n"
+    "import {module}\n"
+    "print(','.join(m for m in {forbidden!r} if m in sys.modules))\n"
+)
+
+
+def measure_import(module: str, runs: int = 5) -> Dict:
+    """Import ``module`` in fresh interpreters and time it.
+
+    Parameters
+    ----------
+    module : str
+        Name of a module next to this file, e.g. ``"app_main"``.
+    runs : int, optional
+        Number of interpreters to start; the median is reported to
+        smooth out disk-cache and scheduling noise.
+
+    Returns
+    -------
+    dict
+        Keys ``module``, ``median_ms``, ``min_ms`` and ``forbidden``
+        (the forbidden modules that were imported).
+    """
+    times: List[float] = []
+    forbidden: List[str] = []
+    code = _PROBE.format(module=module, forbidden=tuple(IMPORT_FORBIDDEN_MODULES))
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", code],
+            cwd=BASE_DIR,
+            capture_output=True,
+            text=True,
+            env={**os.environ, "PYTHONDONTWRITEBYTECODE": "1"},
+        )
+        if result.returncode != 0:
+            raise RuntimeError(f"importing {module} failed:\n{result.stderr.strip()}")
+        # Lines look like "import time:  self [us] | cumulative | name";
+        # the top-level module is the one whose name is not indented
+        for line in result.stderr.splitlines():
+            fields = line.split("|")
+            if len(fields) == 3 and fields[2].rstrip() == f" {module}":
+                times.append(int(fields[1]) / 1000)
+        forbidden = [name for name in result.stdout.strip().split(",") if name]
+    return {
+        "module": module,
+        "median_ms": statistics.median(times),
+        "min_ms": min(times),
+        "forbidden": forbidden,
+    }
+
+
+def check_budgets(modules: Sequence[str] | None = None, runs: int = 5) -> bool:
+    """Measure each module, print a report and return ``True`` if all pass.
+
+    Parameters
+    ----------
+    modules : sequence of str or None, optional
+        Modules to check. If ``None``, every module with a budget.
+    runs : int, optional
+        Passed to :func:`measure_import`.
+
+    Returns
+    -------
+    bool
+        ``True`` when every module is within budget and imports none of
+        the forbidden modules.
+    """
+    ok = True
+    print(f"{'module':<20} {'median ms':>10} {'budget ms':>10}  result")
+    for module in modules or IMPORT_TIME_BUDGET_MS:
+        budget = IMPORT_TIME_BUDGET_MS.get(module)
+        measured = measure_import(module, runs)
+        problems = []
+        if budget is not None and measured["median_ms"] > budget:
+            problems.append("over budget")
+        if budget is not None and measured["forbidden"]:
+            problems.append(f"imports {', '.join(measured['forbidden'])}")
+        ok = ok and not problems
+        print(
+            f"{module:<20} {measured['median_ms']:>10.1f} "
+            f"{'-' if budget is None else budget:>10}  {'; '.join(problems) or 'ok'}"
+        )
+    return ok
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    """Run the budget check from the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("modules", nargs="*", help="modules to check (default: all with a budget)")
+    parser.add_argument("--runs", type=int, default=5, help="interpreters started per module")
+    args = parser.parse_args(argv)
+    return 0 if check_budgets(args.modules, args.runs) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,198 @@
+"""Load-test a running :mod:`query_service` instance.
+
+Opens a number of keep-alive connections to the service and has each
+send a stream of requests drawn from a mix of searches, filters,
+statistics and tune lookups, then reports throughput and latency
+percentiles::
+
+    python query_service.py &
+    python load_test.py --connections 50 --requests 200
+
+Uses only the standard library; pass ``--json`` for machine-readable
+output.
+"""
+
+from __future__ import annotations
+
+from typing import Dict, List, Sequence
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import sys
+import time
+
+from config import SERVICE_HOST, SERVICE_PORT
+
+
+# Paths requested by default; "{id}" is replaced by a random tune id
+DEFAULT_PATHS = (
+    "/search?q=reel",
+    "/search?q=the",
+    "/search?q=polska&limit=50",
+    "/tunes?book=1&meter=6/8",
+    "/tunes?key=G&rhythm=jig",
+    "/tunes?meter=3/4&offset=20",
+    "/stats",
+    "/stats?by=meter",
+    "/tunes/{id}",
+    "/tunes/{id}",
+    "/health",
+)
+
+
+class Client:
+    """One keep-alive HTTP/1.1 connection to the service."""
+
+    def __init__(self, host: str, port: int) -> None:
+        self.host = host
+        self.port = port
+        self.reader: asyncio.StreamReader | None = None
+        self.writer: asyncio.StreamWriter | None = None
+
+    async def get(self, path: str) -> tuple:
+        """Send one GET and return ``(status, body bytes)``."""
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        self.writer.write(
+            f"GET {path} HTTP/1.1\r\nHost: {self.host}\r\nConnection: keep-alive\r\n\r\n".encode("latin-1")
+        )
+        await self.writer.drain()
+        head = (await self.reader.readuntil(b"\r\n\r\n")).decode("latin-1").split("\r\n")
+        status = int(head[0].split(" ")[1])
+        headers = {}
+        for line in head[1:]:
+            name, _, value = line.partition(":")
+            if name:
+                headers[name.strip().lower()] = value.strip()
+        body = await self.reader.readexactly(int(headers.get("content-length", "0")))
+        if headers.get("connection", "").lower() == "close":
+            await self.close()
+        return status, body
+
+    async def close(self) -> None:
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = self.reader = None
+
+
+async def _worker(
+    host: str, port: int, paths: Sequence[str], requests: int, tune_ids: List[int], results: Dict
+) -> None:
+    """Send ``requests`` requests over one connection, recording latencies."""
+    client = Client(host, port)
+    try:
+        for _ in range(requests):
+            path = random.choice(paths).replace("{id}", str(random.choice(tune_ids)))
+            start = time.perf_counter()
+            try:
+                status, _ = await client.get(path)
+            except (OSError, asyncio.IncompleteReadError) as error:
+                results["errors"] += 1
+                results["last_error"] = repr(error)
+                await client.close()
+                continue
+            results["latencies"].append(time.perf_counter() - start)
+            if status != 200:
+                results["errors"] += 1
+                results["last_error"] = f"HTTP {status} for {path}"
+    finally:
+        await client.close()
+
+
+def _percentile(sorted_values: List[float], fraction: float) -> float:
+    """Return the value below which ``fraction`` of the values fall."""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+    return sorted_values[index]
+
+
+async def run_load_test(
+    host: str = SERVICE_HOST,
+    port: int = SERVICE_PORT,
+    connections: int = 20,
+    requests: int = 100,
+    paths: Sequence[str] = DEFAULT_PATHS,
+) -> Dict:
+    """Run the load test and return a summary.
+
+    Parameters
+    ----------
+    host, port : str, int
+        Address of the running service.
+    connections : int, optional
+        Number of concurrent keep-alive connections.
+    requests : int, optional
+        Requests sent over each connection.
+    paths : sequence of str, optional
+        Request paths to choose from at random.
+
+    Returns
+    -------
+    dict
+        Request and error counts, elapsed seconds, requests per second
+        and latency percentiles in milliseconds.
+    """
+    # Sample real ids so tune lookups hit existing tunes
+    probe = Client(host, port)
+    status, body = await probe.get("/tunes?limit=1000")
+    await probe.close()
+    if status != 200:
+        raise RuntimeError(f"service answered HTTP {status}: {body[:200]!r}")
+    tune_ids = [tune["id"] for tune in json.loads(body)["tunes"]] or [1]
+
+    results: Dict = {"latencies": [], "errors": 0, "last_error": None}
+    start = time.perf_counter()
+    await asyncio.gather(
+        *(_worker(host, port, paths, requests, tune_ids, results) for _ in range(connections))
+    )
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(results["latencies"])
+    return {
+        "connections": connections,
+        "requests": len(latencies) + results["errors"],
+        "errors": results["errors"],
+        "last_error": results["last_error"],
+        "elapsed_s": round(elapsed, 3),
+        "requests_per_s": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "latency_ms": {
+            "mean": round(statistics.fmean(latencies) * 1000, 2) if latencies else 0.0,
+            "p50": round(_percentile(latencies, 0.50) * 1000, 2),
+            "p95": round(_percentile(latencies, 0.95) * 1000, 2),
+            "p99": round(_percentile(latencies, 0.99) * 1000, 2),
+            "max": round(latencies[-1] * 1000, 2) if latencies else 0.0,
+        },
+    }
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    """Run the load test from the command line."""
+    parser = argparse.ArgumentParser(description="Load-test a running query_service.")
+    parser.add_argument("--host", default=SERVICE_HOST)
+    parser.add_argument("--port", type=int, default=SERVICE_PORT)
+    parser.add_argument("--connections", type=int, default=20, help="concurrent keep-alive connections")
+    parser.add_argument("--requests", type=int, default=100, help="requests per connection")
+    parser.add_argument("--path", action="append", dest="paths", help="request path (repeatable)")
+    parser.add_argument("--json", action="store_true", help="print the summary as JSON")
+    args = parser.parse_args(argv)
+
+    summary = asyncio.run(
+        run_load_test(args.host, args.port, args.connections, args.requests, args.paths or DEFAULT_PATHS)
+    )
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        latency = summary["latency_ms"]
+        print(f"{summary['requests']} requests over {summary['connections']} connections "
+              f"in {summary['elapsed_s']:.2f}s ({summary['requests_per_s']:.0f} req/s)")
+        print(f"errors: {summary['errors']}" + (f" (last: {summary['last_error']})" if summary["errors"] else ""))
+        print(f"latency ms: mean {latency['mean']}  p50 {latency['p50']}  p95 {latency['p95']}  "
+              f"p99 {latency['p99']}  max {latency['max']}")
+    return 1 if summary["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
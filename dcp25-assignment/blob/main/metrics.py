@@ -0,0 +1,267 @@
+"""Lightweight timing and counting of pipeline stages.
+
+Code marks its stages with :func:`timer` (a context manager) or
+:func:`timed` (a decorator) and counts things with :func:`count`::
+
+    with metrics.timer("parse", items=len(tunes)):
+        ...
+
+    @metrics.timed("query.search_tunes")
+    def search_tunes(...):
+        ...
+
+While metrics are disabled, which is the default unless
+:data:`config.METRICS_ENABLED` is set, :func:`timer` hands back one
+shared do-nothing context manager and :func:`timed` wrappers only test
+a flag, so instrumented code runs at full speed. Once enabled, every
+stage keeps its call count, total time, items and bytes processed and
+a bounded sample of durations, from which :func:`report` derives
+percentiles and throughput. The report can be printed with
+:func:`format_report`, shown by the Rich loader, or written with
+:func:`dump_json`.
+"""
+
+from __future__ import annotations
+
+from contextlib import nullcontext
+from functools import wraps
+from typing import Callable, Dict, List
+import json
+import random
+import threading
+import time
+
+from config import METRICS_ENABLED, METRICS_MAX_SAMPLES
+
+
+_enabled = METRICS_ENABLED
+_lock = threading.Lock()
+_stages: Dict[str, "_Stage"] = {}
+_counters: Dict[str, int] = {}
+_started = time.perf_counter()
+_disabled = nullcontext()
+
+
+class _Stage:
+    """Running totals and a reservoir sample of one stage's durations."""
+
+    __slots__ = ("calls", "total", "max", "items", "nbytes", "samples", "_rng")
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.items = 0
+        self.nbytes = 0
+        self.samples: List[float] = []
+        self._rng = random.Random(0)
+
+    def add(self, seconds: float, items: int, nbytes: int) -> None:
+        self.calls += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.items += items
+        self.nbytes += nbytes
+        if len(self.samples) < METRICS_MAX_SAMPLES:
+            self.samples.append(seconds)
+        else:
+            # Reservoir sampling keeps a uniform sample of all calls
+            slot = self._rng.randrange(self.calls)
+            if slot < METRICS_MAX_SAMPLES:
+                self.samples[slot] = seconds
+
+
+class _Timer:
+    """Context manager that records its duration under a stage name."""
+
+    __slots__ = ("stage", "items", "nbytes", "start")
+
+    def __init__(self, stage: str, items: int, nbytes: int) -> None:
+        self.stage = stage
+        self.items = items
+        self.nbytes = nbytes
+
+    def __enter__(self) -> "_Timer":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        record(self.stage, time.perf_counter() - self.start, self.items, self.nbytes)
+
+
+def enabled() -> bool:
+    """Return whether metrics are being collected."""
+    return _enabled
+
+
+def enable(on: bool = True) -> None:
+    """Start (or with ``on=False`` stop) collecting metrics."""
+    global _enabled
+    _enabled = on
+
+
+def reset() -> None:
+    """Forget everything recorded so far."""
+    global _started
+    with _lock:
+        _stages.clear()
+        _counters.clear()
+        _started = time.perf_counter()
+
+
+def record(stage: str, seconds: float, items: int = 0, nbytes: int = 0) -> None:
+    """Add one timed call to a stage.
+
+    Parameters
+    ----------
+    stage : str
+        Stage name, e.g. ``"parse"``.
+    seconds : float
+        Duration of the call.
+    items : int, optional
+        Items processed (files, tunes, rows), for throughput.
+    nbytes : int, optional
+        Bytes processed, for throughput.
+    """
+    if not _enabled:
+        return
+    with _lock:
+        entry = _stages.get(stage)
+        if entry is None:
+            entry = _stages[stage] = _Stage()
+        entry.add(seconds, items, nbytes)
+
+
+def timer(stage: str, items: int = 0, nbytes: int = 0):
+    """Time a block of code as one call of ``stage``.
+
+    The ``items`` and ``nbytes`` attributes of the returned object can
+    be set inside the block when the amounts are only known there.
+
+    Returns
+    -------
+    context manager
+        A recording timer, or a shared no-op while disabled.
+    """
+    if not _enabled:
+        return _disabled
+    return _Timer(stage, items, nbytes)
+
+
+def timed(stage: str) -> Callable[[Callable], Callable]:
+    """Decorator timing every call of a function as ``stage``."""
+    def decorator(func: Callable) -> Callable:
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(stage, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+def count(name: str, n: int = 1) -> None:
+    """Add ``n`` to the counter ``name``."""
+    if not _enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + n
+
+
+def _percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def report() -> Dict:
+    """Summarise everything recorded since the last :func:`reset`.
+
+    Returns
+    -------
+    dict
+        ``elapsed_s`` since the reset, ``counters``, and ``stages``
+        mapping each stage to ``calls``, ``total_s``, ``mean_s``,
+        ``p50_s``, ``p95_s``, ``p99_s``, ``max_s``, ``items``,
+        ``bytes``, ``items_per_s`` and ``mb_per_s`` (throughput over
+        the time spent in the stage).
+    """
+    with _lock:
+        stages = {}
+        for name, entry in _stages.items():
+            samples = sorted(entry.samples)
+            stages[name] = {
+                "calls": entry.calls,
+                "total_s": entry.total,
+                "mean_s": entry.total / entry.calls,
+                "p50_s": _percentile(samples, 0.50),
+                "p95_s": _percentile(samples, 0.95),
+                "p99_s": _percentile(samples, 0.99),
+                "max_s": entry.max,
+                "items": entry.items,
+                "bytes": entry.nbytes,
+                "items_per_s": entry.items / entry.total if entry.total else 0.0,
+                "mb_per_s": entry.nbytes / entry.total / 1e6 if entry.total else 0.0,
+            }
+        return {
+            "elapsed_s": time.perf_counter() - _started,
+            "counters": dict(_counters),
+            "stages": dict(sorted(stages.items(), key=lambda item: -item[1]["total_s"])),
+        }
+
+
+def throughput(summary: Dict, stage: str = "ingest") -> Dict[str, float]:
+    """Return files/s, tunes/s and MB/s over the wall time of ``stage``.
+
+    Parameters
+    ----------
+    summary : dict
+        Result of :func:`report`.
+    stage : str, optional
+        Stage whose total time is the denominator.
+
+    Returns
+    -------
+    dict
+        ``files_per_s``, ``tunes_per_s`` and ``mb_per_s``, from the
+        ``files``, ``tunes`` and ``bytes`` counters.
+    """
+    seconds = summary["stages"].get(stage, {}).get("total_s", 0.0)
+    counters = summary["counters"]
+    if not seconds:
+        return {"files_per_s": 0.0, "tunes_per_s": 0.0, "mb_per_s": 0.0}
+    return {
+        "files_per_s": counters.get("files", 0) / seconds,
+        "tunes_per_s": counters.get("tunes", 0) / seconds,
+        "mb_per_s": counters.get("bytes", 0) / seconds / 1e6,
+    }
+
+
+def format_report(summary: Dict | None = None) -> str:
+    """Return the report as a plain-text table."""
+    summary = report() if summary is None else summary
+    lines = [f"{'stage':<32} {'calls':>8} {'total ms':>10} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'items/s':>10}"]
+    for name, stage in summary["stages"].items():
+        lines.append(
+            f"{name:<32} {stage['calls']:>8} {stage['total_s'] * 1000:>10.1f} "
+            f"{stage['p50_s'] * 1000:>8.2f} {stage['p95_s'] * 1000:>8.2f} {stage['p99_s'] * 1000:>8.2f} "
+            f"{stage['items_per_s']:>10.0f}"
+        )
+    if "ingest" in summary["stages"]:
+        rates = throughput(summary)
+        lines.append(
+            f"ingest: {rates['files_per_s']:.1f} files/s, {rates['tunes_per_s']:.0f} tunes/s, "
+            f"{rates['mb_per_s']:.2f} MB/s"
+        )
+    return "\n".join(lines)
+
+
+def dump_json(path: str, summary: Dict | None = None) -> None:
+    """Write the report to ``path`` as JSON."""
+    summary = report() if summary is None else summary
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({**summary, "throughput": throughput(summary)}, f, indent=2)
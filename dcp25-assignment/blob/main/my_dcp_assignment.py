@@ -1,6 +1,6 @@
 import os #for navigating directories & finding files 
+import sys #for writing results straight to the screen
 import sqlite3 #for creating and querying the SQLite database 
-import pandas as pd #for data analysis & filtering with DF
 
 
 """Configuration Section"""
@@ -151,6 +151,18 @@ def read_abc_file(file_path, book_num, file_name):
 
 """STEP 3: DATABASE OPERATIONS"""
 
+# how to sort tunes for each choice the user can make when listing them
+# IFNULL swaps missing values for '' or -1 so every tune has something to sort on
+# COLLATE NOCASE makes the title order ignore upper/lower case
+sort_orders = {
+    "title": "IFNULL(title, '') COLLATE NOCASE",
+    "book": "IFNULL(book_number, -1)",
+    "key": "IFNULL(key_signature, '')",
+}
+
+# how many tunes to show on one page
+page_size = 20
+
 def create_database():
 
     conn = sqlite3.connect(database_file) #connects to database
@@ -172,6 +184,11 @@ def create_database():
         )
     """)
 
+    # indexes let sqlite read tunes already sorted by title, book or key
+    # instead of sorting the whole table every time we list them
+    for column, expression in sort_orders.items():
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_tunes_{column} ON tunes ({expression}, id)")
+
     # commit() saves changes to disk
     conn.commit()
     # Always close connections when done
@@ -235,6 +252,10 @@ def load_all_data():
 
 def load_data():
     
+    # pandas (for data analysis & filtering with DF) is imported here instead of at the top
+    # it takes a while to import, so this way the menus and loading the files start straight away
+    import pandas as pd
+    
     #opens a connection to the sqlite database file stored in database_file
     #allows u to intract with the database
     conn = sqlite3.connect(database_file)
@@ -249,6 +270,40 @@ def load_data():
 
 
 
+def load_page(sort_by, after=None, size=page_size):
+    """
+    Get one page of tunes from the database, sorted by title, book or key.
+    'after' is the (sort value, id) of the last tune on the previous page,
+    so sqlite can jump straight to the next page using the index
+    instead of reading every tune before it.
+    """
+    order = sort_orders[sort_by]
+
+    conn = sqlite3.connect(database_file)
+
+    if after is None:
+        # first page - start from the beginning
+        rows = conn.execute(f"""
+            SELECT title, book_number, key_signature, {order}, id FROM tunes
+            ORDER BY {order}, id LIMIT ?
+        """, (size,)).fetchall()
+    else:
+        # next page - only tunes that sort after the last one we showed
+        # (ties on the sort value are broken by id)
+        rows = conn.execute(f"""
+            SELECT title, book_number, key_signature, {order}, id FROM tunes
+            WHERE {order} >= ? AND ({order} > ? OR id > ?)
+            ORDER BY {order}, id LIMIT ?
+        """, (after[0], after[0], after[1], size)).fetchall()
+
+    conn.close()
+
+    # remember where this page ended so we can ask for the next one
+    last = (rows[-1][3], rows[-1][4]) if rows else None
+    return rows, last
+
+
+
 """STEP 4: DATA ANALYSIS FUNCTIONS"""
 
 def search_by_title(data, search_word):
@@ -317,6 +372,27 @@ def show_stats(data):
 
 
 
+def show_lines(header, lines):
+    """
+    Print a header and a list of result lines all in one go.
+    Joining the lines and writing them once is much faster than calling
+    print() for every tune, and when we're writing to a real terminal
+    pydoc.pager lets the user scroll through long results a screen at a time.
+    """
+    text = header + "\n" + "\n".join(lines) + "\n"
+
+    # isatty() is True when output goes to a terminal, not a file or pipe
+    if sys.stdout.isatty():
+        # pydoc is for showing long results one screen at a time (like 'less')
+        # it's only imported when needed because importing it is slow
+        import pydoc
+        pydoc.pager(text)
+    else:
+        sys.stdout.write(text)
+
+
+
+
 """STEP 5: USER INTERFACE"""
 
 def show_menu():
@@ -357,12 +433,12 @@ def run_menu():
                 #searches in title column & Finds rows where the title contains the word the user typed
                 #Returns a new DataFrame with only the matching rows
                 results = search_by_title(data, word)
-                #prints how many matching rows were found
-                print(f"\nFound {len(results)} tunes:")
-                # .iterrows() loops through DataFrame rows - returns index and row data as a series
-                # _ is convention for unused variable (the index)
-                for _, tune in results.iterrows():
-                    print(f"  - {tune['title']} (Book {tune['book_number']}, Key: {tune['key_signature']})")
+                # zip() walks the columns side by side, giving one (title, book, key) tuple per tune
+                # this is much faster than .iterrows(), which builds a whole Series for every row
+                lines = [f"  - {title} (Book {book}, Key: {key})"
+                         for title, book, key in zip(results["title"], results["book_number"], results["key_signature"])]
+                #prints how many matching rows were found, then the tunes
+                show_lines(f"\nFound {len(results)} tunes:", lines)
             else:
                 print("Enter a search word!")
 
@@ -373,10 +449,9 @@ def run_menu():
                 num = int(input("Book number: "))
                 results = filter_by_book(data, num)
 
-                print(f"\nFound {len(results)} tunes in book {num}:")
-
-                for _, tune in results.iterrows():
-                    print(f"  - {tune['title']} (Key: {tune['key_signature']}, Meter: {tune['meter']})")
+                lines = [f"  - {title} (Key: {key}, Meter: {meter})"
+                         for title, key, meter in zip(results["title"], results["key_signature"], results["meter"])]
+                show_lines(f"\nFound {len(results)} tunes in book {num}:", lines)
 
             except:
                 # Catch any errors (non-numeric input, etc.)
@@ -403,10 +478,8 @@ def run_menu():
 
                 results = filter_by_meter(data, meter)
 
-                print(f"\nFound {len(results)} tunes in {meter}:")
-
-                for _, tune in results.iterrows():
-                    print(f"  - {tune['title']} (Book {tune['book_number']})")
+                lines = [f"  - {title} (Book {book})" for title, book in zip(results["title"], results["book_number"])]
+                show_lines(f"\nFound {len(results)} tunes in {meter}:", lines)
             else:
                 print("Enter a meter!")
 
@@ -418,10 +491,8 @@ def run_menu():
             if key:
                 results = filter_by_key(data, key)
 
-                print(f"\nFound {len(results)} tunes in {key}:")
-
-                for _, tune in results.iterrows():
-                    print(f"  - {tune['title']} (Book {tune['book_number']})")
+                lines = [f"  - {title} (Book {book})" for title, book in zip(results["title"], results["book_number"])]
+                show_lines(f"\nFound {len(results)} tunes in {key}:", lines)
             else:
                 print("Enter a key!")
 
@@ -430,12 +501,28 @@ def run_menu():
             show_stats(data)
 
         
-        elif choice == "7":  # Show all tunes
+        elif choice == "7":  # Show all tunes, sorted
 
-            print(f"\nAll {len(data)} tunes:")
+            sort_by = input("Sort by title, book or key [title]: ").strip().lower() or "title"
 
-            for _, tune in data.iterrows():
-                print(f"  - {tune['title']} (Book {tune['book_number']}, Key: {tune['key_signature']})")
+            if sort_by in sort_orders:
+                lines = []
+
+                # read the sorted tunes in big pages and let the pager do the scrolling
+                last = None
+                while True:
+                    rows, last = load_page(sort_by, last, size=1000)
+
+                    for title, book, key, _, _ in rows:
+                        lines.append(f"  - {title} (Book {book}, Key: {key})")
+
+                    # a short page means we reached the end
+                    if len(rows) < 1000:
+                        break
+
+                show_lines(f"\nAll {len(data)} tunes, sorted by {sort_by}:", lines)
+            else:
+                print("Choose title, book or key!")
 
         
         elif choice == "8":  
@@ -458,7 +545,28 @@ def main():
     
     print("ABC Tune Parser")
     print("=" * 40)
-    
+
+    # "python my_dcp_assignment.py --profile" times each option with cProfile and
+    # tracemalloc, and writes the results to the profiles folder when we quit
+    # profiling is only imported when asked for, so normal start-up stays fast
+    session = None
+    if "--profile" in sys.argv[1:]:
+        from profiling import ProfileSession
+        session = ProfileSession("my_dcp_assignment")
+
+    try:
+        main_menu(session)
+    finally:
+        if session is not None:
+            paths = session.write()
+            if paths:
+                print(f"Profile written to {paths[0]} and {paths[1]}")
+
+
+def main_menu(session=None):
+    """
+    Top-level menu loop. If session is given, each option runs as a profiled stage.
+    """
     # Main program loop (doesn't end on it's own)
     while True:
         # Display top-level menu
@@ -473,14 +581,22 @@ def main():
             # Option 1: Run the ETL pipeline
             # This finds, parses, and loads all ABC files into the database
             print("\nLoading files...")
-            total = load_all_data()
+            if session is not None:
+                with session.stage("load"):
+                    total = load_all_data()
+            else:
+                total = load_all_data()
             print(f"Done! Loaded {total} tunes.")
         
         elif choice == "2":
             # Option 2: Open the search/browse interface
             # This loads data from the database and provides filtering options
             print("\nOpening search menu...")
-            run_menu()
+            if session is not None:
+                with session.stage("search menu"):
+                    run_menu()
+            else:
+                run_menu()
         
         elif choice == "3":
             # Option 3: Exit the program
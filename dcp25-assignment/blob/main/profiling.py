@@ -0,0 +1,157 @@
+"""Profile the operations chosen from the application menus.
+
+The entry points (``app_main``, ``app_rich_main`` and
+``my_dcp_assignment``) accept ``--profile``. Each menu operation then
+runs as one stage of a :class:`ProfileSession`, under :mod:`cProfile`
+and :mod:`tracemalloc`::
+
+    session = ProfileSession("app_main")
+    with session.stage("load"):
+        load_all_abc_data()
+    session.write()
+
+When the session is written, two files land in
+:data:`config.PROFILE_DIR`:
+
+``<entry>-<timestamp>.prof``
+    The cProfile call graph of all stages, for ``python -m pstats``,
+    snakeviz or gprof2dot.
+``<entry>-<timestamp>-memory.txt``
+    Per stage its wall time, traced memory at the start, peak and net
+    allocation and the top allocation sites, followed by the slowest
+    functions by cumulative time.
+
+Both files are meant to be attached to bug reports.
+"""
+
+from __future__ import annotations
+
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Tuple
+import cProfile
+import io
+import os
+import pstats
+import time
+import tracemalloc
+
+from config import PROFILE_DIR, PROFILE_TOP_ALLOCATIONS
+
+
+# Frames kept per traced allocation; enough to tell the caller of a
+# pandas or sqlite3 call apart from the call itself
+_TRACE_FRAMES = 5
+_IGNORED_FILES = (tracemalloc.__file__, "<frozen importlib._bootstrap>", "<unknown>")
+
+
+def _format_bytes(nbytes: float) -> str:
+    for unit in ("B", "KiB", "MiB"):
+        if abs(nbytes) < 1024:
+            return f"{nbytes:.1f} {unit}"
+        nbytes /= 1024
+    return f"{nbytes:.1f} GiB"
+
+
+class ProfileSession:
+    """Collect CPU and memory profiles of a sequence of named stages.
+
+    Parameters
+    ----------
+    entry : str
+        Name of the entry point, used in the output file names.
+    out_dir : str or None, optional
+        Folder for the output files. If ``None``,
+        :data:`config.PROFILE_DIR` is used.
+    top : int, optional
+        Allocation sites and functions listed per stage in the report.
+    """
+
+    def __init__(self, entry: str, out_dir: str | None = None, top: int = PROFILE_TOP_ALLOCATIONS) -> None:
+        self.entry = entry
+        self.out_dir = out_dir or PROFILE_DIR
+        self.top = top
+        self.profiler = cProfile.Profile()
+        self.stages: List[Dict] = []
+        self.started = time.strftime("%Y%m%d-%H%M%S")
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Profile the enclosed block as one stage called ``name``.
+
+        tracemalloc's peak is reset on entry, so each stage reports
+        its own peak rather than the highest seen so far.
+        """
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(_TRACE_FRAMES)
+        tracemalloc.reset_peak()
+        before = tracemalloc.take_snapshot()
+        start_current, _ = tracemalloc.get_traced_memory()
+        start = time.perf_counter()
+        self.profiler.enable()
+        try:
+            yield
+        finally:
+            self.profiler.disable()
+            seconds = time.perf_counter() - start
+            current, peak = tracemalloc.get_traced_memory()
+            after = tracemalloc.take_snapshot()
+            filters = [tracemalloc.Filter(False, pattern) for pattern in _IGNORED_FILES]
+            sites = after.filter_traces(filters).compare_to(before.filter_traces(filters), "lineno")
+            self.stages.append({
+                "name": name,
+                "seconds": seconds,
+                "start": start_current,
+                "peak": peak,
+                "net": current - start_current,
+                "sites": [site for site in sites if site.size_diff > 0][:self.top],
+            })
+
+    def _paths(self) -> Tuple[str, str]:
+        base = os.path.join(self.out_dir, f"{self.entry}-{self.started}")
+        return base + ".prof", base + "-memory.txt"
+
+    def format_report(self) -> str:
+        """Return the per-stage memory and timing report as text."""
+        lines = [f"Profile of {self.entry}, started {self.started}", ""]
+        lines.append(f"{'stage':<24} {'wall s':>9} {'at start':>12} {'peak':>12} {'net':>12}")
+        for stage in self.stages:
+            lines.append(
+                f"{stage['name']:<24} {stage['seconds']:>9.3f} {_format_bytes(stage['start']):>12} "
+                f"{_format_bytes(stage['peak']):>12} {_format_bytes(stage['net']):>12}"
+            )
+        for number, stage in enumerate(self.stages, 1):
+            lines += ["", f"== Stage {number}: {stage['name']} - top allocation sites (net growth)"]
+            if not stage["sites"]:
+                lines.append("  (nothing retained)")
+            for site in stage["sites"]:
+                frame = site.traceback[0]
+                lines.append(
+                    f"  {_format_bytes(site.size_diff):>12} in {site.count_diff:>7} blocks  "
+                    f"{frame.filename}:{frame.lineno}"
+                )
+        if self.stages:
+            out = io.StringIO()
+            stats = pstats.Stats(self.profiler, stream=out)
+            stats.sort_stats("cumulative").print_stats(self.top)
+            lines += ["", "== Slowest functions over all stages (cumulative)", out.getvalue().strip()]
+        return "\n".join(lines) + "\n"
+
+    def write(self) -> Tuple[str, str] | None:
+        """Write the call-graph stats and the memory report.
+
+        Returns
+        -------
+        tuple of str or None
+            Paths of the ``.prof`` file and the report, or ``None`` if
+            no stage was run.
+        """
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+        if not self.stages:
+            return None
+        os.makedirs(self.out_dir, exist_ok=True)
+        prof_path, report_path = self._paths()
+        self.profiler.dump_stats(prof_path)
+        with open(report_path, "w", encoding="utf-8") as f:
+            f.write(self.format_report())
+        return prof_path, report_path
@@ -0,0 +1,250 @@
+"""Query result cache for the tune analysis functions.
+
+Results are keyed by the query (function name plus normalised
+arguments), by the DataFrame object they were computed from and by its
+ingest generation. The loader bumps the generation on every commit, so
+a frame loaded after new tunes arrive never sees results computed for
+an older one, and entries from older generations are dropped as soon
+as a newer generation is seen. Entries for a frame are dropped once the
+frame itself is garbage collected.
+"""
+
+from __future__ import annotations
+
+from collections import OrderedDict
+from functools import wraps
+from itertools import count
+from typing import Any, Callable, Dict, Hashable, List, Tuple
+import sys
+import threading
+import weakref
+
+from config import QUERY_CACHE_MAX_BYTES
+
+
+def _estimate_size(value: Any) -> int:
+    """Return an approximate size in bytes for a cached value."""
+    memory_usage = getattr(value, "memory_usage", None)
+    if memory_usage is not None:
+        usage = memory_usage(deep=True)
+        return int(usage.sum()) if hasattr(usage, "sum") else int(usage)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(
+            _estimate_size(k) + _estimate_size(v) for k, v in value.items()
+        )
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(_estimate_size(v) for v in value)
+    return sys.getsizeof(value)
+
+
+class QueryCache:
+    """Least-recently-used cache bounded by the memory of its values.
+
+    Parameters
+    ----------
+    max_bytes : int
+        Upper bound for the summed size of all cached values. The
+        least recently used entries are evicted to stay under it; a
+        single value larger than the bound is never cached.
+    """
+
+    def __init__(self, max_bytes: int = QUERY_CACHE_MAX_BYTES) -> None:
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Tuple, Tuple[Any, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self._latest_generation = -1
+        # Tokens of frames garbage collected since the last lookup; the
+        # weakref callbacks only append here, as they may run while the
+        # lock is held
+        self._dead_frames: List[int] = []
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _observe_generation(self, generation: int) -> bool:
+        """Track the newest generation and purge older entries.
+
+        Returns ``False`` if ``generation`` is older than one already
+        seen, in which case the caller should bypass the cache.
+        """
+        if generation > self._latest_generation:
+            self._latest_generation = generation
+            stale = [key for key in self._entries if key[0] < generation]
+            for key in stale:
+                self._bytes -= self._entries.pop(key)[1]
+            return True
+        return generation == self._latest_generation
+
+    def forget_frame(self, token: int) -> None:
+        """Schedule the entries computed from a dead frame for removal."""
+        self._dead_frames.append(token)
+
+    def _purge_dead_frames(self) -> None:
+        if not self._dead_frames:
+            return
+        dead = set()
+        while self._dead_frames:
+            dead.add(self._dead_frames.pop())
+        stale = [key for key in self._entries if key[1] in dead]
+        for key in stale:
+            self._bytes -= self._entries.pop(key)[1]
+
+    def get_or_compute(
+        self,
+        generation: int,
+        key: Hashable,
+        compute: Callable[[], Any],
+        frame: int | None = None,
+    ) -> Any:
+        """Return the cached value for ``key`` or compute and store it.
+
+        Parameters
+        ----------
+        generation : int
+            Ingest generation of the data the query runs against.
+        key : hashable
+            Normalised description of the query.
+        compute : callable
+            Zero-argument function producing the value on a miss.
+        frame : int or None, optional
+            :func:`frame_token` of the DataFrame queried; the entry is
+            dropped when that frame is garbage collected.
+
+        Returns
+        -------
+        object
+            The cached or freshly computed value. Cached values are
+            shared between callers and must not be modified.
+        """
+        full_key = (generation, frame, key)
+        with self._lock:
+            self._purge_dead_frames()
+            current = self._observe_generation(generation)
+            if current and full_key in self._entries:
+                self._entries.move_to_end(full_key)
+                self.hits += 1
+                return self._entries[full_key][0]
+            self.misses += 1
+
+        value = compute()
+        if not current:
+            return value
+
+        size = _estimate_size(value)
+        if size > self.max_bytes:
+            return value
+        with self._lock:
+            if generation != self._latest_generation or full_key in self._entries:
+                return value
+            self._entries[full_key] = (value, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+        return value
+
+    def clear(self) -> None:
+        """Drop every cached entry and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit/miss counters and current memory use.
+
+        Returns
+        -------
+        dict
+            Keys ``hits``, ``misses``, ``evictions``, ``entries``,
+            ``bytes``, ``max_bytes`` and ``generation``.
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "generation": self._latest_generation,
+            }
+
+
+query_cache = QueryCache()
+
+_frame_tokens: Dict[int, Tuple["weakref.ref", int]] = {}
+_frame_tokens_lock = threading.Lock()
+_next_token = count()
+
+
+def frame_token(df) -> int:
+    """Return a number identifying the DataFrame object ``df``.
+
+    The token stays the same for as long as ``df`` is alive and is
+    never handed out again, unlike ``id(df)``, which a new frame can
+    reuse once ``df`` is garbage collected.
+    """
+    key = id(df)
+    with _frame_tokens_lock:
+        entry = _frame_tokens.get(key)
+        if entry is not None and entry[0]() is df:
+            return entry[1]
+        token = next(_next_token)
+
+        def forget(ref: "weakref.ref") -> None:
+            if _frame_tokens.get(key, (None,))[0] is ref:
+                del _frame_tokens[key]
+            query_cache.forget_frame(token)
+
+        _frame_tokens[key] = (weakref.ref(df, forget), token)
+        return token
+
+
+def cached_query(normalize: Callable[..., Tuple] | None = None) -> Callable:
+    """Decorate an analysis function ``func(df, *args, **kwargs)`` with caching.
+
+    The DataFrame's ``attrs["ingest_generation"]`` (set by
+    :func:`db_utils.load_tunes_from_database`) and the frame object
+    itself are part of the key. Filtered slices inherit ``attrs``, so
+    two slices of the same length are still told apart, and neither
+    reuses the result of the full frame. Frames without a generation
+    bypass the cache.
+
+    Parameters
+    ----------
+    normalize : callable or None, optional
+        Function mapping the query arguments (everything after
+        ``df``) to a hashable tuple, e.g. to fill in defaults so
+        that calls with and without them share an entry. Defaults to
+        the positional arguments followed by the sorted keyword
+        arguments.
+
+    Returns
+    -------
+    callable
+        The decorator.
+    """
+
+    def decorator(func: Callable) -> Callable:
+        @wraps(func)
+        def wrapper(df, *args, **kwargs):
+            generation = df.attrs.get("ingest_generation")
+            if generation is None:
+                return func(df, *args, **kwargs)
+            if normalize is not None:
+                query = normalize(*args, **kwargs)
+            else:
+                query = args + tuple(sorted(kwargs.items()))
+            return query_cache.get_or_compute(
+                generation,
+                (func.__name__, query),
+                lambda: func(df, *args, **kwargs),
+                frame=frame_token(df),
+            )
+
+        return wrapper
+
+    return decorator
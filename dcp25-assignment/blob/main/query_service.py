@@ -0,0 +1,448 @@
+"""Local HTTP/JSON query service for the tunes collection.
+
+One process loads the tunes DataFrame and its title search index once
+and answers queries for any number of clients, instead of every
+analyst starting a UI process with its own copy of the table::
+
+    python query_service.py --port 8765
+
+Endpoints (all ``GET``, all answering JSON):
+
+``/health``
+    Number of tunes, ingest generation and query cache counters.
+``/search?q=TERM``
+    Tunes whose title contains ``TERM`` (case-insensitive).
+``/tunes?book=1&meter=6/8&key=G&rhythm=jig&title=TERM``
+    Tunes matching every given filter.
+``/tunes/ID``
+    One tune including its ABC body.
+``/stats`` and ``/stats?by=meter``
+    Collection statistics, or counts per book, key, meter or rhythm.
+
+Listings accept ``limit`` and ``offset``. Connections are kept alive
+between requests (HTTP/1.1). Searches and filters run on a small
+thread pool and statistics through :mod:`async_db`, so the event loop
+keeps serving other clients meanwhile, and the frame is reloaded in
+the background after a new ingest. With ``--watch`` the service also
+re-ingests ABC files as they change (see :mod:`abc_watcher`).
+"""
+
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Sequence, Tuple
+from urllib.parse import parse_qs, unquote, urlsplit
+import argparse
+import asyncio
+import json
+import math
+import sys
+import threading
+import traceback
+
+from async_db import AsyncTunesDB
+from config import (
+    PAGE_SIZE,
+    SERVICE_HOST,
+    SERVICE_IDLE_TIMEOUT_SECONDS,
+    SERVICE_PORT,
+    SERVICE_QUERY_TIMEOUT_SECONDS,
+    SERVICE_REFRESH_SECONDS,
+    SERVICE_WORKERS,
+)
+from db_utils import LISTING_COLUMNS, TUNE_COLUMNS, get_ingest_generation, load_tunes_from_database
+from tune_analysis import (
+    TitleSearchIndex,
+    get_query_cache_stats,
+    get_tunes_by_book,
+    get_tunes_by_key,
+    get_tunes_by_meter,
+)
+
+
+# Short names accepted by /stats?by=, as in batch_cli
+STATS_DIMENSIONS = {
+    "book": "book_number",
+    "key": "key_signature",
+    "meter": "meter",
+    "rhythm": "rhythm",
+}
+
+# Largest limit a client may ask for in one listing
+MAX_LIMIT = 1000
+
+# Longest request head (request line plus headers) accepted, in bytes
+MAX_HEAD_BYTES = 16 * 1024
+
+_REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    431: "Request Header Fields Too Large",
+    500: "Internal Server Error",
+    504: "Gateway Timeout",
+}
+
+
+class HTTPError(Exception):
+    """Turned into a JSON error response with the given status."""
+
+    def __init__(self, status: int, message: str) -> None:
+        super().__init__(message)
+        self.status = status
+
+
+def _json_value(value):
+    """Make pandas/NumPy scalars and NaN JSON-serialisable.
+
+    Whole floats become ints: ``book_number`` is a float column as soon
+    as one tune lacks a book, but clients expect ``1`` rather than ``1.0``.
+    """
+    item = getattr(value, "item", None)
+    if item is not None:
+        value = item()
+    if isinstance(value, float):
+        if math.isnan(value):
+            return None
+        if value.is_integer():
+            return int(value)
+    return value
+
+
+def _records(frame, columns: Sequence[str]) -> List[Dict]:
+    """Convert the given DataFrame columns to a list of dictionaries."""
+    values = [[_json_value(v) for v in frame[column].tolist()] for column in columns]
+    return [dict(zip(columns, row)) for row in zip(*values)]
+
+
+def _series_counts(series) -> List[List]:
+    """Convert a counts Series to ``[[value, count], ...]``."""
+    return [[_json_value(value), int(count)] for value, count in series.items()]
+
+
+class TuneService:
+    """The in-memory tunes frame plus the queries answered from it.
+
+    :meth:`refresh` loads the frame (from the snapshot when valid),
+    builds the title search index and an id-to-row map, and swaps all
+    three in at once, so a query never sees a half-updated state.
+    """
+
+    def __init__(self) -> None:
+        self._state: Tuple | None = None
+        self._refresh_lock = threading.Lock()
+        self.db = AsyncTunesDB()
+
+    @property
+    def generation(self) -> int:
+        """Ingest generation of the loaded frame (``-1`` before loading)."""
+        return -1 if self._state is None else self._state[0]
+
+    def refresh(self) -> bool:
+        """Reload the frame if the database has changed.
+
+        Returns
+        -------
+        bool
+            ``True`` if a new frame was loaded.
+        """
+        with self._refresh_lock:
+            if self._state is not None and get_ingest_generation() == self.generation:
+                return False
+            df = load_tunes_from_database()
+            positions = {int(tune_id): i for i, tune_id in enumerate(df["id"].tolist())}
+            self._state = (df.attrs.get("ingest_generation", 0), df, TitleSearchIndex(df), positions)
+            return True
+
+    def __len__(self) -> int:
+        return len(self._loaded()[1])
+
+    def _loaded(self) -> Tuple:
+        if self._state is None:
+            self.refresh()
+        return self._state
+
+    @staticmethod
+    def _page(frame, params: Dict[str, str], columns: Sequence[str] = LISTING_COLUMNS) -> Dict:
+        """Slice a result frame according to ``limit`` and ``offset``."""
+        limit = min(_int_param(params, "limit", PAGE_SIZE), MAX_LIMIT)
+        offset = _int_param(params, "offset", 0)
+        if limit < 0 or offset < 0:
+            raise HTTPError(400, "limit and offset must not be negative")
+        return {
+            "total": len(frame),
+            "offset": offset,
+            "tunes": _records(frame.iloc[offset:offset + limit], columns),
+        }
+
+    def health(self, params: Dict[str, str]) -> Dict:
+        """Describe the loaded data and the query cache."""
+        generation, df, _, _ = self._loaded()
+        return {
+            "status": "ok",
+            "tunes": len(df),
+            "generation": generation,
+            "query_cache": get_query_cache_stats(),
+        }
+
+    def search(self, params: Dict[str, str]) -> Dict:
+        """Find tunes whose title contains ``q``."""
+        term = params.get("q", "")
+        if not term:
+            raise HTTPError(400, "missing search term 'q'")
+        _, df, index, _ = self._loaded()
+        return self._page(df.iloc[index.search(term)], params)
+
+    def filter(self, params: Dict[str, str]) -> Dict:
+        """Find tunes matching every given book/meter/key/rhythm/title."""
+        _, df, index, _ = self._loaded()
+        # Each filter runs on the full frame, where its result is cached
+        # by tune_analysis, and the matching row labels are intersected
+        matches = []
+        if params.get("title"):
+            matches.append(df.index[index.search(params["title"])])
+        if "book" in params:
+            matches.append(get_tunes_by_book(df, _int_param(params, "book")).index)
+        if params.get("meter"):
+            matches.append(get_tunes_by_meter(df, params["meter"]).index)
+        if params.get("key"):
+            matches.append(get_tunes_by_key(df, params["key"]).index)
+        if params.get("rhythm"):
+            rhythm = params["rhythm"].strip().lower()
+            matches.append(df.index[df["rhythm"].str.lower() == rhythm])
+        if not matches:
+            return self._page(df, params)
+        selected = matches[0]
+        for other in matches[1:]:
+            selected = selected.intersection(other, sort=False)
+        return self._page(df.loc[selected], params)
+
+    def tune(self, tune_id: int) -> Dict:
+        """Return one tune with every column, including the ABC body."""
+        _, df, _, positions = self._loaded()
+        position = positions.get(tune_id)
+        if position is None:
+            raise HTTPError(404, f"no tune with id {tune_id}")
+        return _records(df.iloc[position:position + 1], TUNE_COLUMNS)[0]
+
+    async def stats(self, params: Dict[str, str]) -> Dict:
+        """Collection statistics or the counts for one dimension.
+
+        The aggregate queries go through :class:`async_db.AsyncTunesDB`
+        and are interrupted after ``SERVICE_QUERY_TIMEOUT_SECONDS``.
+        """
+        by = params.get("by")
+        try:
+            if by:
+                if by not in STATS_DIMENSIONS:
+                    raise HTTPError(400, f"'by' must be one of {', '.join(STATS_DIMENSIONS)}")
+                counts = await self.db.value_counts(
+                    STATS_DIMENSIONS[by], timeout=SERVICE_QUERY_TIMEOUT_SECONDS
+                )
+                return {"by": by, "counts": _series_counts(counts)}
+            stats = await self.db.collection_statistics(timeout=SERVICE_QUERY_TIMEOUT_SECONDS)
+        except TimeoutError:
+            raise HTTPError(504, "statistics query timed out") from None
+        return {
+            key: _series_counts(value) if hasattr(value, "items") else value
+            for key, value in stats.items()
+        }
+
+
+def _int_param(params: Dict[str, str], name: str, default: int | None = None) -> int:
+    """Read an integer query parameter, answering 400 if it is invalid."""
+    if name not in params:
+        if default is None:
+            raise HTTPError(400, f"missing parameter '{name}'")
+        return default
+    try:
+        return int(params[name])
+    except ValueError:
+        raise HTTPError(400, f"parameter '{name}' must be an integer") from None
+
+
+class QueryServer:
+    """asyncio HTTP/1.1 front end for a :class:`TuneService`.
+
+    Parameters
+    ----------
+    service : TuneService
+        The service answering the queries.
+    workers : int, optional
+        Size of the thread pool used for searches, filters and
+        statistics.
+    """
+
+    def __init__(self, service: TuneService, workers: int = SERVICE_WORKERS) -> None:
+        self.service = service
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="query")
+        self.requests = 0
+
+    def _route(self, path: str) -> Tuple[Callable, bool]:
+        """Return the handler for ``path`` and whether it is heavy.
+
+        Heavy handlers run on the thread pool; coroutine handlers are
+        awaited (they use the async database API); the others are
+        cheap enough to answer on the event loop.
+        """
+        if path == "/health":
+            return self.service.health, False
+        if path == "/search":
+            return self.service.search, True
+        if path == "/tunes":
+            return self.service.filter, True
+        if path == "/stats":
+            return self.service.stats, False
+        if path.startswith("/tunes/"):
+            try:
+                tune_id = int(path[len("/tunes/"):])
+            except ValueError:
+                raise HTTPError(404, f"no such path {path!r}") from None
+            return (lambda params: self.service.tune(tune_id)), False
+        raise HTTPError(404, f"no such path {path!r}")
+
+    async def respond(self, method: str, target: str) -> Tuple[int, Dict]:
+        """Run the query for one request and return ``(status, body)``."""
+        try:
+            if method not in ("GET", "HEAD"):
+                raise HTTPError(405, "only GET is supported")
+            url = urlsplit(target)
+            params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+            handler, heavy = self._route(unquote(url.path))
+            if heavy:
+                loop = asyncio.get_running_loop()
+                body = await loop.run_in_executor(self.executor, handler, params)
+            elif asyncio.iscoroutinefunction(handler):
+                body = await handler(params)
+            else:
+                body = handler(params)
+            return 200, body
+        except HTTPError as error:
+            return error.status, {"error": str(error)}
+        except Exception:
+            traceback.print_exc()
+            return 500, {"error": "internal error"}
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Serve requests on one connection until it is closed."""
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(
+                        reader.readuntil(b"\r\n\r\n"), SERVICE_IDLE_TIMEOUT_SECONDS
+                    )
+                except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+                    break
+                except asyncio.LimitOverrunError:
+                    await self._send(writer, 431, {"error": "request head too large"}, False, "GET")
+                    break
+
+                lines = head.decode("latin-1").split("\r\n")
+                try:
+                    method, target, version = lines[0].split(" ")
+                except ValueError:
+                    await self._send(writer, 400, {"error": "malformed request line"}, False, "GET")
+                    break
+                headers = {}
+                for line in lines[1:]:
+                    name, _, value = line.partition(":")
+                    if name:
+                        headers[name.strip().lower()] = value.strip()
+                # Request bodies are not used, but must be skipped to
+                # keep the connection in sync
+                try:
+                    length = int(headers.get("content-length", "0") or 0)
+                    if length < 0:
+                        raise ValueError(length)
+                except ValueError:
+                    await self._send(writer, 400, {"error": "malformed content-length"}, False, "GET")
+                    break
+                if length:
+                    try:
+                        await reader.readexactly(length)
+                    except asyncio.IncompleteReadError:
+                        break
+
+                connection = headers.get("connection", "").lower()
+                keep_alive = (
+                    connection != "close" if version == "HTTP/1.1" else connection == "keep-alive"
+                )
+                status, body = await self.respond(method, target)
+                self.requests += 1
+                await self._send(writer, status, body, keep_alive, method)
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _send(writer: asyncio.StreamWriter, status: int, body: Dict, keep_alive: bool, method: str) -> None:
+        """Write one JSON response."""
+        payload = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        head = (
+            f"HTTP/1.1 {status} {_REASONS.get(status, '')}\r\n"
+            "Content-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(payload)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+            "\r\n"
+        ).encode("latin-1")
+        writer.write(head if method == "HEAD" else head + payload)
+        await writer.drain()
+
+    async def _refresh_periodically(self) -> None:
+        """Reload the frame in the background after new ingests."""
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(SERVICE_REFRESH_SECONDS)
+            try:
+                if await loop.run_in_executor(self.executor, self.service.refresh):
+                    print(f"Reloaded tunes (generation {self.service.generation})", file=sys.stderr)
+            except Exception:
+                traceback.print_exc()
+
+    async def serve(self, host: str = SERVICE_HOST, port: int = SERVICE_PORT) -> None:
+        """Load the tunes and serve until cancelled."""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.executor, self.service.refresh)
+        server = await asyncio.start_server(
+            self.handle_connection, host, port, limit=MAX_HEAD_BYTES, backlog=1024
+        )
+        refresher = asyncio.create_task(self._refresh_periodically())
+        addresses = ", ".join(str(sock.getsockname()[:2]) for sock in server.sockets)
+        print(f"Serving {len(self.service)} tunes on {addresses}", file=sys.stderr)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            refresher.cancel()
+            self.executor.shutdown(wait=False)
+            self.service.db.close()
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    """Start the service from the command line."""
+    parser = argparse.ArgumentParser(description="Serve tune queries over HTTP/JSON.")
+    parser.add_argument("--host", default=SERVICE_HOST, help=f"address to listen on (default: {SERVICE_HOST})")
+    parser.add_argument("--port", type=int, default=SERVICE_PORT, help=f"port to listen on (default: {SERVICE_PORT})")
+    parser.add_argument("--workers", type=int, default=SERVICE_WORKERS, help="query worker threads")
+    parser.add_argument("--watch", action="store_true", help="re-ingest ABC files as they change")
+    args = parser.parse_args(argv)
+    service = TuneService()
+    server = QueryServer(service, args.workers)
+    if args.watch:
+        from abc_watcher import AbcWatcher
+
+        # Reload straight after a re-ingest instead of at the next check
+        AbcWatcher(on_change=lambda summary: service.refresh()).start()
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
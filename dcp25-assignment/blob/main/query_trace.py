@@ -0,0 +1,399 @@
+"""Opt-in tracing of the SQL statements sent to SQLite.
+
+While tracing is enabled (:data:`config.QUERY_TRACE_ENABLED`, or
+:func:`enable` before the first query), every connection opened by
+:class:`db_connection.ConnectionManager` is a :class:`TracedConnection`.
+Each statement is timed from ``execute`` until its cursor has returned
+its last row, counting only the time spent inside SQLite calls, not in
+the code consuming the rows. Then:
+
+* the duration is added to a latency histogram for the statement, keyed
+  by its SQL with whitespace and ``IN (?, ?, ...)`` lists collapsed, so
+  the same query with other filter values counts as one statement;
+* statements slower than :data:`config.SLOW_QUERY_MS` are written to
+  :data:`config.SLOW_QUERY_LOG_PATH` with their parameters, duration
+  and ``EXPLAIN QUERY PLAN`` output, which shows whether a filter used
+  an index (``SEARCH ... USING INDEX``) or read the whole table
+  (``SCAN``).
+
+:func:`report` and :func:`format_report` summarise the histograms; the
+statistics screens of both UIs show them while tracing is on. While it
+is off, connections are plain :class:`sqlite3.Connection` objects and
+nothing is timed.
+"""
+
+from __future__ import annotations
+
+from collections import deque
+from typing import Deque, Dict, List, Sequence
+import re
+import sqlite3
+import threading
+import time
+
+from config import (
+    QUERY_TRACE_BUCKETS_MS,
+    QUERY_TRACE_ENABLED,
+    SLOW_QUERY_LOG_PATH,
+    SLOW_QUERY_MS,
+)
+
+
+_enabled = QUERY_TRACE_ENABLED
+_slow_ms = SLOW_QUERY_MS
+_log_path = SLOW_QUERY_LOG_PATH
+_lock = threading.Lock()
+_statements: Dict[str, "_Histogram"] = {}
+# The latest slow statements, for display without reading the log back
+_recent_slow: Deque[Dict] = deque(maxlen=20)
+
+_WHITESPACE = re.compile(r"\s+")
+_PLACEHOLDER_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+# Only these statements have a query plan worth capturing
+_EXPLAINABLE = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE", "REPLACE")
+
+
+class _Histogram:
+    """Latency histogram of one normalised statement."""
+
+    __slots__ = ("calls", "rows", "total", "max", "buckets")
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.rows = 0
+        self.total = 0.0
+        self.max = 0.0
+        # One bucket per bound in QUERY_TRACE_BUCKETS_MS plus an overflow
+        self.buckets = [0] * (len(QUERY_TRACE_BUCKETS_MS) + 1)
+
+    def add(self, seconds: float, rows: int) -> None:
+        self.calls += 1
+        self.rows += rows
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        ms = seconds * 1000
+        index = 0
+        while index < len(QUERY_TRACE_BUCKETS_MS) and ms > QUERY_TRACE_BUCKETS_MS[index]:
+            index += 1
+        self.buckets[index] += 1
+
+    def percentile_ms(self, fraction: float) -> float:
+        """Upper bound of the bucket holding the given fraction of calls.
+
+        The bound is capped at the slowest call seen.
+        """
+        needed = fraction * self.calls
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if seen >= needed and count:
+                if index < len(QUERY_TRACE_BUCKETS_MS):
+                    return min(float(QUERY_TRACE_BUCKETS_MS[index]), self.max * 1000)
+                break
+        return self.max * 1000
+
+
+def enabled() -> bool:
+    """Return whether newly opened connections are traced."""
+    return _enabled
+
+
+def enable(on: bool = True, slow_ms: float | None = None, log_path: str | None = None) -> None:
+    """Turn tracing on (or off with ``on=False``).
+
+    Only connections opened afterwards are affected, so call this
+    before the first query, e.g. at program start.
+
+    Parameters
+    ----------
+    on : bool, optional
+        Whether to trace.
+    slow_ms : float or None, optional
+        Threshold for the slow-query log; :data:`config.SLOW_QUERY_MS`
+        if ``None``.
+    log_path : str or None, optional
+        Slow-query log file; :data:`config.SLOW_QUERY_LOG_PATH` if
+        ``None``.
+    """
+    global _enabled, _slow_ms, _log_path
+    _enabled = on
+    if slow_ms is not None:
+        _slow_ms = slow_ms
+    if log_path is not None:
+        _log_path = log_path
+
+
+def reset() -> None:
+    """Forget the histograms and recent slow statements."""
+    with _lock:
+        _statements.clear()
+        _recent_slow.clear()
+
+
+def connection_factory() -> type:
+    """Return the connection class new connections should use."""
+    return TracedConnection if _enabled else sqlite3.Connection
+
+
+def normalise_sql(sql: str) -> str:
+    """Return the histogram key of a statement.
+
+    Whitespace runs become one space and placeholder lists such as
+    ``IN (?, ?, ?)`` become ``(?...)``, so statements that only differ
+    in layout or in the number of values share a histogram.
+    """
+    sql = _WHITESPACE.sub(" ", sql).strip()
+    return _PLACEHOLDER_LIST.sub("(?...)", sql)
+
+
+def _explain(conn: sqlite3.Connection, sql: str, parameters) -> List[str]:
+    """Return the ``EXPLAIN QUERY PLAN`` lines of a statement."""
+    if not sql.lstrip().upper().startswith(_EXPLAINABLE):
+        return []
+    try:
+        # sqlite3.Connection.execute bypasses tracing of the EXPLAIN itself
+        rows = sqlite3.Connection.execute(conn, f"EXPLAIN QUERY PLAN {sql}", parameters).fetchall()
+    except sqlite3.Error as error:
+        return [f"(no plan: {error})"]
+    # Rows are (id, parent, notused, detail); indent children under parents
+    depth = {0: 0}
+    lines = []
+    for node, parent, _, detail in rows:
+        depth[node] = depth.get(parent, 0) + 1
+        lines.append("  " * (depth[node] - 1) + detail)
+    return lines
+
+
+def _record(conn: sqlite3.Connection, sql: str, parameters, seconds: float, rows: int) -> None:
+    key = normalise_sql(sql)
+    with _lock:
+        entry = _statements.get(key)
+        if entry is None:
+            entry = _statements[key] = _Histogram()
+        entry.add(seconds, rows)
+    if seconds * 1000 < _slow_ms:
+        return
+    slow = {
+        "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "ms": seconds * 1000,
+        "rows": rows,
+        "sql": _WHITESPACE.sub(" ", sql).strip(),
+        "parameters": parameters,
+        "plan": _explain(conn, sql, parameters),
+    }
+    with _lock:
+        _recent_slow.append(slow)
+        with open(_log_path, "a", encoding="utf-8") as log:
+            log.write(_format_slow(slow) + "\n")
+
+
+def _format_slow(slow: Dict) -> str:
+    parameters = repr(slow["parameters"])
+    if len(parameters) > 500:
+        # Inserts carry whole tunes as parameters
+        parameters = parameters[:497] + "..."
+    lines = [
+        f"# {slow['time']}  {slow['ms']:.1f} ms  {slow['rows']} rows",
+        slow["sql"],
+        f"-- parameters: {parameters}",
+    ]
+    lines += [f"-- plan: {line}" for line in slow["plan"]]
+    return "\n".join(lines)
+
+
+class TracedCursor(sqlite3.Cursor):
+    """Cursor that times its statement until all rows are fetched.
+
+    The statement is recorded once its rows run out, when the next
+    statement is executed on the cursor, or when it is closed.
+    """
+
+    _sql: str | None = None
+
+    def _start(self, sql: str, parameters, seconds: float) -> None:
+        self._sql = sql
+        self._parameters = parameters
+        self._seconds = seconds
+        self._rows = 0
+
+    def _finish(self) -> None:
+        if self._sql is not None:
+            sql, self._sql = self._sql, None
+            _record(self.connection, sql, self._parameters, self._seconds, self._rows)
+
+    def _timed_fetch(self, fetch, *args):
+        start = time.perf_counter()
+        result = fetch(*args)
+        if self._sql is not None:
+            self._seconds += time.perf_counter() - start
+        return result
+
+    def execute(self, sql: str, parameters: Sequence | Dict = ()) -> "TracedCursor":
+        self._finish()
+        start = time.perf_counter()
+        super().execute(sql, parameters)
+        self._start(sql, parameters, time.perf_counter() - start)
+        if self.description is None:
+            # Statements without a result set are complete already
+            self._finish()
+        return self
+
+    def executemany(self, sql: str, seq_of_parameters) -> "TracedCursor":
+        self._finish()
+        rows = seq_of_parameters if isinstance(seq_of_parameters, (list, tuple)) else list(seq_of_parameters)
+        start = time.perf_counter()
+        super().executemany(sql, rows)
+        self._start(sql, rows[0] if rows else (), time.perf_counter() - start)
+        self._rows = len(rows)
+        self._finish()
+        return self
+
+    def executescript(self, sql_script: str) -> "TracedCursor":
+        self._finish()
+        start = time.perf_counter()
+        super().executescript(sql_script)
+        self._start(sql_script, (), time.perf_counter() - start)
+        self._finish()
+        return self
+
+    def fetchone(self):
+        row = self._timed_fetch(super().fetchone)
+        if row is None:
+            self._finish()
+        elif self._sql is not None:
+            self._rows += 1
+        return row
+
+    def fetchmany(self, size: int | None = None) -> List:
+        rows = self._timed_fetch(super().fetchmany, self.arraysize if size is None else size)
+        if self._sql is not None:
+            self._rows += len(rows)
+        if not rows:
+            self._finish()
+        return rows
+
+    def fetchall(self) -> List:
+        rows = self._timed_fetch(super().fetchall)
+        if self._sql is not None:
+            self._rows += len(rows)
+        self._finish()
+        return rows
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._finish()
+            raise
+        if self._sql is not None:
+            self._seconds += time.perf_counter() - start
+            self._rows += 1
+        return row
+
+    def close(self) -> None:
+        self._finish()
+        super().close()
+
+    def __del__(self) -> None:
+        # A cursor dropped before its last row still counts
+        try:
+            self._finish()
+        except Exception:
+            pass
+
+
+class TracedConnection(sqlite3.Connection):
+    """Connection whose cursors, including implicit ones, are traced."""
+
+    def cursor(self, factory: type = TracedCursor) -> sqlite3.Cursor:
+        return super().cursor(factory)
+
+    # sqlite3.Connection's shortcuts create an untraced cursor in C, so
+    # they are redirected through cursor()
+    def execute(self, sql: str, parameters: Sequence | Dict = ()) -> sqlite3.Cursor:
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql: str, seq_of_parameters) -> sqlite3.Cursor:
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script: str) -> sqlite3.Cursor:
+        return self.cursor().executescript(sql_script)
+
+
+def report() -> List[Dict]:
+    """Summarise the statement histograms, slowest in total first.
+
+    Returns
+    -------
+    list of dict
+        Per statement its ``sql`` key, ``calls``, ``rows``,
+        ``total_ms``, ``mean_ms``, ``p50_ms``, ``p95_ms`` and
+        ``max_ms``, and ``buckets``: the call count per upper bound in
+        milliseconds (``None`` for the overflow bucket). Percentiles
+        are the upper bound of the bucket they fall into, at most
+        ``max_ms``.
+    """
+    bounds = list(QUERY_TRACE_BUCKETS_MS) + [None]
+    with _lock:
+        rows = [
+            {
+                "sql": sql,
+                "calls": entry.calls,
+                "rows": entry.rows,
+                "total_ms": entry.total * 1000,
+                "mean_ms": entry.total * 1000 / entry.calls,
+                "p50_ms": entry.percentile_ms(0.50),
+                "p95_ms": entry.percentile_ms(0.95),
+                "max_ms": entry.max * 1000,
+                "buckets": dict(zip(bounds, entry.buckets)),
+            }
+            for sql, entry in _statements.items()
+        ]
+    return sorted(rows, key=lambda row: -row["total_ms"])
+
+
+def recent_slow() -> List[Dict]:
+    """Return the latest slow statements, oldest first."""
+    with _lock:
+        return list(_recent_slow)
+
+
+def format_histogram(buckets: Dict) -> str:
+    """Return a one-line text histogram such as ``<=1:12 <=5:3 >250:1``."""
+    parts = []
+    previous = None
+    for bound, count in buckets.items():
+        if count:
+            parts.append(f"<={bound:g}:{count}" if bound is not None else f">{previous:g}:{count}")
+        previous = bound
+    return " ".join(parts)
+
+
+def format_report(limit: int = 15, width: int = 70) -> str:
+    """Return the per-statement latencies as a plain-text table.
+
+    Parameters
+    ----------
+    limit : int, optional
+        Statements shown, slowest in total first.
+    width : int, optional
+        Characters of SQL shown per statement.
+    """
+    rows = report()
+    if not rows:
+        return "No SQL statements traced yet."
+    lines = [f"{'calls':>7} {'total ms':>10} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8}  statement / histogram (ms)"]
+    for row in rows[:limit]:
+        sql = row["sql"] if len(row["sql"]) <= width else row["sql"][:width - 3] + "..."
+        lines.append(
+            f"{row['calls']:>7} {row['total_ms']:>10.1f} {row['p50_ms']:>8.2f} {row['p95_ms']:>8.2f} "
+            f"{row['max_ms']:>8.1f}  {sql}"
+        )
+        lines.append(f"{'':>45}  {format_histogram(row['buckets'])}")
+    if len(rows) > limit:
+        lines.append(f"... and {len(rows) - limit} more statements")
+    slow = recent_slow()
+    if slow:
+        lines.append(f"{len(slow)} recent statements over {_slow_ms:g} ms, see {_log_path}")
+    return "\n".join(lines)
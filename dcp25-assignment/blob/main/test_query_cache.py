@@ -0,0 +1,59 @@
+"""Tests for the query result cache."""
+
+from __future__ import annotations
+
+import gc
+
+import pandas as pd
+import pytest
+
+import query_cache
+from query_cache import QueryCache, cached_query
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache(monkeypatch):
+    cache = QueryCache()
+    monkeypatch.setattr(query_cache, "query_cache", cache)
+    return cache
+
+
+@pytest.fixture
+def tunes() -> pd.DataFrame:
+    df = pd.DataFrame({
+        "id": [1, 2, 3, 4],
+        "book_number": [1, 1, 2, 2],
+        "title": ["Ae Fond Kiss", "Banish Misfortune", "Cliffs of Moher", "Drowsy Maggie"],
+    })
+    df.attrs["ingest_generation"] = 1
+    return df
+
+
+@cached_query()
+def _titles(df: pd.DataFrame) -> list:
+    return df["title"].tolist()
+
+
+def test_equal_length_slices_do_not_share_results(tunes):
+    book_1 = tunes[tunes["book_number"] == 1]
+    book_2 = tunes[tunes["book_number"] == 2]
+    assert book_1.attrs["ingest_generation"] == book_2.attrs["ingest_generation"]
+
+    assert _titles(book_1) == ["Ae Fond Kiss", "Banish Misfortune"]
+    assert _titles(book_2) == ["Cliffs of Moher", "Drowsy Maggie"]
+    assert _titles(tunes.head(2)) == ["Ae Fond Kiss", "Banish Misfortune"]
+    assert _titles(tunes.iloc[2:]) == ["Cliffs of Moher", "Drowsy Maggie"]
+
+
+def test_same_frame_hits_the_cache(tunes, fresh_cache):
+    _titles(tunes)
+    _titles(tunes)
+    assert fresh_cache.stats()["hits"] == 1
+    assert fresh_cache.stats()["misses"] == 1
+
+
+def test_entries_of_collected_frames_are_dropped(tunes, fresh_cache):
+    _titles(tunes.head(2))
+    gc.collect()
+    _titles(tunes)
+    assert fresh_cache.stats()["entries"] == 1
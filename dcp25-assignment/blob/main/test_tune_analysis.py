@@ -0,0 +1,52 @@
+"""Tests for the DataFrame analysis helpers."""
+
+from __future__ import annotations
+
+import pandas as pd
+import pytest
+
+import query_cache
+from query_cache import QueryCache
+import tune_analysis
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache(monkeypatch):
+    monkeypatch.setattr(query_cache, "query_cache", QueryCache())
+
+
+@pytest.fixture
+def tunes() -> pd.DataFrame:
+    df = pd.DataFrame({
+        "id": [1, 2, 3, 4, 5, 6],
+        "book_number": [1, 1, 1, 2, 2, 2],
+        "title": ["Cooley's", "Ae Fond Kiss", "Banish Misfortune", "Drowsy Maggie", "Star of Munster", "Kesh, The"],
+        "key_signature": ["Edor", "D", "Dmix", "Edor", "Ador", "G"],
+        "cluster_id": [1, 2, 2, 4, 5, 4],
+    })
+    df.attrs["ingest_generation"] = 1
+    return df
+
+
+def test_top_tunes_on_equal_length_slices(tunes):
+    book_1 = tune_analysis.get_tunes_by_book(tunes, 1)
+    book_2 = tune_analysis.get_tunes_by_book(tunes, 2)
+
+    assert tune_analysis.top_tunes(book_1, "title", 2)["title"].tolist() == ["Ae Fond Kiss", "Banish Misfortune"]
+    assert tune_analysis.top_tunes(book_2, "title", 2)["title"].tolist() == ["Drowsy Maggie", "Kesh, The"]
+
+
+def test_collapsed_searches_of_equal_length(tunes):
+    # "ish" and "kes" both leave one row to collapse; each search must
+    # keep its own row
+    first = tune_analysis.search_tunes(tunes, "a", collapse=True)
+    assert first["title"].tolist() == ["Ae Fond Kiss", "Drowsy Maggie", "Star of Munster"]
+    assert tune_analysis.search_tunes(tunes, "ish", collapse=True)["title"].tolist() == ["Banish Misfortune"]
+    assert tune_analysis.search_tunes(tunes, "kes", collapse=True)["title"].tolist() == ["Kesh, The"]
+
+
+def test_search_terms_differing_in_case_are_cached_apart(tunes):
+    # The term is a regular expression, so \d and \D are different searches
+    tunes.loc[0, "title"] = "Reel No. 2"
+    assert tune_analysis.search_tunes(tunes, r"\d")["title"].tolist() == ["Reel No. 2"]
+    assert len(tune_analysis.search_tunes(tunes, r"\D")) == 6
@@ -0,0 +1,46 @@
+"""Tests for the tune count cube."""
+
+from __future__ import annotations
+
+import itertools
+
+import pytest
+
+from tune_cube import DIMENSIONS, TuneCube
+
+
+ROWS = [
+    # book, key, meter, rhythm, count
+    (1, "D", "6/8", "jig", 5),
+    (1, "G major", "6/8", "jig", 3),
+    (1, "Ador", "4/4", "reel", 4),
+    (2, "D", "4/4", "reel", 6),
+    (2, None, "3/4", "waltz", 2),
+    (2, "Edor", "9/8", "slip jig", 1),
+    (None, "Bm", "2/4", "polka", 1),
+]
+
+
+def test_unknown_value_is_not_the_missing_bucket():
+    cube = TuneCube.from_aggregates(ROWS, generation=1)
+    assert cube.total(key="Zz") == 0
+    assert cube.total(key=None) == 2
+    assert cube.total(key="G") == 3
+
+
+@pytest.mark.parametrize("max_cells", [40, 4, 1])
+def test_capped_cube_gives_the_same_answers(max_cells, tmp_path):
+    full = TuneCube.from_aggregates(ROWS, generation=1)
+    capped = TuneCube.from_aggregates(ROWS, generation=1, max_cells=max_cells)
+    assert capped.counts.size <= max(max_cells, len(full.labels["book_number"]))
+    capped.save(str(tmp_path / "cube.npz"))
+    loaded = TuneCube.load(str(tmp_path / "cube.npz"))
+
+    filters = [{}, {"rhythm": "jig"}, {"key": ["D", "Bm"]}, {"book_number": 2, "meter": "4/4"}]
+    for cube in (capped, loaded):
+        for size in range(len(DIMENSIONS)):
+            for by in itertools.combinations(DIMENSIONS, size):
+                for selected in filters:
+                    expected = full.rollup(by, **selected)
+                    actual = cube.rollup(by, **selected)
+                    assert list(actual.items()) == list(expected.items())
@@ -1,11 +1,80 @@
-"""Analysis helpers for working with tune DataFrames."""
+"""Analysis helpers for working with tune DataFrames.
+
+Filters and statistics are cached by :mod:`query_cache` when the
+DataFrame came from :func:`db_utils.load_tunes_from_database`, so
+repeating a menu action on the same data does not rescan it.
+
+The ``get_*_counts`` and collection statistics functions read the
+aggregate tables maintained by the ingest path instead of a
+DataFrame, so their cost depends on the number of groups rather than
+the number of tunes. The ``cube_*`` functions answer arbitrary
+roll-ups over book, key, meter and rhythm from the precomputed
+:class:`tune_cube.TuneCube`.
+
+Searches and statistics take ``collapse=True`` to count each cluster
+of duplicate tunes found by :mod:`tune_clusters` once, keeping one
+representative per cluster.
+"""
 
 from __future__ import annotations
 
+from bisect import bisect_right
+from itertools import accumulate
+from typing import TYPE_CHECKING, Dict, List, Sequence
+import heapq
+import os
+import re
+import threading
+
 import pandas as pd
 
+from config import CUBE_PATH, PAGE_SIZE
+from db_connection import get_manager
+from db_utils import (
+    get_ingest_generation,
+    load_aggregate_counts,
+    load_aggregate_crosstab,
+    load_aggregate_total,
+    load_cluster_counts,
+    load_cluster_total,
+    rebuild_tune_cube,
+)
+import metrics
+from query_cache import cached_query, query_cache
+
+if TYPE_CHECKING:
+    from tune_cube import TuneCube
+
+
+@metrics.timed("query.collapse_clusters")
+def collapse_clusters(df: pd.DataFrame) -> pd.DataFrame:
+    """Keep one tune of each duplicate cluster.
 
-def get_tunes_by_book(df: pd.DataFrame, book_number: int) -> pd.DataFrame:
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        DataFrame of tunes, e.g. search results.
+
+    Returns
+    -------
+    pandas.DataFrame
+        The first row of ``df`` from every cluster; rows without a
+        ``cluster_id`` (not clustered yet) are all kept. A frame
+        without the column is returned unchanged.
+    """
+    if "cluster_id" not in df:
+        return df
+    clusters = df["cluster_id"].fillna(df["id"])
+    return df[~clusters.duplicated()]
+
+
+def _collapsed(df: pd.DataFrame, collapse: bool) -> pd.DataFrame:
+    return collapse_clusters(df) if collapse else df
+
+
+@metrics.timed("query.get_tunes_by_book")
+@cached_query()
+def get_tunes_by_book(df: pd.DataFrame, book_number: int, collapse: bool = False) -> pd.DataFrame:
     """Filter tunes by book number.
 
     Parameters
@@ -14,6 +83,8 @@ def get_tunes_by_book(df: pd.DataFrame, book_number: int) -> pd.DataFrame:
         DataFrame containing all tunes.
     book_number : int
         Book number to select.
+    collapse : bool, optional
+        Keep one tune per duplicate cluster.
 
     Returns
     -------
@@ -21,10 +92,12 @@ def get_tunes_by_book(df: pd.DataFrame, book_number: int) -> pd.DataFrame:
         Subset of ``df`` containing only rows whose
         ``book_number`` matches ``book_number``.
     """
-    return df[df["book_number"] == book_number]
+    return _collapsed(df[df["book_number"] == book_number], collapse)
 
 
-def get_tunes_by_meter(df: pd.DataFrame, meter: str) -> pd.DataFrame:
+@metrics.timed("query.get_tunes_by_meter")
+@cached_query()
+def get_tunes_by_meter(df: pd.DataFrame, meter: str, collapse: bool = False) -> pd.DataFrame:
     """Filter tunes by meter string.
 
     Parameters
@@ -33,16 +106,20 @@ def get_tunes_by_meter(df: pd.DataFrame, meter: str) -> pd.DataFrame:
         DataFrame containing all tunes.
     meter : str
         Meter value to filter for, e.g. ``"4/4"``.
+    collapse : bool, optional
+        Keep one tune per duplicate cluster.
 
     Returns
     -------
     pandas.DataFrame
         Subset of ``df`` with the given meter.
     """
-    return df[df["meter"] == meter]
+    return _collapsed(df[df["meter"] == meter], collapse)
 
 
-def get_tunes_by_key(df: pd.DataFrame, key_sig: str) -> pd.DataFrame:
+@metrics.timed("query.get_tunes_by_key")
+@cached_query()
+def get_tunes_by_key(df: pd.DataFrame, key_sig: str, collapse: bool = False) -> pd.DataFrame:
     """Filter tunes by key signature.
 
     Parameters
@@ -51,16 +128,20 @@ def get_tunes_by_key(df: pd.DataFrame, key_sig: str) -> pd.DataFrame:
         DataFrame containing all tunes.
     key_sig : str
         Key signature to filter for, e.g. ``"C"`` or ``"Dm"``.
+    collapse : bool, optional
+        Keep one tune per duplicate cluster.
 
     Returns
     -------
     pandas.DataFrame
         Subset of ``df`` with the given key signature.
     """
-    return df[df["key_signature"] == key_sig]
+    return _collapsed(df[df["key_signature"] == key_sig], collapse)
 
 
-def search_tunes(df: pd.DataFrame, search_term: str) -> pd.DataFrame:
+@metrics.timed("query.search_tunes")
+@cached_query(normalize=lambda term, collapse=False: (term, collapse))
+def search_tunes(df: pd.DataFrame, search_term: str, collapse: bool = False) -> pd.DataFrame:
     """Search tunes by (case-insensitive) substring in the title.
 
     Parameters
@@ -69,6 +150,9 @@ def search_tunes(df: pd.DataFrame, search_term: str) -> pd.DataFrame:
         DataFrame containing all tunes.
     search_term : str
         Substring to search for in tune titles.
+    collapse : bool, optional
+        Keep one tune per duplicate cluster: the first match, so a
+        variant whose title matches stands in for its cluster.
 
     Returns
     -------
@@ -76,23 +160,279 @@ def search_tunes(df: pd.DataFrame, search_term: str) -> pd.DataFrame:
         Subset of ``df`` whose ``title`` column contains
         ``search_term``.
     """
-    return df[df["title"].str.contains(search_term, case=False, na=False)]
+    return _collapsed(df[df["title"].str.contains(search_term, case=False, na=False)], collapse)
+
+
+class SearchCancelled(Exception):
+    """Raised by :class:`TitleSearchIndex` when a search is cancelled."""
+
+
+class TitleSearchIndex:
+    """Case-insensitive substring search over tune titles.
+
+    The lower-cased titles are kept both as a list and joined into one
+    string. A search for a rare term over every title is a C-level
+    scan of that string; a common term is checked title by title; and
+    a refined search (the user typed one more character) only
+    re-checks the rows matched by the previous query.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        DataFrame containing all tunes.
+    """
+
+    # Rows checked (or matches found) between cancellation checks
+    CHECK_EVERY = 8192
+
+    def __init__(self, df: pd.DataFrame) -> None:
+        self.titles: List[str] = [
+            title.lower() if isinstance(title, str) else "" for title in df["title"].tolist()
+        ]
+        # "\0" cannot be typed into a query, so no match spans two titles
+        self._blob = "\0".join(self.titles)
+        self._starts: List[int] = list(accumulate((len(t) + 1 for t in self.titles), initial=0))
+
+    def __len__(self) -> int:
+        return len(self.titles)
+
+    @metrics.timed("query.TitleSearchIndex.search")
+    def search(
+        self,
+        term: str,
+        candidates: Sequence[int] | None = None,
+        cancel: threading.Event | None = None,
+    ) -> List[int]:
+        """Return the positions of the rows whose title contains ``term``.
+
+        Parameters
+        ----------
+        term : str
+            Substring to look for; matched literally and
+            case-insensitively.
+        candidates : sequence of int or None, optional
+            Row positions to restrict the search to, typically the
+            result for a prefix of ``term``. If ``None``, every row is
+            searched.
+        cancel : threading.Event or None, optional
+            When set by another thread the search stops early.
+
+        Returns
+        -------
+        list of int
+            Matching row positions in ascending order.
+
+        Raises
+        ------
+        SearchCancelled
+            If ``cancel`` was set before the search finished.
+        """
+        term = term.lower()
+        if not term:
+            return list(range(len(self.titles))) if candidates is None else list(candidates)
+
+        if candidates is None and self._blob.count(term) > len(self.titles) // 8:
+            # Common terms: checking every title beats locating every match
+            candidates = range(len(self.titles))
+
+        matches: List[int] = []
+        if candidates is not None:
+            titles = self.titles
+            for start in range(0, len(candidates), self.CHECK_EVERY):
+                if cancel is not None and cancel.is_set():
+                    raise SearchCancelled(term)
+                chunk = candidates[start:start + self.CHECK_EVERY]
+                matches.extend(i for i in chunk if term in titles[i])
+            return matches
+
+        last = -1
+        for count, match in enumerate(re.finditer(re.escape(term), self._blob)):
+            if count % self.CHECK_EVERY == 0 and cancel is not None and cancel.is_set():
+                raise SearchCancelled(term)
+            row = bisect_right(self._starts, match.start()) - 1
+            if row != last:
+                matches.append(row)
+                last = row
+        return matches
+
+
+_search_index: tuple | None = None
+
+
+@metrics.timed("query.get_title_search_index")
+def get_title_search_index(df: pd.DataFrame) -> TitleSearchIndex:
+    """Return a :class:`TitleSearchIndex` for ``df``, reusing the last one.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        DataFrame containing all tunes.
+
+    Returns
+    -------
+    TitleSearchIndex
+        Index whose row positions refer to ``df.iloc``.
+    """
+    global _search_index
+    key = (id(df), len(df), df.attrs.get("ingest_generation"))
+    if _search_index is None or _search_index[0] != key:
+        _search_index = (key, TitleSearchIndex(df))
+    return _search_index[1]
+
+
+# Column and sort-key function for each order key accepted by
+# top_tunes(); they order rows the same way as db_utils.list_tunes().
+_FRAME_ORDER_KEYS = {
+    "title": ("title", lambda value: value.lower() if isinstance(value, str) else ""),
+    "book": ("book_number", lambda value: -1 if pd.isna(value) else value),
+    "key": ("key_signature", lambda value: value if isinstance(value, str) else ""),
+}
+
 
+@metrics.timed("query.top_tunes")
+@cached_query()
+def top_tunes(
+    df: pd.DataFrame,
+    order_by: str = "title",
+    limit: int = PAGE_SIZE,
+    offset: int = 0,
+    descending: bool = False,
+) -> pd.DataFrame:
+    """Return one sorted page of a DataFrame of tunes.
 
-def count_tunes_by_book(df: pd.DataFrame) -> pd.Series:
+    Only the first ``offset + limit`` rows are ordered, using a heap,
+    so a page costs O(n log(offset + limit)) instead of sorting every
+    row.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        DataFrame containing tunes, e.g. search results.
+    order_by : str, optional
+        One of ``"title"`` (case-insensitive), ``"book"`` or ``"key"``.
+        Ties are broken by tune id.
+    limit : int, optional
+        Maximum number of rows to return.
+    offset : int, optional
+        Number of rows to skip.
+    descending : bool, optional
+        Sort in descending instead of ascending order.
+
+    Returns
+    -------
+    pandas.DataFrame
+        At most ``limit`` rows of ``df`` in sorted order.
+    """
+    if order_by not in _FRAME_ORDER_KEYS:
+        raise ValueError(f"Unknown order key: {order_by!r}")
+    column, sort_key = _FRAME_ORDER_KEYS[order_by]
+    ids = df["id"].tolist() if "id" in df else range(len(df))
+    keys = (
+        (sort_key(value), tune_id, position)
+        for position, (value, tune_id) in enumerate(zip(df[column].tolist(), ids))
+    )
+    select = heapq.nlargest if descending else heapq.nsmallest
+    chosen = select(offset + limit, keys)[offset:]
+    return df.iloc[[position for _, _, position in chosen]]
+
+
+@metrics.timed("query.count_tunes_by_book")
+@cached_query()
+def count_tunes_by_book(df: pd.DataFrame, collapse: bool = False) -> pd.Series:
     """Count the number of tunes for each book.
 
     Parameters
     ----------
     df : pandas.DataFrame
         DataFrame containing all tunes.
+    collapse : bool, optional
+        Count each duplicate cluster once.
 
     Returns
     -------
     pandas.Series
         A Series indexed by book number with counts as values.
     """
-    return df["book_number"].value_counts().sort_index()
+    return _collapsed(df, collapse)["book_number"].value_counts().sort_index()
+
+
+@metrics.timed("query.count_tunes_by_column")
+@cached_query()
+def count_tunes_by_column(df: pd.DataFrame, column: str, collapse: bool = False) -> pd.Series:
+    """Count tunes per distinct value of a column, most common first.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        DataFrame containing all tunes.
+    column : str
+        Column to count, e.g. ``"key_signature"`` or ``"meter"``.
+    collapse : bool, optional
+        Count each duplicate cluster once.
+
+    Returns
+    -------
+    pandas.Series
+        A Series indexed by column value with counts as values,
+        sorted in descending order of count.
+    """
+    return _collapsed(df, collapse)[column].value_counts()
+
+
+@metrics.timed("query.get_tune_statistics")
+@cached_query()
+def get_tune_statistics(df: pd.DataFrame, collapse: bool = False) -> Dict:
+    """Compute summary statistics about the collection of tunes.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        DataFrame containing all tunes.
+    collapse : bool, optional
+        Count each duplicate cluster once.
+
+    Returns
+    -------
+    dict
+        Dictionary with ``total_tunes``, ``number_of_books``,
+        ``top_keys`` and ``top_meters`` (the five most common values
+        of each, as Series).
+    """
+    tunes = _collapsed(df, collapse)
+    return {
+        "total_tunes": len(tunes),
+        "number_of_books": tunes["book_number"].nunique(),
+        "top_keys": count_tunes_by_column(df, "key_signature", collapse=collapse).head(5),
+        "top_meters": count_tunes_by_column(df, "meter", collapse=collapse).head(5),
+    }
+
+
+def get_query_cache_stats() -> Dict[str, int]:
+    """Return the hit/miss counters of the analysis query cache.
+
+    Returns
+    -------
+    dict
+        See :meth:`query_cache.QueryCache.stats`.
+    """
+    return query_cache.stats()
+
+
+def show_query_cache_stats() -> None:
+    """Print the hit/miss counters and memory use of the query cache.
+
+    Returns
+    -------
+    None
+        The function prints to standard output and does not
+        return a value.
+    """
+    cache = get_query_cache_stats()
+    print(
+        f"Query cache: {cache['hits']} hits, {cache['misses']} misses, "
+        f"{cache['entries']} entries ({cache['bytes'] / 1024:.0f} of "
+        f"{cache['max_bytes'] / 1024:.0f} KiB)"
+    )
 
 
 def show_tune_statistics(df: pd.DataFrame) -> None:
@@ -109,7 +449,222 @@ def show_tune_statistics(df: pd.DataFrame) -> None:
         The function prints to standard output and does not
         return a value.
     """
-    print(f"Total number of tunes: {len(df)}")
-    print(f"Number of books: {df['book_number'].nunique()}")
-    print(f"Most common keys: {df['key_signature'].value_counts().head(5)}")
-    print(f"Most common meters: {df['meter'].value_counts().head(5)}")
+    stats = get_tune_statistics(df)
+    print(f"Total number of tunes: {stats['total_tunes']}")
+    print(f"Number of books: {stats['number_of_books']}")
+    print(f"Most common keys: {stats['top_keys']}")
+    print(f"Most common meters: {stats['top_meters']}")
+    show_query_cache_stats()
+
+
+@metrics.timed("query.get_value_counts")
+def get_value_counts(column: str, collapse: bool = False) -> pd.Series:
+    """Count tunes per value of a column using the aggregate tables.
+
+    Parameters
+    ----------
+    column : str
+        One of ``"book_number"``, ``"key_signature"``, ``"meter"``
+        or ``"rhythm"``.
+    collapse : bool, optional
+        Count each duplicate cluster once. This counts from the
+        ``tunes`` table instead of the aggregates, so it scans every
+        tune.
+
+    Returns
+    -------
+    pandas.Series
+        A Series indexed by column value with counts as values,
+        sorted in descending order of count. Tunes without a value
+        are left out, as with :meth:`pandas.Series.value_counts`.
+    """
+    load_counts = load_cluster_counts if collapse else load_aggregate_counts
+    counts = [(value, n) for value, n in load_counts(column) if value is not None]
+    return pd.Series(
+        [n for _, n in counts],
+        index=pd.Index([value for value, _ in counts], name=column),
+        name="count",
+        dtype="int64",
+    )
+
+
+@metrics.timed("query.get_book_counts")
+def get_book_counts(collapse: bool = False) -> pd.Series:
+    """Count the number of tunes for each book using the aggregates.
+
+    Parameters
+    ----------
+    collapse : bool, optional
+        Count each duplicate cluster once per book.
+
+    Returns
+    -------
+    pandas.Series
+        A Series indexed by book number with counts as values, in
+        the same shape as :func:`count_tunes_by_book`.
+    """
+    return get_value_counts("book_number", collapse).sort_index()
+
+
+@metrics.timed("query.get_crosstab")
+def get_crosstab(rows: str, columns: str) -> pd.DataFrame:
+    """Cross-tabulate tune counts over two dimensions.
+
+    Parameters
+    ----------
+    rows : str
+        Dimension used for the row labels, e.g. ``"book_number"``.
+    columns : str
+        Dimension used for the column labels, e.g. ``"rhythm"``.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Tune counts with one row per value of ``rows`` and one column
+        per value of ``columns``; missing combinations are ``0``.
+    """
+    table = pd.DataFrame(load_aggregate_crosstab(rows, columns), columns=[rows, columns, "count"])
+    return table.pivot_table(index=rows, columns=columns, values="count", fill_value=0, aggfunc="sum")
+
+
+@metrics.timed("query.get_collection_statistics")
+def get_collection_statistics(collapse: bool = False) -> Dict:
+    """Compute summary statistics from the aggregate tables.
+
+    Parameters
+    ----------
+    collapse : bool, optional
+        Count each duplicate cluster once (see :func:`get_value_counts`).
+
+    Returns
+    -------
+    dict
+        Same keys as :func:`get_tune_statistics`, plus
+        ``top_rhythms``.
+    """
+    book_counts = get_value_counts("book_number", collapse)
+    return {
+        "total_tunes": load_cluster_total() if collapse else load_aggregate_total(),
+        "number_of_books": len(book_counts),
+        "top_keys": get_value_counts("key_signature", collapse).head(5),
+        "top_meters": get_value_counts("meter", collapse).head(5),
+        "top_rhythms": get_value_counts("rhythm", collapse).head(5),
+    }
+
+
+def show_collection_statistics() -> None:
+    """Print basic statistics about all tunes in the database.
+
+    Unlike :func:`show_tune_statistics` this reads the aggregate
+    tables, so it needs no DataFrame and does not scan any tunes.
+
+    Returns
+    -------
+    None
+        The function prints to standard output and does not
+        return a value.
+    """
+    stats = get_collection_statistics()
+    print(f"Total number of tunes: {stats['total_tunes']}")
+    print(f"Number of books: {stats['number_of_books']}")
+    print(f"Most common keys: {stats['top_keys']}")
+    print(f"Most common meters: {stats['top_meters']}")
+    print(f"Most common rhythms: {stats['top_rhythms']}")
+    show_query_cache_stats()
+
+
+_cube: TuneCube | None = None
+
+
+@metrics.timed("query.load_tune_cube")
+def load_tune_cube() -> TuneCube:
+    """Return the count cube matching the current database contents.
+
+    The cube saved after the last ingest is used when its generation
+    matches the database; otherwise it is rebuilt from the aggregate
+    tables. The result is kept in memory until the generation changes.
+
+    Returns
+    -------
+    TuneCube
+        Tune counts over book, canonical key, meter and rhythm.
+    """
+    from tune_cube import TuneCube
+
+    global _cube
+    generation = get_ingest_generation()
+    if _cube is not None and _cube.generation == generation:
+        return _cube
+    # An in-memory database never saves its cube, so any file is stale
+    on_disk = os.path.exists(CUBE_PATH) and not get_manager().in_memory
+    cube = TuneCube.load(CUBE_PATH) if on_disk else None
+    if cube is None or cube.generation != generation:
+        cube = rebuild_tune_cube()
+    _cube = cube
+    return cube
+
+
+@metrics.timed("query.cube_rollup")
+def cube_rollup(by: Sequence[str] | str = (), **filters) -> pd.Series:
+    """Count tunes grouped by some dimensions, optionally filtered.
+
+    For example ``cube_rollup("book_number", rhythm="jig", key="D")``
+    gives the number of jigs in D per book.
+
+    Parameters
+    ----------
+    by : str or sequence of str, optional
+        Any of ``"book_number"``, ``"key"``, ``"meter"`` and
+        ``"rhythm"``.
+    **filters
+        Dimension values to restrict to. Keys are matched in
+        canonical form, so ``key="D major"`` equals ``key="D"``, and
+        rhythms case-insensitively.
+
+    Returns
+    -------
+    pandas.Series
+        Counts indexed by the ``by`` values.
+    """
+    return load_tune_cube().rollup(by, **filters)
+
+
+@metrics.timed("query.cube_top")
+def cube_top(dimension: str, n: int = 5, **filters) -> pd.Series:
+    """Return the most common values of a dimension from the cube.
+
+    For example ``cube_top("meter", 5, book_number=2)`` gives the top
+    five meters in book 2.
+
+    Parameters
+    ----------
+    dimension : str
+        Dimension to rank.
+    n : int, optional
+        Number of values to return.
+    **filters
+        Dimension values to restrict to, as for :func:`cube_rollup`.
+
+    Returns
+    -------
+    pandas.Series
+        Counts indexed by value, most common first.
+    """
+    return load_tune_cube().top(dimension, n, **filters)
+
+
+@metrics.timed("query.cube_total")
+def cube_total(**filters) -> int:
+    """Count the tunes matching the given dimension values.
+
+    Parameters
+    ----------
+    **filters
+        Dimension values to restrict to, as for :func:`cube_rollup`.
+
+    Returns
+    -------
+    int
+        Number of matching tunes.
+    """
+    return load_tune_cube().total(**filters)
@@ -0,0 +1,413 @@
+"""Find duplicate and variant tunes across books.
+
+The same tune often appears in several files, under a slightly
+different title or in another setting. :func:`cluster_tunes` groups
+such tunes and stores a ``cluster_id`` on every row of ``tunes`` (the
+smallest tune id in the cluster, so a tune without duplicates is its
+own cluster)::
+
+    python tune_clusters.py
+
+Two tunes end up in the same cluster when
+
+* their ABC is identical apart from the ``X:`` reference number
+  (exact hash), or
+* their bodies are near duplicates: the MinHash estimate of the
+  Jaccard similarity of their note shingles is at least
+  :data:`config.CLUSTER_SIMILARITY`, or at least
+  :data:`config.CLUSTER_TITLE_SIMILARITY` when their normalised titles
+  match ("The Kesh", "Kesh, The" and "Kesh (2)" are the same title).
+
+Near-duplicate candidates come from locality-sensitive hashing of the
+signatures into bands, so each tune is only compared with the few
+tunes sharing a bucket with it and the job runs in roughly linear
+time. Clusters are the connected components of all matches.
+
+Tunes ingested after the job ran have no cluster until it runs again;
+they count as their own cluster meanwhile. :mod:`tune_analysis` can
+collapse each cluster to one representative in searches and
+statistics.
+"""
+
+from __future__ import annotations
+
+from typing import Dict, Iterator, List, Sequence, Tuple
+import argparse
+import hashlib
+import re
+import sys
+import time
+import zlib
+
+import numpy as np
+
+from config import (
+    CLUSTER_LSH_BANDS,
+    CLUSTER_MINHASH_PERMUTATIONS,
+    CLUSTER_SHINGLE_SIZE,
+    CLUSTER_SIMILARITY,
+    CLUSTER_TITLE_SIMILARITY,
+)
+from db_connection import get_manager
+from db_utils import save_cluster_ids, setup_database
+
+
+# Tunes whose signatures are computed in one vectorised step
+_CHUNK_TUNES = 500
+# Members of an LSH bucket or title group a new tune is compared with
+_BUCKET_SAMPLE = 4
+
+_HEADER_LINE = re.compile(r"^[A-Za-z]:")
+_TITLE_NOISE = (
+    re.compile(r"\\\W"),  # ABC accent escapes such as \"a
+    re.compile(r"\s*\(\s*\d+\s*\)$"),
+    re.compile(r"\s+(?:no\.?|number|setting|version|var\.?)\s*\d+$"),
+    re.compile(r"\s+\d+$"),
+    re.compile(r",\s*the$"),
+    re.compile(r"^the\s+"),
+)
+_NON_WORD = re.compile(r"[^a-z0-9]+")
+# Chord symbols and annotations, decorations, inline fields and grace notes
+_BODY_NOISE = re.compile(r'"[^"]*"|![^!]*!|\+[^+\s]*\+|\[[A-Za-z]:[^\]]*\]|\{[^}]*\}')
+_NOTE = re.compile(r"[\^_=]*[A-Ga-gz][,']*\d*/*\d*")
+
+_rng = np.random.default_rng(20250101)
+# Multiply-shift hash functions, one per permutation (odd multipliers)
+_HASH_A = _rng.integers(0, 2**63, size=CLUSTER_MINHASH_PERMUTATIONS, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+_HASH_B = _rng.integers(0, 2**63, size=CLUSTER_MINHASH_PERMUTATIONS, dtype=np.uint64)
+# Polynomial base combining the notes of a shingle into one value
+_SHINGLE_BASE = np.uint64(1_000_003)
+# Code of every note token seen so far
+_note_codes: Dict[str, int] = {}
+
+
+def normalise_title(title: str | None) -> str:
+    """Return the form of a title used to match variants.
+
+    Lower-cases the title, drops ABC accent escapes, a leading or
+    trailing "the" and numbering such as "No. 2" or "(3)", and keeps
+    only letters and digits.
+
+    Parameters
+    ----------
+    title : str or None
+        Title as stored in the database.
+
+    Returns
+    -------
+    str
+        The normalised title; empty for missing or placeholder titles.
+    """
+    if not title:
+        return ""
+    title = title.strip().lower()
+    if title == "unknown title":
+        return ""
+    for pattern in _TITLE_NOISE:
+        title = pattern.sub("", title)
+    return _NON_WORD.sub(" ", title).strip()
+
+
+def _music_lines(raw_abc: str) -> Iterator[str]:
+    """Yield the body lines of a tune: after ``K:``, without fields or comments."""
+    in_body = False
+    for line in raw_abc.splitlines():
+        line = line.split("%", 1)[0].strip()
+        if not line:
+            continue
+        if _HEADER_LINE.match(line):
+            in_body = in_body or line.startswith("K:")
+            continue
+        if in_body:
+            yield line
+
+
+def exact_hash(raw_abc: str | None) -> bytes:
+    """Return a hash of the ABC text, ignoring ``X:`` and layout.
+
+    Parameters
+    ----------
+    raw_abc : str or None
+        The tune's ABC text.
+
+    Returns
+    -------
+    bytes
+        A 16-byte digest, equal for tunes that only differ in their
+        reference number, line endings or trailing whitespace.
+    """
+    lines = [line.rstrip() for line in (raw_abc or "").splitlines() if not line.startswith("X:")]
+    return hashlib.blake2b("\n".join(lines).strip().encode("utf-8"), digest_size=16).digest()
+
+
+def body_notes(raw_abc: str | None) -> List[int]:
+    """Return the notes of a tune body as 32-bit codes.
+
+    Chord symbols, decorations, grace notes, bar lines and spacing are
+    dropped, so settings that only differ in ornamentation or layout
+    have the same notes.
+
+    Parameters
+    ----------
+    raw_abc : str or None
+        The tune's ABC text.
+
+    Returns
+    -------
+    list of int
+        One code per note or rest, in order; empty for a tune without
+        notes.
+    """
+    codes = []
+    for line in _music_lines(raw_abc or ""):
+        for note in _NOTE.findall(_BODY_NOISE.sub(" ", line)):
+            code = _note_codes.get(note)
+            if code is None:
+                code = _note_codes[note] = zlib.crc32(note.encode("ascii", "replace"))
+            codes.append(code)
+    return codes
+
+
+def minhash_signatures(note_sequences: Sequence[List[int]], size: int = CLUSTER_SHINGLE_SIZE) -> np.ndarray:
+    """Compute the MinHash signatures of the note shingles of several tunes.
+
+    Each run of ``size`` consecutive notes is one shingle. The whole
+    batch is shingled and hashed in a few vectorised steps.
+
+    Parameters
+    ----------
+    note_sequences : sequence of list of int
+        Non-empty note codes per tune, from :func:`body_notes`.
+    size : int, optional
+        Notes per shingle.
+
+    Returns
+    -------
+    numpy.ndarray
+        ``uint32`` array of shape ``(len(note_sequences),
+        CLUSTER_MINHASH_PERMUTATIONS)``.
+    """
+    # Tunes shorter than a shingle are padded to one shingle
+    padded = [notes if len(notes) >= size else notes + [0] * (size - len(notes)) for notes in note_sequences]
+    lengths = np.fromiter((len(notes) for notes in padded), dtype=np.int64, count=len(padded))
+    flat = np.fromiter((code for notes in padded for code in notes), dtype=np.uint64, count=int(lengths.sum()))
+    # Hash every window of the flat array (uint64 arithmetic wraps around),
+    # then keep the windows that lie inside one tune
+    shingles = np.zeros(len(flat) - size + 1, dtype=np.uint64)
+    for k in range(size):
+        shingles = shingles * _SHINGLE_BASE + flat[k:len(flat) - size + 1 + k]
+    windows = lengths - size + 1
+    tune_starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    window_starts = np.concatenate(([0], np.cumsum(windows)[:-1]))
+    positions = np.repeat(tune_starts - window_starts, windows) + np.arange(int(windows.sum()))
+    shingles = shingles[positions]
+    # Multiply-shift hashing; the top 32 bits are the hash
+    hashed = (_HASH_A[:, None] * shingles[None, :] + _HASH_B[:, None]) >> np.uint64(32)
+    return np.minimum.reduceat(hashed, window_starts, axis=1).T.astype(np.uint32)
+
+
+class _DisjointSet:
+    """Union-find over ``0 .. n-1`` with path halving."""
+
+    def __init__(self, n: int) -> None:
+        self.parent = list(range(n))
+
+    def find(self, i: int) -> int:
+        parent = self.parent
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def union(self, i: int, j: int) -> bool:
+        root_i, root_j = self.find(i), self.find(j)
+        if root_i == root_j:
+            return False
+        # The smaller index stays the root, so roots are stable
+        if root_j < root_i:
+            root_i, root_j = root_j, root_i
+        self.parent[root_j] = root_i
+        return True
+
+
+def _read_fingerprints(db_path: str | None) -> Tuple:
+    """Stream all tunes and fingerprint them chunk by chunk.
+
+    Returns the ids, current cluster ids, normalised titles, exact
+    hashes, MinHash signatures and has-notes mask, in id order.
+    """
+    ids: List[int] = []
+    current: List[int | None] = []
+    titles: List[str] = []
+    hashes: List[bytes] = []
+    signatures = []
+    has_body = []
+    with get_manager(db_path).read_snapshot() as conn:
+        cursor = conn.execute("SELECT id, cluster_id, title, raw_abc FROM tunes ORDER BY id")
+        while True:
+            rows = cursor.fetchmany(_CHUNK_TUNES)
+            if not rows:
+                break
+            note_sequences = []
+            for tune_id, cluster_id, title, raw_abc in rows:
+                ids.append(tune_id)
+                current.append(cluster_id)
+                titles.append(normalise_title(title))
+                hashes.append(exact_hash(raw_abc))
+                notes = body_notes(raw_abc)
+                has_body.append(bool(notes))
+                # A placeholder keeps the rows aligned; has_body masks it
+                note_sequences.append(notes or [0])
+            signatures.append(minhash_signatures(note_sequences))
+    if signatures:
+        matrix = np.concatenate(signatures)
+    else:
+        matrix = np.zeros((0, CLUSTER_MINHASH_PERMUTATIONS), dtype=np.uint32)
+    return ids, current, titles, hashes, matrix, np.array(has_body, dtype=bool)
+
+
+def _similarity(signatures: np.ndarray, i: int, j: int) -> float:
+    return float(np.count_nonzero(signatures[i] == signatures[j])) / signatures.shape[1]
+
+
+def find_clusters(
+    titles: Sequence[str],
+    hashes: Sequence[bytes],
+    signatures: np.ndarray,
+    has_body: np.ndarray,
+    similarity: float = CLUSTER_SIMILARITY,
+    title_similarity: float = CLUSTER_TITLE_SIMILARITY,
+) -> Tuple[List[int], Dict[str, int]]:
+    """Group fingerprinted tunes into clusters.
+
+    Parameters
+    ----------
+    titles : sequence of str
+        Normalised titles, from :func:`normalise_title`.
+    hashes : sequence of bytes
+        Exact hashes, from :func:`exact_hash`.
+    signatures : numpy.ndarray
+        MinHash signatures, one row per tune.
+    has_body : numpy.ndarray
+        Whether each tune has notes; tunes without are only matched by
+        their exact hash.
+    similarity, title_similarity : float, optional
+        Minimum estimated similarity of two bodies, for any two tunes
+        and for tunes with the same normalised title.
+
+    Returns
+    -------
+    tuple of (list of int, dict)
+        The cluster root (the first member's position) of every tune,
+        and counts of the ``exact``, ``near`` and ``title`` matches
+        that joined two clusters.
+    """
+    n = len(hashes)
+    sets = _DisjointSet(n)
+    matches = {"exact": 0, "near": 0, "title": 0}
+
+    first_with_hash: Dict[bytes, int] = {}
+    for i, digest in enumerate(hashes):
+        j = first_with_hash.setdefault(digest, i)
+        if j != i and sets.union(i, j):
+            matches["exact"] += 1
+
+    rows = signatures.shape[1] // CLUSTER_LSH_BANDS
+    body_rows = np.flatnonzero(has_body)
+    for band in range(CLUSTER_LSH_BANDS):
+        keys = np.ascontiguousarray(signatures[body_rows, band * rows:(band + 1) * rows])
+        buckets: Dict[bytes, List[int]] = {}
+        for i, key in zip(body_rows.tolist(), keys.view(f"V{keys.shape[1] * 4}").ravel().tolist()):
+            members = buckets.setdefault(key, [])
+            for j in members:
+                if sets.find(i) == sets.find(j):
+                    break
+                if _similarity(signatures, i, j) >= similarity:
+                    sets.union(i, j)
+                    matches["near"] += 1
+                    break
+            if len(members) < _BUCKET_SAMPLE:
+                members.append(i)
+
+    groups: Dict[str, List[int]] = {}
+    for i in body_rows.tolist():
+        if not titles[i]:
+            continue
+        members = groups.setdefault(titles[i], [])
+        for j in members:
+            if sets.find(i) == sets.find(j):
+                break
+            if _similarity(signatures, i, j) >= title_similarity:
+                sets.union(i, j)
+                matches["title"] += 1
+                break
+        if len(members) < _BUCKET_SAMPLE:
+            members.append(i)
+
+    return [sets.find(i) for i in range(n)], matches
+
+
+def cluster_tunes(db_path: str | None = None) -> Dict:
+    """Cluster all tunes and store their cluster ids.
+
+    Only rows whose cluster changed are written, in one transaction
+    that also advances the ingest generation, so cached DataFrames and
+    query results are refreshed.
+
+    Parameters
+    ----------
+    db_path : str or None, optional
+        Database to cluster instead of :data:`config.DB_PATH`.
+
+    Returns
+    -------
+    dict
+        ``tunes``, ``clusters``, ``duplicates`` (tunes beyond the
+        first of their cluster), ``largest`` cluster size, the
+        ``exact``, ``near`` and ``title`` match counts, ``updated``
+        rows and ``seconds`` taken.
+    """
+    start = time.perf_counter()
+    setup_database(db_path)
+    ids, current, titles, hashes, signatures, has_body = _read_fingerprints(db_path)
+    roots, matches = find_clusters(titles, hashes, signatures, has_body)
+
+    # Roots are the smallest position in each cluster and ids are read
+    # in ascending order, so ids[root] is the cluster's smallest id
+    assignments = [
+        (tune_id, ids[root]) for tune_id, old, root in zip(ids, current, roots) if old != ids[root]
+    ]
+    updated = save_cluster_ids(assignments, db_path)
+
+    sizes: Dict[int, int] = {}
+    for root in roots:
+        sizes[root] = sizes.get(root, 0) + 1
+    return {
+        "tunes": len(ids),
+        "clusters": len(sizes),
+        "duplicates": len(ids) - len(sizes),
+        "largest": max(sizes.values(), default=0),
+        **matches,
+        "updated": updated,
+        "seconds": time.perf_counter() - start,
+    }
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    """Cluster the tunes database from the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", help="database to cluster instead of the default tunes.db")
+    args = parser.parse_args(argv)
+
+    summary = cluster_tunes(args.db)
+    print(
+        f"{summary['tunes']} tunes in {summary['clusters']} clusters "
+        f"({summary['duplicates']} duplicates, largest cluster {summary['largest']}); "
+        f"matches: {summary['exact']} exact, {summary['near']} near, {summary['title']} by title; "
+        f"{summary['updated']} rows updated in {summary['seconds']:.1f} s"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,334 @@
+"""Precomputed tune count cube over book, key, meter and rhythm.
+
+The cube is a dense NumPy array with one axis per dimension holding
+the number of tunes for every combination of values. It is built
+from the ``tune_aggregates`` table after each ingest and saved next
+to the database, so roll-ups such as "jigs in D per book" are answered
+by indexing and summing the array instead of scanning tunes.
+
+Key, meter and rhythm are free text, and the array grows with the
+product of their distinct values. When it would exceed
+:data:`config.CUBE_MAX_CELLS` cells, the rarest labels of those
+dimensions are left out of the array, and the few combinations
+involving them are kept as a sparse table next to it, so answers stay
+exact.
+"""
+
+from __future__ import annotations
+
+from typing import Dict, Iterable, List, Sequence, Tuple
+import os
+
+import numpy as np
+import pandas as pd
+
+from abc_parser import canonical_key
+from config import CUBE_MAX_CELLS
+
+
+DIMENSIONS = ("book_number", "key", "meter", "rhythm")
+
+# Dimensions whose rarest labels may move from the array to the sparse
+# table, most numerous first when the cube is too large
+_FOLDABLE = ("key", "meter", "rhythm")
+
+
+def canonical_value(dimension: str, value) -> object:
+    """Normalise a dimension value the same way the cube labels are.
+
+    Parameters
+    ----------
+    dimension : str
+        One of :data:`DIMENSIONS`.
+    value : object
+        Raw value, e.g. ``"D major"`` for ``key`` or ``" Jig"`` for
+        ``rhythm``.
+
+    Returns
+    -------
+    object
+        ``int`` for ``book_number`` (``-1`` when missing) and ``str``
+        for the other dimensions (``""`` when missing). A key that is
+        not recognised is returned unchanged rather than as missing.
+    """
+    if dimension == "book_number":
+        return -1 if value is None else int(value)
+    if dimension == "key":
+        text = (value or "").strip()
+        return canonical_key(text) or text
+    if dimension == "rhythm":
+        return (value or "").strip().lower()
+    return (value or "").strip()
+
+
+class TuneCube:
+    """Dense tune counts over :data:`DIMENSIONS`.
+
+    Parameters
+    ----------
+    labels : dict of str to list
+        For each dimension, the value belonging to each position on
+        that axis.
+    counts : numpy.ndarray
+        Integer array whose shape matches the label lists.
+    generation : int
+        Ingest generation the counts were built from.
+    sparse : dict of tuple to int or None, optional
+        Counts of value combinations left out of ``counts`` because
+        one of their values has no position in ``labels``.
+    """
+
+    def __init__(
+        self,
+        labels: Dict[str, List],
+        counts: np.ndarray,
+        generation: int,
+        sparse: Dict[Tuple, int] | None = None,
+    ) -> None:
+        self.labels = labels
+        self.counts = counts
+        self.generation = generation
+        self.sparse = sparse or {}
+        self._positions = {
+            dimension: {value: i for i, value in enumerate(values)}
+            for dimension, values in labels.items()
+        }
+
+    @classmethod
+    def from_aggregates(
+        cls,
+        rows: Iterable[Tuple],
+        generation: int,
+        max_cells: int = CUBE_MAX_CELLS,
+    ) -> "TuneCube":
+        """Build a cube from ``(book, key, meter, rhythm, count)`` rows.
+
+        Rows whose canonical values coincide (e.g. ``"G"`` and
+        ``"G major"``) are summed into the same cell.
+
+        Parameters
+        ----------
+        rows : iterable of tuple
+            Rows as returned by
+            ``db_utils.load_aggregate_crosstab(*AGGREGATE_DIMENSIONS)``.
+        generation : int
+            Ingest generation the rows were read at.
+        max_cells : int, optional
+            Largest array to allocate; beyond it the rarest key, meter
+            and rhythm labels go to the sparse table.
+
+        Returns
+        -------
+        TuneCube
+            The populated cube.
+        """
+        cells: Dict[Tuple, int] = {}
+        totals: Dict[str, Dict] = {d: {} for d in DIMENSIONS}
+        for *values, count in rows:
+            key = tuple(canonical_value(d, v) for d, v in zip(DIMENSIONS, values))
+            cells[key] = cells.get(key, 0) + count
+            for dimension, value in zip(DIMENSIONS, key):
+                totals[dimension][value] = totals[dimension].get(value, 0) + count
+
+        labels = {d: sorted(totals[d]) for d in DIMENSIONS}
+        size = int(np.prod([max(len(labels[d]), 1) for d in DIMENSIONS]))
+        for dimension in sorted(_FOLDABLE, key=lambda d: -len(labels[d])):
+            if size <= max_cells:
+                break
+            rest = size // max(len(labels[dimension]), 1)
+            keep = max(1, max_cells // rest)
+            if keep < len(labels[dimension]):
+                ranked = sorted(labels[dimension], key=lambda v: (-totals[dimension][v], v))
+                labels[dimension] = sorted(ranked[:keep])
+                size = rest * keep
+
+        positions = {d: {v: i for i, v in enumerate(labels[d])} for d in DIMENSIONS}
+        counts = np.zeros([len(labels[d]) for d in DIMENSIONS], dtype=np.int64)
+        sparse: Dict[Tuple, int] = {}
+        for key, count in cells.items():
+            index = tuple(positions[d].get(v) for d, v in zip(DIMENSIONS, key))
+            if None in index:
+                sparse[key] = count
+            else:
+                counts[index] = count
+        return cls(labels, counts, generation, sparse)
+
+    def save(self, path: str) -> None:
+        """Write the cube to an ``.npz`` file, replacing it atomically.
+
+        Parameters
+        ----------
+        path : str
+            Destination file.
+        """
+        tmp_path = f"{path}.tmp.npz"
+        np.savez_compressed(
+            tmp_path,
+            counts=self.counts,
+            generation=np.int64(self.generation),
+            sparse_counts=np.asarray(list(self.sparse.values()), dtype=np.int64),
+            **{f"labels_{d}": np.asarray(self.labels[d]) for d in DIMENSIONS},
+            **{
+                f"sparse_{d}": np.asarray([key[axis] for key in self.sparse])
+                for axis, d in enumerate(DIMENSIONS)
+            },
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "TuneCube":
+        """Read a cube written by :meth:`save`.
+
+        Parameters
+        ----------
+        path : str
+            File to read.
+
+        Returns
+        -------
+        TuneCube
+            The stored cube.
+        """
+        with np.load(path, allow_pickle=False) as data:
+            labels = {d: data[f"labels_{d}"].tolist() for d in DIMENSIONS}
+            sparse = {}
+            # Cubes saved before the sparse table was added have none
+            if "sparse_counts" in data.files:
+                keys = zip(*(data[f"sparse_{d}"].tolist() for d in DIMENSIONS))
+                sparse = dict(zip(keys, data["sparse_counts"].tolist()))
+            return cls(labels, data["counts"], int(data["generation"]), sparse)
+
+    @staticmethod
+    def _wanted(dimension: str, value) -> List:
+        """Return the canonical values a filter on ``dimension`` selects."""
+        if isinstance(value, (list, tuple, set)):
+            return [canonical_value(dimension, x) for x in value]
+        return [canonical_value(dimension, value)]
+
+    def _selector(self, dimension: str, value) -> List[int]:
+        """Return the axis indices selecting ``value``."""
+        positions = self._positions[dimension]
+        return [positions[v] for v in self._wanted(dimension, value) if v in positions]
+
+    def slice(self, **filters) -> "TuneCube":
+        """Restrict the cube to the given dimension values.
+
+        Parameters
+        ----------
+        **filters
+            Dimension names mapped to one value or a list of values,
+            e.g. ``rhythm="jig", key=["D", "G"]``.
+
+        Returns
+        -------
+        TuneCube
+            A cube with the same dimensions but only the selected
+            positions on the filtered axes.
+        """
+        counts = self.counts
+        labels = dict(self.labels)
+        sparse = self.sparse
+        for dimension, value in filters.items():
+            if dimension not in DIMENSIONS:
+                raise ValueError(f"Unknown cube dimension: {dimension!r}")
+            index = self._selector(dimension, value)
+            counts = np.take(counts, index, axis=DIMENSIONS.index(dimension))
+            labels[dimension] = [labels[dimension][i] for i in index]
+            if sparse:
+                axis = DIMENSIONS.index(dimension)
+                wanted = set(self._wanted(dimension, value))
+                sparse = {key: count for key, count in sparse.items() if key[axis] in wanted}
+        return TuneCube(labels, counts, self.generation, sparse)
+
+    def rollup(self, by: Sequence[str] | str = (), **filters) -> pd.Series:
+        """Sum tune counts over every dimension not listed in ``by``.
+
+        Parameters
+        ----------
+        by : str or sequence of str, optional
+            Dimensions to keep, e.g. ``"book_number"`` or
+            ``("book_number", "meter")``.
+        **filters
+            Passed to :meth:`slice` before summing.
+
+        Returns
+        -------
+        pandas.Series
+            Counts indexed by the ``by`` values (a MultiIndex for more
+            than one dimension), leaving out empty combinations.
+        """
+        if isinstance(by, str):
+            by = (by,)
+        for dimension in by:
+            if dimension not in DIMENSIONS:
+                raise ValueError(f"Unknown cube dimension: {dimension!r}")
+        cube = self.slice(**filters) if filters else self
+        other_axes = tuple(i for i, d in enumerate(DIMENSIONS) if d not in by)
+        summed = cube.counts.sum(axis=other_axes)
+        if not by:
+            return pd.Series([int(summed) + sum(cube.sparse.values())], index=["total"], name="count")
+
+        # Axes left after summing are in DIMENSIONS order; reorder to ``by``
+        kept = [d for d in DIMENSIONS if d in by]
+        summed = np.transpose(summed, [kept.index(d) for d in by])
+        nonzero = np.nonzero(summed)
+        values = summed[nonzero]
+        if len(by) == 1:
+            index = pd.Index([cube.labels[by[0]][i] for i in nonzero[0]], name=by[0])
+        else:
+            index = pd.MultiIndex.from_arrays(
+                [[cube.labels[d][i] for i in axis] for d, axis in zip(by, nonzero)],
+                names=list(by),
+            )
+        result = pd.Series(values, index=index, name="count")
+        if not cube.sparse:
+            return result
+
+        groups: Dict[Tuple, int] = {}
+        axes = [DIMENSIONS.index(d) for d in by]
+        for key, count in cube.sparse.items():
+            group = tuple(key[axis] for axis in axes)
+            groups[group] = groups.get(group, 0) + count
+        if len(by) == 1:
+            index = pd.Index([group[0] for group in groups], name=by[0])
+        else:
+            index = pd.MultiIndex.from_tuples(list(groups), names=list(by))
+        extra = pd.Series(list(groups.values()), index=index, name="count")
+        combined = result.add(extra, fill_value=0).astype(np.int64).rename("count")
+
+        # Same order as the array: filter order on filtered axes, label
+        # order on the others
+        rank = {
+            d: {v: i for i, v in reversed(list(enumerate(self._wanted(d, filters[d]))))}
+            for d in by if d in filters
+        }
+
+        def order(position: int) -> Tuple:
+            values = combined.index[position] if len(by) > 1 else (combined.index[position],)
+            return tuple(rank[d][v] if d in rank else v for d, v in zip(by, values))
+
+        return combined.iloc[sorted(range(len(combined)), key=order)]
+
+    def total(self, **filters) -> int:
+        """Return the number of tunes matching ``filters``."""
+        cube = self.slice(**filters) if filters else self
+        return int(cube.counts.sum()) + sum(cube.sparse.values())
+
+    def top(self, dimension: str, n: int = 5, **filters) -> pd.Series:
+        """Return the ``n`` most common values of one dimension.
+
+        Parameters
+        ----------
+        dimension : str
+            Dimension to rank, e.g. ``"meter"``.
+        n : int, optional
+            Number of values to return.
+        **filters
+            Passed to :meth:`slice` before ranking.
+
+        Returns
+        -------
+        pandas.Series
+            Counts indexed by value, most common first.
+        """
+        return self.rollup(dimension, **filters).sort_values(ascending=False, kind="stable").head(n)
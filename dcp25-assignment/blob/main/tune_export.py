@@ -0,0 +1,308 @@
+"""Export tunes from the database as normalized ABC and MIDI files.
+
+:func:`export_tunes` takes the same filters as
+:func:`db_utils.query_tunes` and writes one ``.abc`` and one ``.mid``
+file per matching tune (see :mod:`abc_render`) under
+``<out_dir>/book_<n>/``::
+
+    export_tunes(book_number=3)                 # book 3, both formats
+    export_tunes(rhythm="reel", formats=("midi",))
+
+The export is a pipeline of three stages:
+
+* a reader thread streams the matching tunes from SQLite in batches of
+  :data:`config.EXPORT_BATCH_TUNES` into a queue holding at most
+  :data:`config.EXPORT_QUEUE_BATCHES` batches;
+* the calling thread takes batches off the queue and hands them to a
+  pool of :data:`config.EXPORT_WORKERS` processes, keeping at most two
+  batches per worker in flight;
+* each worker renders its batch and writes the files itself, so only
+  counts travel back.
+
+When the workers fall behind, the in-flight limit stops the calling
+thread, the queue fills up and the reader blocks in ``put``, which
+leaves the SQLite cursor paused: memory stays bounded by the queue and
+in-flight sizes, however many tunes match.
+
+Run it from the command line with::
+
+    python tune_export.py --book 3 --format midi --out exports
+"""
+
+from __future__ import annotations
+
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Sequence, Set
+import argparse
+import multiprocessing
+import os
+import queue
+import re
+import threading
+import time
+
+from abc_render import abc_to_midi, normalize_abc
+from config import EXPORT_BATCH_TUNES, EXPORT_DIR, EXPORT_QUEUE_BATCHES, EXPORT_WORKERS
+from db_utils import count_tunes, query_tunes
+
+
+# Output formats and the file suffix each is written with
+EXPORT_FORMATS = {"abc": ".abc", "midi": ".mid"}
+
+# Batches each worker may have queued in the pool at once
+_IN_FLIGHT_PER_WORKER = 2
+_EXPORT_COLUMNS = ("id", "book_number", "title", "raw_abc")
+_SLUG = re.compile(r"[^a-z0-9]+")
+_DONE = object()
+
+ProgressCallback = Callable[[int, int, str], None]
+
+
+def tune_file_stem(tune: Dict) -> str:
+    """Return the path of a tune's files without the suffix.
+
+    Parameters
+    ----------
+    tune : dict
+        Row with ``id``, ``book_number`` and ``title``.
+
+    Returns
+    -------
+    str
+        ``book_<n>/<id>_<title-slug>``, relative to the export folder;
+        tunes without a book go to ``no_book``.
+    """
+    book = tune["book_number"]
+    slug = _SLUG.sub("-", (tune["title"] or "").lower()).strip("-")[:60] or "untitled"
+    folder = "no_book" if book is None else f"book_{book}"
+    return os.path.join(folder, f"{tune['id']}_{slug}")
+
+
+def _export_batch(tunes: List[Dict], out_dir: str, formats: Sequence[str]) -> Dict:
+    """Render and write one batch of tunes (runs in a worker process).
+
+    A tune that fails to render is reported instead of aborting the
+    batch.
+    """
+    files = 0
+    nbytes = 0
+    failed = []
+    for tune in tunes:
+        stem = os.path.join(out_dir, tune_file_stem(tune))
+        try:
+            outputs = []
+            if "abc" in formats:
+                outputs.append((".abc", normalize_abc(tune["raw_abc"] or "").encode("utf-8")))
+            if "midi" in formats:
+                outputs.append((".mid", abc_to_midi(tune["raw_abc"] or "", tune["title"])))
+            os.makedirs(os.path.dirname(stem), exist_ok=True)
+            for suffix, data in outputs:
+                with open(stem + suffix, "wb") as f:
+                    f.write(data)
+                files += 1
+                nbytes += len(data)
+        except Exception as error:
+            failed.append({"id": tune["id"], "title": tune["title"], "error": f"{type(error).__name__}: {error}"})
+    return {"tunes": len(tunes), "files": files, "bytes": nbytes, "failed": failed}
+
+
+def _put(batches: queue.Queue, item: Any, stop: threading.Event) -> bool:
+    """Block until ``item`` is queued; give up once ``stop`` is set."""
+    while not stop.is_set():
+        try:
+            batches.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _read_batches(
+    batches: queue.Queue,
+    stop: threading.Event,
+    filters: Dict,
+    batch_size: int,
+    db_path: str | None,
+) -> None:
+    """Stream matching tunes into ``batches`` (runs in the reader thread).
+
+    The queue ends with ``_DONE``, or with the exception that stopped
+    the query.
+    """
+    try:
+        batch: List[Dict] = []
+        rows = query_tunes(**filters, columns=_EXPORT_COLUMNS, order_by="book", batch_size=batch_size, db_path=db_path)
+        for tune in rows:
+            batch.append(tune)
+            if len(batch) >= batch_size:
+                if not _put(batches, batch, stop):
+                    return
+                batch = []
+        if batch and not _put(batches, batch, stop):
+            return
+        _put(batches, _DONE, stop)
+    except BaseException as error:
+        _put(batches, error, stop)
+
+
+def export_tunes(
+    out_dir: str | None = None,
+    formats: Sequence[str] = tuple(EXPORT_FORMATS),
+    title: str | None = None,
+    book_number: int | None = None,
+    meter: str | None = None,
+    key_signature: str | None = None,
+    rhythm: str | None = None,
+    workers: int = EXPORT_WORKERS,
+    batch_size: int = EXPORT_BATCH_TUNES,
+    queue_batches: int = EXPORT_QUEUE_BATCHES,
+    progress: ProgressCallback | None = None,
+    db_path: str | None = None,
+) -> Dict:
+    """Write the tunes matching some filters as ABC and/or MIDI files.
+
+    Parameters
+    ----------
+    out_dir : str or None, optional
+        Folder to write to. If ``None``, :data:`config.EXPORT_DIR` is
+        used.
+    formats : sequence of str, optional
+        Any of ``"abc"`` and ``"midi"``.
+    title, book_number, meter, key_signature, rhythm : optional
+        Filters as for :func:`db_utils.query_tunes`.
+    workers : int, optional
+        Worker processes, at most one per CPU; with 1 the tunes are
+        rendered in this process.
+    batch_size : int, optional
+        Tunes read and handed to a worker at a time.
+    queue_batches : int, optional
+        Batches that may wait between the reader and the workers.
+    progress : callable or None, optional
+        Called as ``progress(done, total, description)`` after each
+        batch, with the tunes exported so far and the number matching.
+    db_path : str or None, optional
+        Database to read instead of :data:`config.DB_PATH`.
+
+    Returns
+    -------
+    dict
+        ``out_dir``, and ``tunes``, ``files``, ``bytes`` written,
+        ``failed`` (one dict per tune that could not be rendered, with
+        ``id``, ``title`` and ``error``) and ``seconds``.
+
+    Raises
+    ------
+    ValueError
+        If a format is not one of :data:`EXPORT_FORMATS`.
+    """
+    unknown = [name for name in formats if name not in EXPORT_FORMATS]
+    if unknown:
+        raise ValueError(f"Unknown export format: {unknown[0]!r}")
+    out_dir = EXPORT_DIR if out_dir is None else out_dir
+    formats = tuple(formats)
+    filters = {
+        "title": title,
+        "book_number": book_number,
+        "meter": meter,
+        "key_signature": key_signature,
+        "rhythm": rhythm,
+    }
+    start = time.perf_counter()
+    total = count_tunes(**filters, db_path=db_path)
+    summary: Dict = {"out_dir": out_dir, "tunes": 0, "files": 0, "bytes": 0, "failed": []}
+
+    def collect(result: Dict) -> None:
+        for name in ("tunes", "files", "bytes"):
+            summary[name] += result[name]
+        summary["failed"] += result["failed"]
+        if progress is not None:
+            progress(summary["tunes"], total, f"{summary['files']} files written")
+
+    if progress is not None:
+        progress(0, total, "Starting...")
+    os.makedirs(out_dir, exist_ok=True)
+    batches: queue.Queue = queue.Queue(maxsize=max(1, queue_batches))
+    stop = threading.Event()
+    reader = threading.Thread(
+        target=_read_batches,
+        args=(batches, stop, filters, max(1, batch_size), db_path),
+        name="tune-export-reader",
+        daemon=True,
+    )
+    workers = min(workers, os.cpu_count() or 1)
+    pool = None
+    if workers > 1 and total > batch_size:
+        # Spawned, not forked, so no worker inherits an open connection
+        context = multiprocessing.get_context("spawn")
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+    pending: Set[Future] = set()
+    reader.start()
+    try:
+        while True:
+            item = batches.get()
+            if item is _DONE:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            if pool is None:
+                collect(_export_batch(item, out_dir, formats))
+                continue
+            while len(pending) >= _IN_FLIGHT_PER_WORKER * workers:
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    collect(future.result())
+            pending.add(pool.submit(_export_batch, item, out_dir, formats))
+        while pending:
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                collect(future.result())
+    finally:
+        stop.set()
+        reader.join()
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+    summary["seconds"] = time.perf_counter() - start
+    return summary
+
+
+def main(argv: List[str] | None = None) -> int:
+    """Command-line entry point; returns the process exit status."""
+    parser = argparse.ArgumentParser(description="Export tunes as normalized ABC and MIDI files.")
+    parser.add_argument("--out", default=EXPORT_DIR, help="folder to write to (default: %(default)s)")
+    parser.add_argument("--format", dest="formats", action="append", choices=list(EXPORT_FORMATS),
+                        help="format to write; repeat for several (default: all)")
+    parser.add_argument("--title", help="substring of the title")
+    parser.add_argument("--book", type=int, help="book number")
+    parser.add_argument("--meter", help="meter, e.g. 6/8")
+    parser.add_argument("--key", help="key signature, e.g. Dmix")
+    parser.add_argument("--rhythm", help="rhythm, e.g. reel")
+    parser.add_argument("--workers", type=int, default=EXPORT_WORKERS, help="worker processes (default: %(default)s)")
+    parser.add_argument("--db", help="database file (default: config.DB_PATH)")
+    args = parser.parse_args(argv)
+
+    def report(done: int, total: int, description: str) -> None:
+        print(f"\r{done}/{total} tunes, {description}", end="", flush=True)
+
+    summary = export_tunes(
+        out_dir=args.out,
+        formats=args.formats or tuple(EXPORT_FORMATS),
+        title=args.title,
+        book_number=args.book,
+        meter=args.meter,
+        key_signature=args.key,
+        rhythm=args.rhythm,
+        workers=args.workers,
+        progress=report,
+        db_path=args.db,
+    )
+    print(
+        f"\nExported {summary['tunes']} tunes to {summary['out_dir']}: {summary['files']} files, "
+        f"{summary['bytes'] / 1e6:.1f} MB in {summary['seconds']:.1f} s"
+    )
+    for failure in summary["failed"]:
+        print(f"  failed: tune {failure['id']} ({failure['title']}): {failure['error']}")
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,422 @@
+"""Sharded layout: one SQLite database per book.
+
+With a single ``tunes.db`` every ingest waits for the same writer lock,
+and rewriting one book churns the file all other books live in. In the
+sharded layout each book has its own database under
+:data:`config.SHARD_DIR` (``book_1.db``, ``book_2.db``, ...) with the
+usual schema, so books are ingested by separate processes in parallel
+and adding or reloading a book never touches the other files::
+
+    ingest_shards()                 # all books, SHARD_WORKERS processes
+    ingest_shards(books=[7])        # only book 7
+
+:class:`ShardedTunes` reads the shards as one collection. Queries fan
+out over the shards (only the matching one when a book is given) and
+the results are merged: rows are streamed in sort order, aggregate
+counts summed, and the full DataFrame concatenated so the
+:mod:`tune_analysis` filters work on it unchanged.
+"""
+
+from __future__ import annotations
+
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from itertools import islice
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, Iterator, List, Sequence, Tuple
+import argparse
+import heapq
+import multiprocessing
+import os
+import re
+import sys
+
+from abc_parser import iter_abc_files
+from config import INGEST_BATCH_FILES, SHARD_DIR, SHARD_WORKERS
+from db_connection import get_manager
+from db_utils import (
+    AGGREGATE_DIMENSIONS,
+    LISTING_COLUMNS,
+    ORDER_KEYS,
+    get_ingest_generation,
+    ingest_abc_file,
+    load_aggregate_crosstab,
+    load_aggregate_total,
+    load_source_manifest,
+    query_tunes,
+    remove_abc_file,
+    setup_database,
+)
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+# File name of the shard holding tunes without a book number
+_NO_BOOK = "none"
+_SHARD_NAME = re.compile(r"book_(\d+|none)\.db")
+
+
+def shard_path(book_number: int | None, shard_dir: str | None = None) -> str:
+    """Return the database file for one book.
+
+    Parameters
+    ----------
+    book_number : int or None
+        Book number; ``None`` for tunes outside any book.
+    shard_dir : str or None, optional
+        Folder holding the shards. If ``None``,
+        :data:`config.SHARD_DIR` is used.
+
+    Returns
+    -------
+    str
+        Path of the shard, e.g. ``tune_shards/book_3.db``.
+    """
+    name = _NO_BOOK if book_number is None else str(int(book_number))
+    return os.path.join(SHARD_DIR if shard_dir is None else shard_dir, f"book_{name}.db")
+
+
+def list_shards(shard_dir: str | None = None) -> Dict[int | None, str]:
+    """Return the existing shards by book number, in book order.
+
+    Parameters
+    ----------
+    shard_dir : str or None, optional
+        Folder holding the shards. If ``None``,
+        :data:`config.SHARD_DIR` is used.
+
+    Returns
+    -------
+    dict of int or None to str
+        Shard path per book; the shard for tunes without a book, if
+        any, comes last under ``None``.
+    """
+    shard_dir = SHARD_DIR if shard_dir is None else shard_dir
+    if not os.path.isdir(shard_dir):
+        return {}
+    shards: Dict[int | None, str] = {}
+    for name in os.listdir(shard_dir):
+        match = _SHARD_NAME.fullmatch(name)
+        if match:
+            book = None if match.group(1) == _NO_BOOK else int(match.group(1))
+            shards[book] = os.path.join(shard_dir, name)
+    return dict(sorted(shards.items(), key=lambda item: (item[0] is None, item[0] or 0)))
+
+
+def ingest_book_shard(book_number: int | None, files: Sequence[Tuple[int, str, str]], path: str) -> Dict:
+    """Bring one book's shard up to date with its files.
+
+    Files whose size or modification time differ from the shard's
+    manifest are (re-)ingested, ``INGEST_BATCH_FILES`` per
+    transaction, and files that no longer exist are removed. Runs in
+    a worker process of :func:`ingest_shards`, but works in any
+    process.
+
+    Parameters
+    ----------
+    book_number : int or None
+        Book the shard belongs to.
+    files : sequence of tuple of (int, str, str)
+        ``(book_number, file_name, file_path)`` of the book's files,
+        as yielded by :func:`abc_parser.iter_abc_files`.
+    path : str
+        Shard database file; created if missing.
+
+    Returns
+    -------
+    dict
+        ``book_number``, ``path``, counts of ``changed`` and
+        ``removed`` files, and ``tunes`` now in the shard.
+    """
+    setup_database(path)
+    manager = get_manager(path)
+    manifest = load_source_manifest(path)
+    files = sorted(files, key=lambda f: f[2])
+    changed = []
+    for book, file_name, file_path in files:
+        stat = os.stat(file_path)
+        if manifest.get(file_path) != (stat.st_mtime_ns, stat.st_size):
+            changed.append((book, file_name, file_path))
+    current = {f[2] for f in files}
+    removed = [p for p in manifest if p not in current]
+
+    for start in range(0, len(changed), INGEST_BATCH_FILES):
+        with manager.write_transaction() as conn:
+            for book, file_name, file_path in changed[start:start + INGEST_BATCH_FILES]:
+                ingest_abc_file(book, file_name, file_path, conn, replace=True)
+    if removed:
+        with manager.write_transaction() as conn:
+            for file_path in removed:
+                remove_abc_file(book_number, os.path.basename(file_path), file_path, conn)
+    if changed or removed:
+        manager.checkpoint("TRUNCATE")
+    return {
+        "book_number": book_number,
+        "path": path,
+        "changed": len(changed),
+        "removed": len(removed),
+        "tunes": load_aggregate_total(path),
+    }
+
+
+def ingest_shards(
+    root_dir: str | None = None,
+    shard_dir: str | None = None,
+    workers: int = SHARD_WORKERS,
+    books: Iterable[int] | None = None,
+    progress: Callable[[Dict], None] | None = None,
+) -> List[Dict]:
+    """Ingest the books under a root into their shards in parallel.
+
+    Each book is handled by :func:`ingest_book_shard` in a separate
+    process writing only its own database file, so books never wait
+    for each other's write locks. Shards of books that are no longer
+    in the tree are left alone.
+
+    Parameters
+    ----------
+    root_dir : str or None, optional
+        Directory holding the numbered book folders. If ``None``,
+        :data:`config.ABC_ROOT` is used.
+    shard_dir : str or None, optional
+        Folder for the shards. If ``None``, :data:`config.SHARD_DIR`
+        is used.
+    workers : int, optional
+        Number of ingest processes; ``1`` ingests in this process.
+    books : iterable of int or None, optional
+        Only ingest these books.
+    progress : callable or None, optional
+        Called with each book's summary as it finishes.
+
+    Returns
+    -------
+    list of dict
+        The summaries from :func:`ingest_book_shard`, in book order.
+    """
+    by_book: Dict[int | None, List[Tuple[int, str, str]]] = defaultdict(list)
+    for entry in iter_abc_files(root_dir):
+        by_book[entry[0]].append(entry)
+    if books is not None:
+        wanted = set(books)
+        by_book = {book: files for book, files in by_book.items() if book in wanted}
+    os.makedirs(SHARD_DIR if shard_dir is None else shard_dir, exist_ok=True)
+
+    jobs = [(book, files, shard_path(book, shard_dir)) for book, files in by_book.items()]
+    summaries = []
+    if workers <= 1 or len(jobs) <= 1:
+        for job in jobs:
+            summaries.append(ingest_book_shard(*job))
+            if progress is not None:
+                progress(summaries[-1])
+    else:
+        # Spawned, not forked, so no worker inherits an open connection
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs)), mp_context=context) as pool:
+            for future in as_completed([pool.submit(ingest_book_shard, *job) for job in jobs]):
+                summaries.append(future.result())
+                if progress is not None:
+                    progress(summaries[-1])
+    return sorted(summaries, key=lambda s: (s["book_number"] is None, s["book_number"] or 0))
+
+
+# Python equivalents of the ORDER_KEYS expressions, for merging rows
+# that each shard has already sorted. NOCASE folds ASCII letters only.
+_ASCII_LOWER = str.maketrans("ABCDEFGHIJKLMNOPQRSTUVWXYZ", "abcdefghijklmnopqrstuvwxyz")
+_MERGE_KEYS: Dict[str, Tuple[str, Callable]] = {
+    "title": ("title", lambda value: (value or "").translate(_ASCII_LOWER)),
+    "book": ("book_number", lambda value: -1 if value is None else value),
+    "key": ("key_signature", lambda value: value or ""),
+}
+
+
+class ShardedTunes:
+    """Read the per-book shards as one collection.
+
+    Parameters
+    ----------
+    shard_dir : str or None, optional
+        Folder holding the shards. If ``None``,
+        :data:`config.SHARD_DIR` is used.
+    max_workers : int, optional
+        Threads used to query shards concurrently; each keeps its own
+        read-only connection per shard.
+
+    Notes
+    -----
+    Tune ids are only unique within a shard, so rows and frames
+    returned here carry a ``shard`` column with the book number of
+    the shard they came from.
+    """
+
+    def __init__(self, shard_dir: str | None = None, max_workers: int = SHARD_WORKERS) -> None:
+        self.shard_dir = SHARD_DIR if shard_dir is None else shard_dir
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="shard")
+
+    @property
+    def shards(self) -> Dict[int | None, str]:
+        """Current shards by book number; see :func:`list_shards`."""
+        return list_shards(self.shard_dir)
+
+    def _fan_out(self, func: Callable, book_number: int | None = None) -> List[Tuple[int | None, object]]:
+        """Run ``func(path)`` on every shard, or on one book's shard."""
+        shards = self.shards
+        if book_number is not None:
+            shards = {book_number: shards[book_number]} if book_number in shards else {}
+        futures = [(book, self._pool.submit(func, path)) for book, path in shards.items()]
+        return [(book, future.result()) for book, future in futures]
+
+    def generations(self) -> Dict[int | None, int]:
+        """Return the ingest generation of each shard.
+
+        Together they identify the state of the collection, e.g. for
+        keying caches; a shard's generation only changes when that
+        book is re-ingested.
+        """
+        return dict(self._fan_out(lambda path: get_ingest_generation(get_manager(path).reader())))
+
+    def query_tunes(
+        self,
+        title: str | None = None,
+        book_number: int | None = None,
+        meter: str | None = None,
+        key_signature: str | None = None,
+        rhythm: str | None = None,
+        columns: Iterable[str] = LISTING_COLUMNS,
+        order_by: str | None = None,
+        limit: int | None = None,
+    ) -> Iterator[Dict]:
+        """Stream matching tunes from all shards.
+
+        Takes the same filters as :func:`db_utils.query_tunes`. A
+        ``book_number`` filter only queries that book's shard. With
+        ``order_by`` the per-shard results, each sorted by SQLite, are
+        merged lazily; otherwise shards are returned one after the
+        other in book order.
+
+        Yields
+        ------
+        dict
+            One dictionary per tune with the requested columns and
+            ``shard``.
+        """
+        if order_by is not None and order_by not in ORDER_KEYS:
+            raise ValueError(f"Unknown order key: {order_by!r}")
+        columns = tuple(columns)
+        sort_column = _MERGE_KEYS[order_by][0] if order_by is not None else None
+        wanted = columns + ((sort_column,) if sort_column and sort_column not in columns else ())
+        shards = self.shards
+        if book_number is not None:
+            shards = {book_number: shards[book_number]} if book_number in shards else {}
+
+        def stream(book: int | None, path: str) -> Iterator[Dict]:
+            rows = query_tunes(
+                title=title, book_number=book_number, meter=meter, key_signature=key_signature,
+                rhythm=rhythm, columns=wanted, order_by=order_by, limit=limit, db_path=path,
+            )
+            for row in rows:
+                row["shard"] = book
+                yield row
+
+        streams = [stream(book, path) for book, path in shards.items()]
+        if order_by is None:
+            merged: Iterator[Dict] = (row for rows in streams for row in rows)
+        else:
+            convert = _MERGE_KEYS[order_by][1]
+            merged = heapq.merge(*streams, key=lambda row: convert(row[sort_column]))
+        for row in islice(merged, limit):
+            if sort_column not in columns:
+                row.pop(sort_column, None)
+            yield row
+
+    def aggregate_crosstab(self, *dimensions: str) -> List[Tuple]:
+        """Return tune counts per combination of dimensions over all shards.
+
+        Same result as :func:`db_utils.load_aggregate_crosstab` would
+        give for a single database holding every book.
+        """
+        totals: Counter = Counter()
+        for _, rows in self._fan_out(lambda path: load_aggregate_crosstab(*dimensions, db_path=path)):
+            for row in rows:
+                totals[tuple(row[:-1])] += row[-1]
+        return [key + (n,) for key, n in totals.most_common()]
+
+    def aggregate_counts(self, dimension: str) -> List[Tuple]:
+        """Return ``(value, count)`` pairs over all shards, most common first."""
+        return self.aggregate_crosstab(dimension)
+
+    def aggregate_total(self) -> int:
+        """Return the number of tunes in all shards."""
+        return sum(total for _, total in self._fan_out(load_aggregate_total))
+
+    def value_counts(self, column: str) -> pd.Series:
+        """Federated :func:`tune_analysis.get_value_counts`."""
+        import pandas as pd
+
+        if column not in AGGREGATE_DIMENSIONS:
+            raise ValueError(f"Unknown aggregate dimension: {column!r}")
+        counts = [(value, n) for value, n in self.aggregate_counts(column) if value is not None]
+        return pd.Series(
+            [n for _, n in counts],
+            index=pd.Index([value for value, _ in counts], name=column),
+            name="count",
+            dtype="int64",
+        )
+
+    def collection_statistics(self) -> Dict:
+        """Federated :func:`tune_analysis.get_collection_statistics`."""
+        book_counts = self.value_counts("book_number")
+        return {
+            "total_tunes": self.aggregate_total(),
+            "number_of_books": len(book_counts),
+            "top_keys": self.value_counts("key_signature").head(5),
+            "top_meters": self.value_counts("meter").head(5),
+            "top_rhythms": self.value_counts("rhythm").head(5),
+        }
+
+    def load_tunes(self) -> pd.DataFrame:
+        """Return every tune of every shard as one DataFrame.
+
+        The frame has the columns of :func:`db_utils.load_tunes_from_database`
+        plus ``shard``, so the :mod:`tune_analysis` filters and
+        statistics can be applied to it directly.
+        """
+        import pandas as pd
+
+        def read(path: str) -> pd.DataFrame:
+            with get_manager(path).read_snapshot() as conn:
+                return pd.read_sql("SELECT * FROM tunes", conn)
+
+        frames = []
+        for book, frame in self._fan_out(read):
+            frames.append(frame.assign(shard=book))
+        if not frames:
+            return pd.DataFrame(columns=["id", "shard"])
+        df = pd.concat(frames, ignore_index=True)
+        df.attrs["shard_generations"] = self.generations()
+        return df
+
+    def close(self) -> None:
+        """Stop the query threads."""
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    """Ingest books into their shards from the command line."""
+    parser = argparse.ArgumentParser(description="Ingest ABC books into per-book databases.")
+    parser.add_argument("--root", help="directory holding the numbered book folders")
+    parser.add_argument("--shard-dir", help="folder for the shard databases")
+    parser.add_argument("--workers", type=int, default=SHARD_WORKERS, help="parallel ingest processes")
+    parser.add_argument("--book", type=int, action="append", dest="books", help="only this book (repeatable)")
+    args = parser.parse_args(argv)
+
+    def report(summary: Dict) -> None:
+        print(f"book {summary['book_number']}: {summary['changed']} files ingested, "
+              f"{summary['removed']} removed, {summary['tunes']} tunes in {summary['path']}")
+
+    summaries = ingest_shards(args.root, args.shard_dir, args.workers, args.books, report)
+    print(f"{sum(s['tunes'] for s in summaries)} tunes in {len(summaries)} shards")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,21 +3,25 @@
 This module contains a simple non-rich CLI interface that mirrors the
 behaviour of the original starter code but delegates work to the
 modular helper modules.
+
+Every menu action is answered by SQLite directly (filters through
+:func:`db_utils.query_tunes`, counts and statistics from the aggregate
+tables), so this interface never imports pandas and starts instantly.
 """
 
 from __future__ import annotations
 
 from typing import NoReturn
 
-from db_utils import load_tunes_from_database
-from tune_analysis import (
-    count_tunes_by_book,
-    get_tunes_by_book,
-    get_tunes_by_key,
-    get_tunes_by_meter,
-    search_tunes,
-    show_tune_statistics,
+from cli_output import format_records, output_stream, print_records, write_lines
+from db_utils import (
+    ORDER_KEYS,
+    iter_tunes,
+    load_aggregate_counts,
+    load_aggregate_total,
+    query_tunes,
 )
+import query_trace
 
 
 def show_menu() -> None:
@@ -42,12 +46,65 @@ def show_menu() -> None:
     print("-" * 50)
 
 
+def show_statistics() -> None:
+    """Print basic statistics about all tunes in the database.
+
+    Returns
+    -------
+    None
+        The function prints to standard output.
+    """
+    book_counts = [book for book, _ in load_aggregate_counts("book_number") if book is not None]
+    print(f"Total number of tunes: {load_aggregate_total()}")
+    print(f"Number of books: {len(book_counts)}")
+    for label, dimension in (
+        ("keys", "key_signature"),
+        ("meters", "meter"),
+        ("rhythms", "rhythm"),
+    ):
+        top = [(value, count) for value, count in load_aggregate_counts(dimension) if value is not None]
+        print(f"Most common {label}:")
+        for value, count in top[:5]:
+            print(f"  {value}: {count}")
+    if query_trace.enabled():
+        print("\nSQL statement latencies:")
+        print(query_trace.format_report())
+
+
+def show_all_tunes() -> None:
+    """List every tune in the database in sorted order.
+
+    The user picks the sort order. Tunes are streamed from the
+    database a batch at a time into the pager (or standard output),
+    so the listing starts immediately and never holds the whole
+    corpus in memory.
+
+    Returns
+    -------
+    None
+        The function prints to standard output.
+    """
+    order_by = input("Sort by title, book or key [title]: ").strip().lower() or "title"
+    if order_by not in ORDER_KEYS:
+        print("Please enter title, book or key!")
+        return
+
+    with output_stream() as stream:
+        stream.write(f"\nAll {load_aggregate_total()} tunes, sorted by {order_by}:\n")
+        write_lines(
+            format_records(
+                iter_tunes(order_by),
+                "  - '{title}' (Book {book_number}, Key: {key_signature})",
+            ),
+            stream,
+        )
+
+
 def run_user_interface() -> NoReturn:
     """Run the interactive command-line interface loop.
 
-    The function loads all tunes from the database into a
-    :class:`pandas.DataFrame` and then enters an input loop that
-    allows the user to query and inspect the tunes.
+    The function enters an input loop that allows the user to query
+    and inspect the tunes; each query runs against the database.
 
     Returns
     -------
@@ -55,9 +112,8 @@ def run_user_interface() -> NoReturn:
         This function only exits when the user chooses the "Exit"
         option.
     """
-    print("Loading data from database...")
-    df = load_tunes_from_database()
-    print(f"Loaded {len(df)} tunes from database!")
+    print("Connecting to database...")
+    print(f"Found {load_aggregate_total()} tunes in database!")
 
     while True:
         show_menu()
@@ -66,62 +122,64 @@ def run_user_interface() -> NoReturn:
         if choice == "1":
             search_term = input("Enter title to search for: ").strip()
             if search_term:
-                results = search_tunes(df, search_term)
-                print(f"\nFound {len(results)} tunes:")
-                for _, tune in results.iterrows():
-                    print(
-                        f"  - '{tune['title']}' (Book {tune['book_number']}, Key: {tune['key_signature']})"
-                    )
+                results = list(query_tunes(title=search_term))
+                print_records(
+                    results,
+                    "  - '{title}' (Book {book_number}, Key: {key_signature})",
+                    header=f"\nFound {len(results)} tunes:",
+                )
             else:
                 print("Please enter a search term!")
 
         elif choice == "2":
             try:
                 book_num = int(input("Enter book number: "))
-                results = get_tunes_by_book(df, book_num)
-                print(f"\nFound {len(results)} tunes in book {book_num}:")
-                for _, tune in results.iterrows():
-                    print(
-                        f"  - '{tune['title']}' (Key: {tune['key_signature']}, Meter: {tune['meter']})"
-                    )
+                results = list(query_tunes(book_number=book_num))
+                print_records(
+                    results,
+                    "  - '{title}' (Key: {key_signature}, Meter: {meter})",
+                    header=f"\nFound {len(results)} tunes in book {book_num}:",
+                )
             except ValueError:
                 print("Please enter a valid number!")
 
         elif choice == "3":
-            counts = count_tunes_by_book(df)
+            counts = sorted(
+                (book, count) for book, count in load_aggregate_counts("book_number") if book is not None
+            )
             print("\nTune counts by book:")
-            for book_num, count in counts.items():
+            for book_num, count in counts:
                 print(f"  Book {book_num}: {count} tunes")
 
         elif choice == "4":
             meter = input("Enter meter to search for (e.g., 4/4, 3/4): ").strip()
             if meter:
-                results = get_tunes_by_meter(df, meter)
-                print(f"\nFound {len(results)} tunes in {meter} meter:")
-                for _, tune in results.iterrows():
-                    print(f"  - '{tune['title']}' (Book {tune['book_number']})")
+                results = list(query_tunes(meter=meter))
+                print_records(
+                    results,
+                    "  - '{title}' (Book {book_number})",
+                    header=f"\nFound {len(results)} tunes in {meter} meter:",
+                )
             else:
                 print("Please enter a meter!")
 
         elif choice == "5":
             key_sig = input("Enter key to search for (e.g., C, G, Dm): ").strip()
             if key_sig:
-                results = get_tunes_by_key(df, key_sig)
-                print(f"\nFound {len(results)} tunes in key of {key_sig}:")
-                for _, tune in results.iterrows():
-                    print(f"  - '{tune['title']}' (Book {tune['book_number']})")
+                results = list(query_tunes(key_signature=key_sig))
+                print_records(
+                    results,
+                    "  - '{title}' (Book {book_number})",
+                    header=f"\nFound {len(results)} tunes in key of {key_sig}:",
+                )
             else:
                 print("Please enter a key!")
 
         elif choice == "6":
-            show_tune_statistics(df)
+            show_statistics()
 
         elif choice == "7":
-            print(f"\nAll {len(df)} tunes:")
-            for _, tune in df.iterrows():
-                print(
-                    f"  - '{tune['title']}' (Book {tune['book_number']}, Key: {tune['key_signature']})"
-                )
+            show_all_tunes()
 
         elif choice == "8":
             print("Goodbye!")
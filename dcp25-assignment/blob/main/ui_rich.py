@@ -5,27 +5,52 @@ This module provides an interactive UI using the :mod:`rich` library.
 
 from __future__ import annotations
 
-from typing import NoReturn
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, NoReturn, Tuple
+import os
+import re
+import sys
+import threading
+import time
 
 import pandas as pd
-from rich.console import Console
+from rich.console import Console, Group
+from rich.live import Live
+from rich.markup import escape
 from rich.panel import Panel
 from rich.prompt import Prompt, IntPrompt
 from rich.table import Table
-from rich.progress import Progress, SpinnerColumn, BarColumn, TextColumn, TimeElapsedColumn
-from rich.layout import Layout
 from rich.text import Text
 from rich import box
 
-from db_utils import load_tunes_from_database, setup_database, save_tune_to_database
-from abc_parser import find_abc_files, parse_abc_file
+from config import LIVE_SEARCH_DEBOUNCE_MS
+from db_connection import get_manager
+from db_utils import (
+    ORDER_KEYS,
+    get_ingest_generation,
+    ingest_abc_tree,
+    list_tunes,
+    load_aggregate_total,
+    load_ingest_checkpoint,
+    load_tunes_from_database,
+    rebuild_tune_cube,
+    setup_database,
+)
+import metrics
+import query_trace
 from tune_analysis import (
-    count_tunes_by_book,
+    get_book_counts,
+    get_collection_statistics,
+    get_query_cache_stats,
+    get_value_counts,
     get_tunes_by_book,
     get_tunes_by_key,
     get_tunes_by_meter,
     search_tunes,
     show_tune_statistics,
+    SearchCancelled,
+    get_title_search_index,
 )
 
 
@@ -61,30 +86,30 @@ def _create_bar_chart(data: pd.Series, max_width: int = 30) -> str:
     return "\n".join(lines)
 
 
-def _show_fancy_statistics(df: pd.DataFrame) -> None:
+def _show_fancy_statistics() -> None:
     """Display fancy statistics with Rich panels and visual elements.
-    
-    Parameters
-    ----------
-    df : pandas.DataFrame
-        DataFrame containing all tunes.
+
+    All figures come from the aggregate tables maintained during
+    ingest, so the screen costs the same regardless of corpus size.
     
     Returns
     -------
     None
         Displays statistics to the console.
     """
+    stats = get_collection_statistics()
+
     # Main statistics panel
     stats_text = Text()
     stats_text.append("📊 Total Tunes: ", style="bold cyan")
-    stats_text.append(f"{len(df):,}\n", style="bold yellow")
+    stats_text.append(f"{stats['total_tunes']:,}\n", style="bold yellow")
     stats_text.append("📚 Number of Books: ", style="bold cyan")
-    stats_text.append(f"{df['book_number'].nunique()}\n", style="bold yellow")
+    stats_text.append(f"{stats['number_of_books']}\n", style="bold yellow")
     
     console.print(Panel(stats_text, title="[bold magenta]Overview[/bold magenta]", border_style="magenta"))
     
     # Top 10 Keys with bar chart
-    top_keys = df['key_signature'].value_counts().head(10)
+    top_keys = get_value_counts('key_signature').head(10)
     keys_chart = _create_bar_chart(top_keys, max_width=40)
     
     console.print(Panel(
@@ -95,7 +120,7 @@ def _show_fancy_statistics(df: pd.DataFrame) -> None:
     ))
     
     # Top 10 Meters with bar chart
-    top_meters = df['meter'].value_counts().head(10)
+    top_meters = get_value_counts('meter').head(10)
     meters_chart = _create_bar_chart(top_meters, max_width=40)
     
     console.print(Panel(
@@ -104,15 +129,26 @@ def _show_fancy_statistics(df: pd.DataFrame) -> None:
         border_style="blue",
         box=box.ROUNDED
     ))
+
+    # Top 10 Rhythms with bar chart
+    top_rhythms = get_value_counts('rhythm').head(10)
+    rhythms_chart = _create_bar_chart(top_rhythms, max_width=40)
+
+    console.print(Panel(
+        f"[green]{rhythms_chart}[/green]",
+        title="[bold yellow]💃 Top 10 Most Common Rhythms[/bold yellow]",
+        border_style="yellow",
+        box=box.ROUNDED
+    ))
     
     # Tunes per book table
-    book_counts = count_tunes_by_book(df)
+    book_counts = get_book_counts()
     book_table = Table(title="📖 Tunes per Book", box=box.DOUBLE_EDGE, show_header=True, header_style="bold magenta")
     book_table.add_column("Book", justify="center", style="cyan")
     book_table.add_column("Count", justify="center", style="green")
     book_table.add_column("Percentage", justify="center", style="yellow")
     
-    total = len(df)
+    total = stats['total_tunes']
     for book_num, count in book_counts.items():
         percentage = (count / total * 100) if total > 0 else 0
         book_table.add_row(
@@ -123,21 +159,136 @@ def _show_fancy_statistics(df: pd.DataFrame) -> None:
     
     console.print(book_table)
 
+    # Query cache counters, useful when tuning QUERY_CACHE_MAX_BYTES
+    cache = get_query_cache_stats()
+    lookups = cache["hits"] + cache["misses"]
+    hit_rate = (cache["hits"] / lookups * 100) if lookups > 0 else 0
+    console.print(Panel(
+        f"[cyan]Hits:[/cyan] {cache['hits']:,}  [cyan]Misses:[/cyan] {cache['misses']:,}  "
+        f"[cyan]Hit rate:[/cyan] {hit_rate:.1f}%\n"
+        f"[cyan]Entries:[/cyan] {cache['entries']:,}  [cyan]Evictions:[/cyan] {cache['evictions']:,}  "
+        f"[cyan]Memory:[/cyan] {cache['bytes'] / 1024:,.0f} / {cache['max_bytes'] / 1024:,.0f} KiB",
+        title="[bold cyan]⚡ Query Cache[/bold cyan]",
+        border_style="cyan",
+        box=box.ROUNDED
+    ))
+    if query_trace.enabled():
+        console.print(_query_trace_panel(query_trace.report()))
+
 
-def _render_tunes_table(df: pd.DataFrame, title: str) -> None:
-    """Render a DataFrame of tunes as a Rich table.
+def _query_trace_panel(statements: List[Dict], limit: int = 10) -> Panel:
+    """Build the SQL latency table shown on the statistics screen.
 
     Parameters
     ----------
-    df : pandas.DataFrame
-        DataFrame with tune data.
-    title : str
-        Title to display above the table.
+    statements : list of dict
+        Result of :func:`query_trace.report`.
+    limit : int, optional
+        Statements shown, slowest in total first.
+
+    Returns
+    -------
+    rich.panel.Panel
+        A table of statements with their latencies and histograms.
     """
-    if df.empty:
-        console.print(Panel.fit("[bold yellow]❌ No tunes found.[/bold yellow]", title=title, border_style="yellow"))
-        return
+    table = Table(box=box.SIMPLE_HEAVY, header_style="bold cyan", padding=(0, 1), pad_edge=False)
+    table.add_column("Statement", overflow="fold", ratio=1)
+    for heading in ("Calls", "Total ms", "p50 ms", "p95 ms", "Max ms"):
+        table.add_column(heading, justify="right", no_wrap=True)
+    for row in statements[:limit]:
+        table.add_row(
+            Text.assemble(row["sql"], "\n", (query_trace.format_histogram(row["buckets"]), "dim")),
+            f"{row['calls']:,}",
+            f"{row['total_ms']:.1f}",
+            f"{row['p50_ms']:.2f}",
+            f"{row['p95_ms']:.2f}",
+            f"{row['max_ms']:.1f}",
+        )
+    slow = query_trace.recent_slow()
+    footer = Text(f"{len(slow)} recent slow statements logged" if slow else "No slow statements", style="yellow")
+    return Panel(Group(table, footer), title="[bold cyan]🐢 SQL Statements[/bold cyan]", border_style="cyan")
+
+
+# A window source returns the rows in [start, start + size) of a result
+WindowSource = Callable[[int, int], List[Dict]]
+
+_TABLE_COLUMNS = ("id", "title", "book_number", "key_signature", "meter")
+
+
+def _read_key() -> str:
+    """Read a single keypress from the terminal.
+
+    When standard input is not a terminal (e.g. piped input) a whole
+    line is read instead and its first character returned.
+
+    Returns
+    -------
+    str
+        The lower-cased key, ``"\\n"`` for Enter or ``"q"`` at end of
+        input.
+    """
+    if not sys.stdin.isatty():
+        line = sys.stdin.readline()
+        return line[:1].lower() if line else "q"
+    if os.name == "nt":
+        import msvcrt
+
+        return msvcrt.getwch().lower()
+
+    import termios
+    import tty
+
+    fd = sys.stdin.fileno()
+    old_settings = termios.tcgetattr(fd)
+    try:
+        tty.setcbreak(fd)
+        key = sys.stdin.read(1)
+    finally:
+        termios.tcsetattr(fd, termios.TCSADRAIN, old_settings)
+    return key.lower()
+
+
+def _window_size() -> int:
+    """Return how many table rows fit on the terminal at once."""
+    # Each row takes two lines with show_lines=True; leave room for the
+    # title, header and key hints.
+    return max(5, (console.size.height - 8) // 2)
+
+
+def _frame_windows(df: pd.DataFrame) -> WindowSource:
+    """Return a window source that slices rows out of a DataFrame."""
+    columns = [column for column in _TABLE_COLUMNS if column in df.columns]
+
+    def fetch(start: int, size: int) -> List[Dict]:
+        window = df.iloc[start:start + size][columns]
+        return [dict(zip(columns, row)) for row in window.itertuples(index=False, name=None)]
+
+    return fetch
 
+
+def _listing_windows(order_by: str) -> WindowSource:
+    """Return a window source over every tune, sorted by ``order_by``.
+
+    The keyset cursor at the end of each fetched window is remembered,
+    so moving to the next or previous window is one indexed page read
+    from :func:`db_utils.list_tunes`.
+    """
+    cursors: Dict[int, Tuple] = {}
+
+    def fetch(start: int, size: int) -> List[Dict]:
+        if start == 0 or start in cursors:
+            tunes, cursor = list_tunes(order_by, size, after=cursors.get(start))
+        else:
+            tunes, cursor = list_tunes(order_by, size, offset=start)
+        if cursor is not None:
+            cursors[start + size] = cursor
+        return tunes
+
+    return fetch
+
+
+def _tunes_table(rows: List[Dict], title: str) -> Table:
+    """Build a Rich table for one window of tune rows."""
     table = Table(
         title=f"🎵 {title}",
         show_lines=True,
@@ -151,7 +302,7 @@ def _render_tunes_table(df: pd.DataFrame, title: str) -> None:
     table.add_column("Key", style="yellow", width=8)
     table.add_column("Meter", style="magenta", width=8)
 
-    for _, tune in df.iterrows():
+    for tune in rows:
         table.add_row(
             str(tune.get("id", "")),
             str(tune.get("title", "")),
@@ -159,8 +310,240 @@ def _render_tunes_table(df: pd.DataFrame, title: str) -> None:
             str(tune.get("key_signature", "")),
             str(tune.get("meter", "")),
         )
+    return table
 
-    console.print(table)
+
+def _browse_tunes(fetch: WindowSource, total: int, title: str) -> None:
+    """Show a result one terminal-sized window at a time.
+
+    Only the visible window is fetched and rendered, so the time and
+    memory spent per screen do not depend on ``total``. The user moves
+    between windows with single keypresses.
+
+    Parameters
+    ----------
+    fetch : callable
+        Window source returning the rows in ``[start, start + size)``.
+    total : int
+        Total number of rows in the result.
+    title : str
+        Title to display above the table.
+    """
+    if total == 0:
+        console.print(Panel.fit("[bold yellow]❌ No tunes found.[/bold yellow]", title=title, border_style="yellow"))
+        return
+
+    size = _window_size()
+    start = 0
+    while True:
+        rows = fetch(start, size)
+        end = start + len(rows)
+        console.print(_tunes_table(rows, f"{title} ({start + 1:,}-{end:,} of {total:,})"))
+        if total <= size:
+            return
+
+        console.print("[dim]\\[n]ext  \\[p]revious  \\[q]uit[/dim]")
+        while True:
+            key = _read_key()
+            if key in ("n", " ", "\n", "\r") and end < total:
+                start += size
+                break
+            if key == "p" and start > 0:
+                start -= size
+                break
+            if key in ("q", "\x1b") or (key in ("\n", "\r") and end >= total):
+                return
+        if console.is_terminal:
+            console.clear()
+
+
+def _render_tunes_table(df: pd.DataFrame, title: str) -> None:
+    """Render a DataFrame of tunes as a windowed Rich table.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        DataFrame with tune data.
+    title : str
+        Title to display above the table.
+    """
+    _browse_tunes(_frame_windows(df), len(df), title)
+
+
+def _show_all_tunes() -> None:
+    """Browse every tune in the database in sorted order.
+
+    Windows are fetched with keyset cursors from
+    :func:`db_utils.list_tunes`, so only the visible rows are ever
+    read and rendered.
+    """
+    order_by = Prompt.ask("Sort by", choices=list(ORDER_KEYS), default="title")
+    _browse_tunes(_listing_windows(order_by), load_aggregate_total(), f"All tunes by {order_by}")
+
+
+_ESCAPE_SEQUENCE = re.compile(r"\x1b\[[0-9;]*[A-Za-z~]")
+
+
+class _KeyReader:
+    """Read keystrokes without waiting for Enter, with a timeout.
+
+    Use as a context manager: the terminal is put into cbreak mode on
+    entry (POSIX) and restored on exit. On Windows :mod:`msvcrt` is
+    polled instead.
+    """
+
+    def __enter__(self) -> "_KeyReader":
+        if os.name != "nt":
+            import termios
+            import tty
+
+            self._fd = sys.stdin.fileno()
+            self._old_settings = termios.tcgetattr(self._fd)
+            tty.setcbreak(self._fd)
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        if os.name != "nt":
+            import termios
+
+            termios.tcsetattr(self._fd, termios.TCSADRAIN, self._old_settings)
+
+    def read(self, timeout: float) -> str:
+        """Return the keys typed within ``timeout`` seconds (maybe ``""``)."""
+        if os.name == "nt":
+            import msvcrt
+
+            deadline = time.monotonic() + timeout
+            keys = ""
+            while True:
+                while msvcrt.kbhit():
+                    keys += msvcrt.getwch()
+                if keys or time.monotonic() >= deadline:
+                    return keys
+                time.sleep(0.005)
+
+        import select
+
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if not ready:
+            return ""
+        return os.read(self._fd, 1024).decode(errors="ignore")
+
+
+def _live_search(df: pd.DataFrame) -> None:
+    """Search titles interactively, refining the results on each keystroke.
+
+    Each query runs on a background thread once typing has paused for
+    :data:`config.LIVE_SEARCH_DEBOUNCE_MS`; a newer query cancels the
+    one still running. When the query extends one that has already
+    completed, only that query's matches are re-checked, and recent
+    results are kept so deleting characters is instant. Enter opens
+    the current results in the table browser; Esc leaves.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        DataFrame containing all tunes.
+    """
+    if not sys.stdin.isatty():
+        # No raw keystrokes available (e.g. piped input): plain search
+        search_term = Prompt.ask("Enter title to search for").strip()
+        if search_term:
+            _render_tunes_table(search_tunes(df, search_term), f"Search results for '{search_term}'")
+        return
+
+    index = get_title_search_index(df)
+    size = max(3, _window_size() - 3)
+    debounce = LIVE_SEARCH_DEBOUNCE_MS / 1000
+
+    everything = range(len(index))
+    history: "OrderedDict[str, List[int]]" = OrderedDict()
+    query = ""
+    shown = ""
+    typed_at = 0.0
+    running: Tuple[str, Future, threading.Event] | None = None
+    elapsed_ms = 0.0
+
+    def run_search(term: str, candidates, cancel: threading.Event) -> Tuple[List[int], float]:
+        started = time.perf_counter()
+        return index.search(term, candidates, cancel), (time.perf_counter() - started) * 1000
+
+    def view() -> Group:
+        matches = history.get(shown, []) if shown else everything
+        rows = _frame_windows(df.iloc[matches[:size]])(0, size)
+        status = f"{len(matches):,} matches"
+        if shown:
+            status += f" for '{escape(shown)}' in {elapsed_ms:.0f} ms"
+        if running is not None:
+            status += " [dim](searching...)[/dim]"
+        return Group(
+            Text.assemble(("Search: ", "bold cyan"), (query, "bold"), ("▌", "blink")),
+            f"[dim]{status} — Enter to browse, Esc to leave[/dim]",
+            _tunes_table(rows, "Live search"),
+        )
+
+    selected: List[int] | None = None
+    with ThreadPoolExecutor(max_workers=1) as executor, _KeyReader() as keys, Live(
+        view(), console=console, auto_refresh=False, transient=True
+    ) as live:
+        while selected is None:
+            # Arrow and function keys arrive as escape sequences; ignore them
+            typed = _ESCAPE_SEQUENCE.sub("", keys.read(0.01))
+            changed = False
+            for key in typed:
+                if key in ("\n", "\r"):
+                    selected = list(history.get(shown, []) if shown else everything)
+                    break
+                if key == "\x1b":
+                    if running is not None:
+                        running[2].set()
+                    return
+                if key in ("\x7f", "\x08"):
+                    query = query[:-1]
+                elif key == "\x15":  # Ctrl-U clears the query
+                    query = ""
+                elif key.isprintable():
+                    query += key
+                changed = True
+            if changed:
+                typed_at = time.monotonic()
+
+            # Collect a finished search, ignoring it if it is stale
+            if running is not None and running[1].done():
+                term, future, _ = running
+                running = None
+                try:
+                    history[term], elapsed_ms = future.result()
+                    history.move_to_end(term)
+                    while len(history) > 32:
+                        history.popitem(last=False)
+                    shown = term
+                except SearchCancelled:
+                    pass
+                changed = True
+
+            if (not query or query in history) and shown != query:
+                shown = query
+                elapsed_ms = 0.0
+                changed = True
+            elif query and query not in history and time.monotonic() - typed_at >= debounce:
+                if running is None or running[0] != query:
+                    if running is not None:
+                        running[2].set()
+                    # Reuse the longest known result this query extends
+                    base = max((t for t in history if query.startswith(t)), key=len, default=None)
+                    candidates = history[base] if base is not None else None
+                    cancel = threading.Event()
+                    running = (query, executor.submit(run_search, query, candidates, cancel), cancel)
+                    changed = True
+
+            if changed and selected is None:
+                live.update(view(), refresh=True)
+
+        if running is not None:
+            running[2].set()
+
+    _render_tunes_table(df.iloc[selected], f"Search results for '{escape(shown)}'")
 
 
 def run_rich_loader() -> int:
@@ -171,14 +554,14 @@ def run_rich_loader() -> int:
     int
         Number of tunes loaded into the database.
     """
+    from rich.progress import BarColumn, Progress, SpinnerColumn, TextColumn, TimeElapsedColumn
+
     console.print(Panel.fit("[bold cyan]Loading ABC data into database...[/bold cyan]"))
     
     # Setup database schema first
     setup_database()
     
-    # Find all ABC files to process
-    all_files = find_abc_files()
-    total_tunes = 0
+    total_sources = 0
     
     with Progress(
         SpinnerColumn(),
@@ -193,29 +576,37 @@ def run_rich_loader() -> int:
         
         main_task = progress.add_task(
             "[cyan]Processing ABC files...",
-            total=len(all_files),
+            total=None,
             info="Starting..."
         )
+
+        def report(done: int, total: int, description: str) -> None:
+            nonlocal total_sources
+            total_sources = total
+            progress.update(main_task, total=total, completed=done, info=description)
+
+        # Files are committed in batches with a checkpoint, so a load
+        # that was interrupted resumes where it stopped
+        checkpoint = load_ingest_checkpoint()
+        if checkpoint is not None and not checkpoint["completed"]:
+            progress.update(main_task, info=f"Resuming after {checkpoint['files_done']} files...")
+        total_tunes = ingest_abc_tree(progress=report)["tunes_total"]
         
-        for book_number, file_name, file_path in all_files:
-            # Update progress with current file
-            progress.update(
-                main_task,
-                info=f"Book {book_number}: {file_name}"
-            )
-            
-            # Parse and save tunes
-            tunes = parse_abc_file(file_path, book_number, file_name)
-            for tune in tunes:
-                save_tune_to_database(tune)
-            
-            total_tunes += len(tunes)
-            progress.advance(main_task)
-        
+        # Fold the write-ahead log back into the database file
+        with metrics.timer("wal_checkpoint"):
+            get_manager().checkpoint("TRUNCATE")
+        progress.update(main_task, info="Building statistics cube...")
+        with metrics.timer("cube"):
+            rebuild_tune_cube()
+        if not get_manager().in_memory:
+            progress.update(main_task, info="Writing DataFrame snapshot...")
+            with metrics.timer("snapshot"):
+                load_tunes_from_database(use_snapshot=False)
+
         # Final update
         progress.update(
             main_task,
-            info=f"✓ Loaded {total_tunes} tunes from {len(all_files)} files"
+            info=f"✓ Loaded {total_tunes} tunes from {total_sources} sources"
         )
     
     console.print(
@@ -224,9 +615,111 @@ def run_rich_loader() -> int:
             border_style="green",
         )
     )
+    if metrics.enabled():
+        console.print(_metrics_panel(metrics.report()))
     return total_tunes
 
 
+def _metrics_panel(summary: Dict) -> Panel:
+    """Build the per-stage timing summary shown after a load.
+
+    Parameters
+    ----------
+    summary : dict
+        Result of :func:`metrics.report`.
+
+    Returns
+    -------
+    rich.panel.Panel
+        A table of stages with their timings and throughput, and the
+        overall ingest rates underneath.
+    """
+    table = Table(box=box.SIMPLE_HEAVY, header_style="bold cyan", padding=(0, 1), pad_edge=False)
+    table.add_column("Stage", style="bold", no_wrap=True, min_width=14)
+    for heading in ("Calls", "Total ms", "p50 ms", "p95 ms", "p99 ms", "Items/s", "MB/s"):
+        table.add_column(heading, justify="right")
+    for name, stage in summary["stages"].items():
+        table.add_row(
+            name,
+            str(stage["calls"]),
+            f"{stage['total_s'] * 1000:.1f}",
+            f"{stage['p50_s'] * 1000:.2f}",
+            f"{stage['p95_s'] * 1000:.2f}",
+            f"{stage['p99_s'] * 1000:.2f}",
+            f"{stage['items_per_s']:.0f}" if stage["items"] else "-",
+            f"{stage['mb_per_s']:.2f}" if stage["bytes"] else "-",
+        )
+    rates = metrics.throughput(summary)
+    footer = Text(
+        f"{rates['files_per_s']:.1f} files/s  •  {rates['tunes_per_s']:.0f} tunes/s  •  "
+        f"{rates['mb_per_s']:.2f} MB/s",
+        style="bold green",
+    )
+    return Panel(Group(table, footer), title="⏱ Ingest metrics", border_style="cyan", expand=False)
+
+
+def _export_tunes() -> None:
+    """Ask for filters and export the matching tunes with a progress bar."""
+    from rich.progress import BarColumn, MofNCompleteColumn, Progress, SpinnerColumn, TextColumn, TimeElapsedColumn
+    from tune_export import EXPORT_FORMATS, export_tunes
+    from config import EXPORT_DIR
+
+    console.print("[dim]Leave a filter empty to match any value.[/dim]")
+    title = Prompt.ask("Title contains", default="").strip() or None
+    book = Prompt.ask("Book number", default="").strip()
+    if book and not book.isdigit():
+        console.print("[red]Please enter a valid number![/red]")
+        return
+    meter = Prompt.ask("Meter (e.g., 6/8)", default="").strip() or None
+    key_sig = Prompt.ask("Key (e.g., G, Dmix)", default="").strip() or None
+    rhythm = Prompt.ask("Rhythm (e.g., reel, jig)", default="").strip() or None
+    fmt = Prompt.ask("Format", choices=["both", *EXPORT_FORMATS], default="both")
+    out_dir = Prompt.ask("Output folder", default=EXPORT_DIR).strip()
+
+    with Progress(
+        SpinnerColumn(),
+        TextColumn("[bold blue]{task.description}"),
+        BarColumn(),
+        MofNCompleteColumn(),
+        TextColumn("•"),
+        TextColumn("[cyan]{task.fields[info]}"),
+        TimeElapsedColumn(),
+        console=console,
+    ) as progress:
+        task = progress.add_task("[cyan]Exporting tunes...", total=None, info="Starting...")
+
+        def report(done: int, total: int, description: str) -> None:
+            progress.update(task, total=total, completed=done, info=description)
+
+        summary = export_tunes(
+            out_dir=out_dir,
+            formats=tuple(EXPORT_FORMATS) if fmt == "both" else (fmt,),
+            title=title,
+            book_number=int(book) if book else None,
+            meter=meter,
+            key_signature=key_sig,
+            rhythm=rhythm,
+            progress=report,
+        )
+
+    if not summary["tunes"]:
+        console.print("[yellow]No tunes match these filters.[/yellow]")
+        return
+    console.print(
+        Panel.fit(
+            f"[bold green]✓ Exported {summary['tunes']:,} tunes: {summary['files']:,} files, "
+            f"{summary['bytes'] / 1e6:.1f} MB in {summary['seconds']:.1f}s[/bold green]\n"
+            f"[dim]{escape(summary['out_dir'])}[/dim]",
+            border_style="green",
+        )
+    )
+    for failure in summary["failed"][:10]:
+        console.print(
+            f"[red]Could not export tune {failure['id']} ({escape(failure['title'] or '')}): "
+            f"{escape(failure['error'])}[/red]"
+        )
+
+
 def run_rich_ui() -> NoReturn:
     """Run the Rich-based interactive user interface loop.
 
@@ -245,6 +738,11 @@ def run_rich_ui() -> NoReturn:
     )
 
     while True:
+        # Pick up tunes re-ingested meanwhile, e.g. by abc_watcher.py
+        if get_ingest_generation() != df.attrs.get("ingest_generation"):
+            df = load_tunes_from_database()
+            console.print(f"[dim]Reloaded {len(df)} tunes after changes to the ABC files.[/dim]")
+
         console.print(
             Panel(
                 """[bold]ABC TUNE DATABASE EXPLORER[/bold]\n\n
@@ -255,13 +753,15 @@ def run_rich_ui() -> NoReturn:
 [5] Show tunes by key\n
 [6] Show tune statistics\n
 [7] View all tunes\n
-[8] Exit""",
+[8] Live search (search as you type)\n
+[9] Export tunes to ABC/MIDI files\n
+[10] Exit""",
                 title="Main Menu",
                 border_style="cyan",
             )
         )
 
-        choice = Prompt.ask("[bold]Please enter your choice (1-8)[/bold]")
+        choice = Prompt.ask("[bold]Please enter your choice (1-10)[/bold]")
 
         if choice == "1":
             search_term = Prompt.ask("Enter title to search for").strip()
@@ -280,7 +780,7 @@ def run_rich_ui() -> NoReturn:
                 console.print("[red]Please enter a valid number![/red]")
 
         elif choice == "3":
-            counts = count_tunes_by_book(df)
+            counts = get_book_counts()
             table = Table(
                 title="📚 Tune Counts by Book",
                 show_lines=True,
@@ -316,16 +816,22 @@ def run_rich_ui() -> NoReturn:
                 console.print("[yellow]Please enter a key![/yellow]")
 
         elif choice == "6":
-            _show_fancy_statistics(df)
+            _show_fancy_statistics()
 
         elif choice == "7":
-            _render_tunes_table(df, "All tunes")
+            _show_all_tunes()
 
         elif choice == "8":
+            _live_search(df)
+
+        elif choice == "9":
+            _export_tunes()
+
+        elif choice == "10":
             console.print("[bold magenta]Goodbye![/bold magenta]")
             raise SystemExit
 
         else:
-            console.print("[red]Invalid choice! Please enter 1-8.[/red]")
+            console.print("[red]Invalid choice! Please enter 1-10.[/red]")
 
         Prompt.ask("\n[dim]Press Enter to continue[/dim]", default="")